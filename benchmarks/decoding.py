@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""Compares decoding CPX details responses with each json backend against the previous text based version.
+
+Usage: python -m benchmarks.decoding [number of responses]
+"""
+
+import sys
+from json import dumps, loads
+from time import perf_counter
+from typing import Callable, List, Tuple
+
+from src.decoding import Decoder, available_backends
+from src.server_data import ServerData
+
+SERVICES = ["AuthService", "GeoService", "IdService", "MLService", "RoleService"]
+
+
+def legacy_server(ip: str, body: bytes) -> ServerData:
+    """Decoding as it was before, minus the charset detection of aiohttp."""
+    return ServerData(ip, loads(body.decode("utf-8")))
+
+
+def responses(count: int) -> List[Tuple[str, bytes]]:
+    """Ips and bodies of details responses, as sent by CPX."""
+    return [
+        (
+            f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}",
+            dumps(
+                {
+                    "cpu": "%d%%" % (i % 101),
+                    "memory": "%d%%" % (i * 7 % 101),
+                    "service": SERVICES[i % len(SERVICES)],
+                }
+            ).encode("utf-8"),
+        )
+        for i in range(count)
+    ]
+
+
+def run(name: str, decode: Callable[[str, bytes], ServerData], count: int) -> None:
+    bodies = responses(count)
+    start = perf_counter()
+    for ip, body in bodies:
+        decode(ip, body)
+    done = perf_counter()
+    print(f"{name:<8} {(done - start) * 1e9 / count:>6.0f} ns/response")
+
+
+def main(count: int) -> None:
+    print(f"{count} responses")
+    run("legacy", legacy_server, count)
+    for backend in available_backends():
+        run(backend, Decoder(backend).server, count)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
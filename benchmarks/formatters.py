@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""Compares rendering full report rows with compiled formatters against the previous asdict based version.
+
+Usage: python -m benchmarks.formatters [number of servers]
+"""
+
+import csv
+import sys
+from dataclasses import asdict
+from io import StringIO
+from json import dumps
+from time import perf_counter
+from typing import Callable, List
+
+from src.formatters import compile_formatter
+from src.result_lines import FullResultLine
+from src.results_compiler import ResultsCompiler
+from src.server_data import ServerData
+
+SERVICES = ["AuthService", "GeoService", "IdService", "MLService", "RoleService"]
+
+
+def legacy_values(line: FullResultLine) -> dict:
+    values = {**asdict(line), "status": line.status}
+    values.update(**asdict(line.service_summary))
+    return values
+
+
+def legacy_csv_line(line: FullResultLine) -> str:
+    """FullResultLine.csv_line as it was before formatters were compiled."""
+    values = legacy_values(line)
+    output = StringIO()
+    spamwriter = csv.writer(output, delimiter=",", quotechar='"', quoting=csv.QUOTE_ALL)
+    spamwriter.writerow([str(values[c]) for c in line.columns])
+    return output.getvalue().replace("\n", "")
+
+
+def legacy_json_line(line: FullResultLine) -> str:
+    """FullResultLine.json_line as it was before formatters were compiled."""
+    values = legacy_values(line)
+    return dumps({c: str(values[c]) for c in line.columns})
+
+
+def legacy_table_line(line: FullResultLine, width: int) -> str:
+    """FullResultLine.table_line as it was before formatters were compiled."""
+    values = legacy_values(line)
+    formats = line.columns_formats(width)
+    text = ""
+    for c in line.columns:
+        text += formats[c][2](values[c]).ljust(formats[c][1])
+    return text
+
+
+def full_lines(count: int) -> List[FullResultLine]:
+    servers = [
+        ServerData(
+            f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}",
+            {
+                "cpu": "%d%%" % (i % 101),
+                "memory": "%d%%" % (i * 7 % 101),
+                "service": SERVICES[i % len(SERVICES)],
+            },
+        )
+        for i in range(count)
+    ]
+    return ResultsCompiler.full(servers, "complete")
+
+
+def run(name: str, render: Callable[[FullResultLine], str], lines: List) -> None:
+    start = perf_counter()
+    for line in lines:
+        render(line)
+    done = perf_counter()
+    print(f"{name:<16} {(done - start) * 1e9 / len(lines):>8.0f} ns/row")
+
+
+def main(count: int) -> None:
+    lines = full_lines(count)
+    width = max(len(s) for s in SERVICES)
+    print(f"{count} servers")
+    run("legacy csv", legacy_csv_line, lines)
+    run("compiled csv", compile_formatter(FullResultLine, "complete", "csv"), lines)
+    run("legacy json", legacy_json_line, lines)
+    run("compiled json", compile_formatter(FullResultLine, "complete", "json"), lines)
+    run("legacy table", lambda line: legacy_table_line(line, width), lines)
+    run(
+        "compiled table",
+        compile_formatter(FullResultLine, "complete", "table", width),
+        lines,
+    )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
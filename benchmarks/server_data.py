@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Compares memory and parse cost of ServerData against the previous dict backed version.
+
+Usage: python -m benchmarks.server_data [number of servers]
+"""
+
+import sys
+from json import dumps, loads
+import tracemalloc
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Callable, Dict, List, Tuple
+
+from src.server_data import ServerData
+
+SERVICES = ["AuthService", "GeoService", "IdService", "MLService", "RoleService"]
+
+
+@dataclass
+class LegacyServerData:
+    """ServerData as it was before metrics were parsed once."""
+
+    ip: str
+    details: Dict[str, str]
+
+    @property
+    def memory(self) -> int:
+        return int((self.details.get("memory", "") or "-1").replace("%", ""))
+
+    @property
+    def cpu(self) -> int:
+        return int((self.details.get("cpu", "") or "-1").replace("%", ""))
+
+    @property
+    def service(self) -> str:
+        return self.details.get("service", "unknown") or "unknown"
+
+
+def decoded_details(count: int) -> List[Tuple[str, Dict[str, str]]]:
+    """Ips and details as decoded from CPX json responses, each one with its own strings."""
+    return [
+        (
+            f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}",
+            loads(
+                dumps(
+                    {
+                        "cpu": "%d%%" % (i % 101),
+                        "memory": "%d%%" % (i * 7 % 101),
+                        "service": SERVICES[i % len(SERVICES)],
+                    }
+                )
+            ),
+        )
+        for i in range(count)
+    ]
+
+
+def read_metrics(servers: List) -> int:
+    """Reads every metric of every server three times, as the statistics do."""
+    total = 0
+    for _ in range(3):
+        for server in servers:
+            total += server.cpu + server.memory + len(server.service)
+    return total
+
+
+def run(name: str, factory: Callable, count: int) -> None:
+    tracemalloc.start()
+    raw = decoded_details(count)
+    servers = [factory(ip, details) for ip, details in raw]
+    del raw
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del servers
+
+    raw = decoded_details(count)
+    start = perf_counter()
+    servers = [factory(ip, details) for ip, details in raw]
+    built = perf_counter()
+    read_metrics(servers)
+    done = perf_counter()
+    print(
+        f"{name:<8} {retained / count:>6.0f} B/server "
+        f"{(built - start) * 1e9 / count:>6.0f} ns/build "
+        f"{(done - built) * 1e9 / count:>6.0f} ns/3 reads"
+    )
+
+
+def main(count: int) -> None:
+    print(f"{count} servers")
+    run("legacy", LegacyServerData, count)
+    run("slotted", ServerData, count)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
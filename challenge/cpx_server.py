@@ -11,6 +11,8 @@ from http.server import HTTPServer, SimpleHTTPRequestHandler
 
 NUM_SERVERS = 150
 SERVER_SET = set(["10.58.1.%d" % i for i in range(1, NUM_SERVERS + 1)])
+SERVERS_BODY = bytes(json.dumps(list(SERVER_SET)), "utf-8")
+SERVERS_ETAG = '"%s"' % hashlib.md5(SERVERS_BODY).hexdigest()
 IP_REGEX = r"/10\.58\.1\.[0-9]{1,3}$"
 SERVICES = [
     "PermissionsService",
@@ -55,10 +57,23 @@ class CPXHandler(SimpleHTTPRequestHandler):
         self.end_headers()
         self.wfile.write(bytes(json.dumps(data), "utf-8"))
 
+    def _servers(self):
+        etags = self.headers.get("If-None-Match", "")
+        if SERVERS_ETAG in [etag.strip() for etag in etags.split(",")]:
+            self.send_response(304)
+            self.send_header("ETag", SERVERS_ETAG)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-type", "application/json")
+        self.send_header("ETag", SERVERS_ETAG)
+        self.end_headers()
+        self.wfile.write(SERVERS_BODY)
+
     def do_GET(self):
         ip_match = re.match(IP_REGEX, self.path)
         if self.path == "/servers":
-            self._json(list(SERVER_SET))
+            self._servers()
         elif ip_match:
             ip = ip_match.group().replace("/", "")
             if ip not in SERVER_SET:
@@ -30,5 +30,9 @@ setup(
         ]
     },
     install_requires=dependencies,
+    extras_require={
+        "columnar": ["numpy>=1.22"],
+        "fast-json": ["msgspec>=0.18", "orjson>=3.8"],
+    },
     python_requires=">=3.8",
 )
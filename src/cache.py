@@ -0,0 +1,225 @@
+import asyncio
+import json
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+from pathlib import Path
+from time import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from src.cpx_client import CpxClient, logger
+from src.files import replace_file
+
+
+# where responses are kept between runs, when caching on disk
+DEFAULT_CACHE_DIR = Path("~/.cache/cpx_utils").expanduser()
+CACHE_FILE = "responses.json"
+
+
+class CacheEntry(NamedTuple):
+    """The raw body of a response and when it was received (epoch seconds)."""
+
+    body: bytes
+    stored_at: float
+
+
+def decode_entries(data: Any) -> List[Tuple[str, CacheEntry]]:
+    """The entries of a cache file, raising a ValueError if it is malformed."""
+    if not isinstance(data, list):
+        raise ValueError("entries are not a list")
+    entries = []
+    for item in data:
+        if not (isinstance(item, list) and len(item) == 3):
+            raise ValueError(f"invalid entry: {item!r}")
+        key, body, stored_at = item
+        if not (
+            isinstance(key, str)
+            and isinstance(body, str)
+            and isinstance(stored_at, (int, float))
+        ):
+            raise ValueError(f"invalid entry: {item!r}")
+        entries.append((key, CacheEntry(b64decode(body, validate=True), stored_at)))
+    return entries
+
+
+class ResponseCache:
+    """Bounded cache of response bodies by URL, evicting the least recently used.
+
+    When a directory is given, entries are loaded from it on `load` and written
+    back on `save` (as json, bodies in base64), so that back-to-back runs share
+    the responses they got.
+    Entries carry wall clock times so that their age survives across runs.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        directory: Optional[Path] = None,
+        clock: Callable[[], float] = time,
+    ) -> None:
+        assert max_entries > 0, f"invalid cache size: {max_entries}"
+        self.max_entries = max_entries
+        self.directory = directory
+        self.clock = clock
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """The entry of a URL, marked as the most recently used, if any."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, body: bytes) -> None:
+        """Stores the body of a response received now, evicting the oldest ones."""
+        self._entries[key] = CacheEntry(body, self.clock())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._dirty = True
+
+    def age(self, entry: CacheEntry) -> float:
+        """Seconds since an entry was stored."""
+        return self.clock() - entry.stored_at
+
+    @property
+    def path(self) -> Optional[Path]:
+        """The file entries are kept in, when caching on disk."""
+        if self.directory is None:
+            return None
+        return self.directory / CACHE_FILE
+
+    def load(self) -> None:
+        """Reads the entries kept on disk, starting empty if they are unreadable."""
+        path = self.path
+        if path is None or not path.exists():
+            return
+        try:
+            with open(path, "rb") as file:
+                entries = decode_entries(json.load(file))
+        except (OSError, ValueError) as error:
+            logger.error("Ignoring unreadable cache: %s, error: %s", path, str(error))
+            return
+        for key, entry in entries:
+            if key not in self._entries:
+                self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def save(self) -> None:
+        """Writes the entries on disk if they changed, replacing the file at once."""
+        path = self.path
+        if path is None or not self._dirty:
+            return
+        entries = [
+            [key, b64encode(entry.body).decode(), entry.stored_at]
+            for key, entry in self._entries.items()
+        ]
+        replace_file(path, json.dumps(entries))
+        self._dirty = False
+
+
+class CachedCpxClient(CpxClient):
+    """CPX client answering from a response cache while entries are fresh.
+
+    The list of servers is fresh for `servers_ttl` seconds and the details of
+    a server for `details_ttl` seconds. For `stale_ttl` seconds more, the
+    cached response is still returned right away while it is fetched again
+    in the background (stale-while-revalidate). Concurrent requests for the
+    same URL share a single request to CPX.
+
+    On close, revalidations still in flight are given up to `close_timeout`
+    seconds to complete, so that the responses saved are the refreshed ones.
+    """
+
+    def __init__(
+        self,
+        *args,
+        cache: Optional[ResponseCache] = None,
+        servers_ttl: float = 30.0,
+        details_ttl: float = 5.0,
+        stale_ttl: float = 30.0,
+        close_timeout: float = 1.0,
+        **kwargs,
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        assert servers_ttl >= 0, f"invalid servers ttl: {servers_ttl}"
+        assert details_ttl >= 0, f"invalid details ttl: {details_ttl}"
+        assert stale_ttl >= 0, f"invalid stale ttl: {stale_ttl}"
+        assert close_timeout >= 0, f"invalid close timeout: {close_timeout}"
+        self.cache = ResponseCache() if cache is None else cache
+        self.servers_ttl = servers_ttl
+        self.details_ttl = details_ttl
+        self.stale_ttl = stale_ttl
+        self.close_timeout = close_timeout
+        self._pending: Dict[str, asyncio.Task] = {}
+
+    async def open(self) -> None:
+        """Creates the pooled session and loads the responses kept on disk."""
+        await super().open()
+        self.cache.load()
+
+    async def close(self) -> None:
+        """Completes pending revalidations, then saves responses and closes the session.
+
+        Revalidations still pending after `close_timeout` seconds are stopped.
+        """
+        pending = list(self._pending.values())
+        if pending:
+            _, overrun = await asyncio.wait(pending, timeout=self.close_timeout)
+            for task in overrun:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        self.cache.save()
+        await super().close()
+
+    def ttl(self, path: str) -> float:
+        """Seconds a response to a path is fresh for."""
+        return self.servers_ttl if path == "servers" else self.details_ttl
+
+    async def request(self, path: str) -> bytes:
+        """Returns the body of a response, from the cache when it is recent enough."""
+        cache = self.cache
+        key = self.get_url(path)
+        entry = cache.get(key)
+        if entry is not None:
+            age = cache.age(entry)
+            ttl = self.ttl(path)
+            if age < ttl:
+                cache.hits += 1
+                return entry.body
+            if age < ttl + self.stale_ttl:
+                cache.stale_hits += 1
+                self._fetch(key, path)
+                return entry.body
+        cache.misses += 1
+        # shielded so that a cancelled caller does not cancel the others
+        return await asyncio.shield(self._fetch(key, path))
+
+    def _fetch(self, key: str, path: str) -> asyncio.Task:
+        task = self._pending.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._store(key, path))
+            self._pending[key] = task
+            task.add_done_callback(lambda done: self._done(key, done))
+        return task
+
+    async def _store(self, key: str, path: str) -> bytes:
+        body = await super().request(path)
+        self.cache.put(key, body)
+        return body
+
+    def _done(self, key: str, task: asyncio.Task) -> None:
+        self._pending.pop(key, None)
+        if not task.cancelled():
+            # failed revalidations have been logged and keep the stale entry
+            task.exception()
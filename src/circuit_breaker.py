@@ -0,0 +1,76 @@
+from time import monotonic
+from typing import Callable
+
+
+class CircuitBreaker:
+    """Stops sending requests to a server that keeps failing, probing for recovery.
+
+    The breaker is `closed` while requests succeed. After `failure_threshold`
+    consecutive failures it opens, and requests are refused without being
+    sent for `reset_timeout` seconds. Then it is `half-open`: a single probe
+    request is let through, closing the breaker if it succeeds or opening it
+    again for another period if it fails.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 5.0,
+        clock: Callable[[], float] = monotonic,
+    ) -> None:
+        assert failure_threshold > 0, f"invalid threshold: {failure_threshold}"
+        assert reset_timeout > 0, f"invalid reset timeout: {reset_timeout}"
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.trips = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        """The current state, `open` turning `half-open` once the timeout elapsed."""
+        if self._opened_at is None:
+            return self.CLOSED
+        if self.clock() - self._opened_at < self.reset_timeout:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    @property
+    def closed(self) -> bool:
+        """Whether requests flow normally."""
+        return self._opened_at is None
+
+    def allow(self) -> bool:
+        """Whether a request can be sent now, taking the probe slot when half-open."""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.OPEN or self._probing:
+            return False
+        self._probing = True
+        return True
+
+    def record_success(self) -> None:
+        """Accounts for a successful request, closing the breaker."""
+        self.failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        """Accounts for a failed request, opening the breaker past the threshold."""
+        self.failures += 1
+        if self._probing or (self.closed and self.failures >= self.failure_threshold):
+            if self.closed:
+                self.trips += 1
+            self._opened_at = self.clock()
+        self._probing = False
+
+    def record_cancelled(self) -> None:
+        """Accounts for a request abandoned before completing, freeing the probe slot."""
+        self._probing = False
@@ -2,67 +2,442 @@ import asyncio
 import sys
 from argparse import ArgumentParser, Namespace, ArgumentTypeError
 from curses import wrapper
-from typing import List
+from pathlib import Path
+from time import time
+from typing import Any, Coroutine, List, Tuple
 
+from aiohttp import web
+
+from src import columnar
+from src.cache import DEFAULT_CACHE_DIR, ResponseCache
+from src.exporter import Exporter
 from src.fetcher import Fetcher
+from src.history import (
+    META_FILE,
+    SampleRecorder,
+    SampleStore,
+    history_dir,
+    aggregate_lines,
+    sample_lines,
+)
+from src.printer import Printer
+from src.scheduler import Ticker
+from src.screen import Screen
+from src.service_index import ServiceIndex, index_path
+from src.trends import TREND_POINTS
+from src.watcher import Watcher
 
 
 DESCRIPTION = "CLI tool for fetching and watching CPX servers"
 SNAPSHOT_PROG = "cpx_utils snapshot"
 SNAPSHOT_EPILOG = """
 Fetches information from CPX one single time and display as specified.
-The default format is 'table', but 'csv' and 'json' are also available.
+The default format is 'table', but 'csv', 'json' and 'ndjson' are also available.
 """
 WATCH_PROG = "cps_utils watch"
 WATCH_EPILOG = """
 Continuously fetches information from CPX and display as specified.
 """
+HISTORY_PROG = "cpx_utils history"
+HISTORY_EPILOG = """
+Shows the samples recorded by 'watch --history', without fetching anything.
+"""
+SERVE_PROG = "cpx_utils serve"
+SERVE_EPILOG = """
+Continuously fetches information from CPX in the background and serves it as
+Prometheus/OpenMetrics metrics on /metrics.
+"""
 DETAILS_HELP = "the level of detail in the output information"
 FORMAT_HELP = "determines the output format"
 REFRESH_HELP = "the refresh period in seconds, between 1 and 60 inclusive"
+OVERRUN_POLICY_HELP = (
+    "what to do with refreshes missed while fetching takes longer than the refresh"
+    " period: skip them, coalesce them into one, or render partial results on time"
+)
+SERVERS_REFRESH_HELP = "the period in seconds between refreshes of the list of servers"
 MODE_HELP = "the amount of information displayed"
+TYPED_HELP = (
+    "keep numbers as numbers in csv/json/ndjson output, with the ips of services"
+    " as a json array or a space separated csv field"
+)
+WATCH_DETAILS_HELP = (
+    "the level of detail on screen, 'full' shows every server and can be scrolled"
+    " with the arrow, page up/down, home and end keys"
+)
 HOST_HELP = "cpx api host"
 PORT_HELP = "cpx api port"
 IPV_HELP = "ip protocol version"
+CONNECTIONS_HELP = "maximum number of pooled connections to cpx api, 0 for unlimited"
+CONNECTIONS_PER_HOST_HELP = (
+    "maximum number of pooled connections per host, 0 for unlimited"
+)
+KEEPALIVE_HELP = "seconds an idle pooled connection is kept open"
+MAX_INFLIGHT_HELP = "maximum number of concurrent server detail requests"
+STATS_BACKEND_HELP = (
+    "how service quantiles are computed, 'columnar' uses numpy to compute all"
+    " services at once"
+)
+RATE_LIMIT_HELP = "maximum number of server detail requests per second, 0 for unlimited"
+CONNECT_TIMEOUT_HELP = "seconds to establish a connection to cpx api"
+READ_TIMEOUT_HELP = "seconds to wait for each read from a connection to cpx api"
+TIMEOUT_HELP = "seconds a request to cpx api can take overall"
+RETRY_BUDGET_HELP = (
+    "maximum ratio of retries to requests in a snapshot or refresh (on top of"
+    " one retry per server), so that retries do not pile up on a degraded cpx"
+    " api"
+)
+LATENCY_TARGET_HELP = (
+    "seconds a request to cpx api should take at most: slower or failing"
+    " requests shrink the number of concurrent requests (up to --max-inflight),"
+    " 0 to disable"
+)
+BREAKER_THRESHOLD_HELP = (
+    "consecutive failures of cpx api after which requests are stopped for"
+    " --breaker-reset seconds, 0 to disable (default: 5 for watch and serve,"
+    " disabled for snapshot)"
+)
+BREAKER_RESET_HELP = "seconds before a request is tried again once cpx api failed"
+CACHE_HELP = "serve repeated requests from a cache of cpx api responses"
+CACHE_DIR_HELP = (
+    "keep cached responses in this directory so that they are shared by"
+    f" successive runs (implies --cache, default {DEFAULT_CACHE_DIR})"
+)
+CACHE_SIZE_HELP = "maximum number of cached responses, least recently used first out"
+SERVERS_TTL_HELP = "seconds a cached list of servers is used without refetching it"
+DETAILS_TTL_HELP = "seconds cached server details are used without refetching them"
+STALE_TTL_HELP = (
+    "seconds past their ttl during which cached responses are still used while"
+    " being refetched in the background"
+)
+HISTORY_HELP = (
+    "keep every sample polled in a history, in this directory (default: a"
+    " directory of the cpx api under ~/.cache/cpx_utils/history)"
+)
+RETENTION_HELP = "seconds of samples kept in the history, set when it is created"
+HISTORY_DIR_HELP = "the directory of the history (default: as in watch --history)"
+SERVER_HELP = "show the samples of this server"
+SERVICE_HELP = "show the samples of the servers of this service"
+SINCE_HELP = "how far back to go, such as 90s, 15m, 1h or 2d (default 1h)"
+STEP_HELP = (
+    "aggregate samples over steps of this duration, such as 1m or 1h, instead"
+    " of listing them"
+)
+WATCH_SERVICE_HELP = (
+    "only poll the servers of this service (once every server's service is"
+    " known) and show each of them with sparklines of its latest samples"
+)
+TREND_POINTS_HELP = "the number of samples shown in sparklines, one per refresh"
+SNAPSHOT_SERVICES_HELP = (
+    "only report the servers of these comma separated services, polling the"
+    " ones the service index places in them or does not know yet"
+)
+INDEX_HELP = (
+    "the file of the service index, which keeps the service of each server to"
+    " only poll the servers of the services asked for"
+    " (default: a file of the cpx api under ~/.cache/cpx_utils/index)"
+)
+INDEX_TTL_HELP = (
+    "seconds after which the service of an indexed server is verified by"
+    " polling it again"
+)
+LISTEN_HELP = "the address to serve metrics on, as [host]:port (default :9100)"
+SERVE_REFRESH_HELP = "the period in seconds between polls of cpx api"
+SERVER_METRICS_HELP = (
+    "leave out the metrics of each server, keeping the ones of services, whose"
+    " size does not grow with the fleet"
+)
+# seconds in each unit of a duration
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+# seconds between checks for key presses in watch mode
+KEYS_INTERVAL = 0.05
+# seconds membership changes are shown for in watch mode, and how many at most
+EVENTS_SHOWN_FOR = 30.0
+EVENTS_SHOWN = 3
+# consecutive failures opening the breaker of long-running commands: a
+# snapshot has no later requests to spare, so it has no breaker by default
+BREAKER_THRESHOLD = 5
+
+
+def create_fetcher(args: Namespace, breaker_threshold: int = 0) -> Fetcher:
+    """Builds a fetcher whose connection pool is configured from the arguments.
+
+    The breaker threshold applies unless one is given on the command line.
+    """
+    if args.breaker_threshold is not None:
+        breaker_threshold = args.breaker_threshold
+    cache = None
+    if args.cache or args.cache_dir is not None:
+        cache = ResponseCache(args.cache_size, args.cache_dir)
+    return Fetcher(
+        args.host,
+        args.port,
+        args.ip_version,
+        limit=args.connections,
+        limit_per_host=args.connections_per_host,
+        keepalive_timeout=args.keepalive,
+        max_inflight=args.max_inflight,
+        rate_limit=args.rate_limit,
+        stats_backend=args.stats_backend,
+        connect_timeout=args.connect_timeout,
+        read_timeout=args.read_timeout,
+        total_timeout=args.timeout,
+        retry_budget=args.retry_budget,
+        latency_target=args.latency_target,
+        breaker_threshold=breaker_threshold,
+        breaker_reset=args.breaker_reset,
+        cache=cache,
+        servers_ttl=args.servers_ttl,
+        details_ttl=args.details_ttl,
+        stale_ttl=args.stale_ttl,
+    )
+
+
+def positive_int(value: str) -> int:
+    """Parses a strictly positive integer argument."""
+    ivalue = int(value)
+    if ivalue < 1:
+        raise ArgumentTypeError(f"value must be a positive integer, found {value}")
+    return ivalue
+
+
+def non_negative_int(value: str) -> int:
+    """Parses a non negative integer argument."""
+    ivalue = int(value)
+    if ivalue < 0:
+        raise ArgumentTypeError(f"value must not be negative, found {value}")
+    return ivalue
+
+
+def positive_float(value: str) -> float:
+    """Parses a strictly positive float argument."""
+    fvalue = float(value)
+    if fvalue <= 0:
+        raise ArgumentTypeError(f"value must be positive, found {value}")
+    return fvalue
+
+
+def non_negative_float(value: str) -> float:
+    """Parses a non negative float argument."""
+    fvalue = float(value)
+    if fvalue < 0:
+        raise ArgumentTypeError(f"value must not be negative, found {value}")
+    return fvalue
+
+
+def duration(value: str) -> float:
+    """Parses a positive duration in seconds, maybe with a unit (s, m, h or d)."""
+    unit = DURATION_UNITS.get(value[-1:], None)
+    try:
+        seconds = float(value[:-1]) * unit if unit else float(value)
+    except ValueError:
+        raise ArgumentTypeError(f"invalid duration: {value}")
+    if seconds <= 0:
+        raise ArgumentTypeError(f"duration must be positive, found {value}")
+    return seconds
+
+
+def service_list(value: str) -> List[str]:
+    """Parses a comma separated list of service names."""
+    services = [service.strip() for service in value.split(",") if service.strip()]
+    if not services:
+        raise ArgumentTypeError(f"invalid list of services: {value!r}")
+    return services
+
+
+def listen_address(value: str) -> Tuple[str, int]:
+    """Parses a [host]:port address, an empty host meaning every interface."""
+    host, separator, port = value.rpartition(":")
+    try:
+        number = int(port)
+    except ValueError:
+        number = -1
+    if not separator or not 0 < number < 65536:
+        raise ArgumentTypeError(f"invalid address, expected [host]:port: {value}")
+    return host.strip("[]") or "0.0.0.0", number
+
+
+def open_index(args: Namespace) -> ServiceIndex:
+    """Loads the service index of the cpx api."""
+    index = ServiceIndex(args.index or index_path(args.host, args.port), args.index_ttl)
+    index.load()
+    return index
+
+
+def open_recorder(args: Namespace, parser: ArgumentParser) -> SampleRecorder:
+    """Opens the history watch mode records samples in."""
+    directory = args.history
+    if directory is True:
+        directory = history_dir(args.host, args.port)
+    store = SampleStore(directory, args.retention)
+    try:
+        store.open()
+    except ValueError as error:
+        parser.error(str(error))
+    return SampleRecorder(store)
+
+
+def run_until_interrupted(main: Coroutine[Any, Any, None]) -> None:
+    """Runs a coroutine on a new event loop until it returns or Ctrl+C is pressed.
+
+    On Ctrl+C the coroutine is cancelled and the loop runs until it is done,
+    so that its cleanup (such as saving caches) completes before exiting.
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    task = loop.create_task(main)
+    task.add_done_callback(lambda _: loop.stop())
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        task.cancel()
+        loop.run_until_complete(asyncio.gather(task, return_exceptions=True))
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
 
 
 def snapshot(args: Namespace, parser: ArgumentParser) -> None:
     """Main helper for snapshot operation that fetches information once."""
 
+    index = None
+    if args.services is not None:
+        index = open_index(args)
+
     async def fetch_all():
-        fetcher = Fetcher(args.host, args.port, args.ip_version)
-        await fetcher.display_once(args.format, args.details)
+        async with create_fetcher(args) as fetcher:
+            await fetcher.display_once(
+                args.format,
+                args.details,
+                args.mode,
+                typed=args.typed,
+                services=args.services,
+                index=index,
+            )
 
     asyncio.run(fetch_all())
+    if index is not None:
+        index.save()
 
 
 def watch(args: Namespace, parser: ArgumentParser) -> None:
     """Main helper for watch operation that continuously fetches information."""
+    recorder = None
+    if args.history is not None:
+        recorder = open_recorder(args, parser)
+    index = None
+    if args.service is not None:
+        index = open_index(args)
 
     async def watch_and_catch(window):
-        try:
-            while True:
-                fetcher = Fetcher(args.host, args.port, args.ip_version)
-                await fetcher.display_once(
-                    format="table", details="summary", mode=args.mode, window=window
+        fetcher = create_fetcher(args, BREAKER_THRESHOLD)
+        await fetcher.open()
+        watcher = Watcher(
+            fetcher,
+            args.mode,
+            args.servers_refresh,
+            recorder=recorder,
+            service=args.service,
+            trend_points=args.trend_points,
+            index=index,
+        )
+        ticker = Ticker(args.refresh, args.overrun_policy)
+        screen = Screen(window)
+
+        def render():
+            status = (
+                f"{watcher.refreshed}/{len(watcher.poll_ips)} servers refreshed  "
+                f"refresh: {args.refresh}s  cycles: {ticker.cycles}  "
+                f"overruns: {ticker.overruns}  skipped: {ticker.skipped}"
+            )
+            if not watcher.complete:
+                status += "  (partial)"
+            if watcher.failed:
+                status += f"  failed: {watcher.failed}"
+            if watcher.stale:
+                status += "  STALE: cpx api failing, showing last good data"
+            events = watcher.recent_events(EVENTS_SHOWN_FOR)[-EVENTS_SHOWN:]
+            if events:
+                status += "  " + " ".join(str(event) for event in events)
+            if args.service is not None:
+                Printer.print_table_instances(
+                    watcher.instance_lines,
+                    args.trend_points,
+                    screen,
+                    f"{args.service}: {status}",
                 )
-                await asyncio.sleep(args.refresh)
-        except KeyboardInterrupt:
-            loop = asyncio.get_event_loop()
-            loop.stop()
-        except Exception:
-            pass
+            elif args.details == "full":
+                Printer.print_table_full(
+                    watcher.full_lines, screen, status, presorted=True
+                )
+            else:
+                Printer.print_summary(
+                    watcher.lines, "table", screen, status, watcher.ages()
+                )
+
+        async def refresh(deadline):
+            await watcher.refresh(deadline, on_progress=render)
+            render()
+
+        async def scroll():
+            while True:
+                if screen.handle_keys():
+                    render()
+                await asyncio.sleep(KEYS_INTERVAL)
 
-    def wrapped_watcher(window):
+        keys = asyncio.ensure_future(scroll())
         try:
-            asyncio.ensure_future(watch_and_catch(window))
-            loop = asyncio.get_event_loop()
-            loop.run_forever()
+            await ticker.run(refresh)
+        except Exception:
+            pass
         finally:
-            loop.run_until_complete(loop.shutdown_asyncgens())
-            loop.close()
+            keys.cancel()
+            if index is not None:
+                # saved before any await, which a second Ctrl+C could interrupt
+                index.save()
+            await asyncio.gather(keys, return_exceptions=True)
+            try:
+                await fetcher.close()
+            finally:
+                if recorder is not None:
+                    # flushes recorded samples to disk
+                    await recorder.close()
+
+    wrapper(lambda window: run_until_interrupted(watch_and_catch(window)))
+
+
+def serve(args: Namespace, parser: ArgumentParser) -> None:
+    """Main helper for serve operation that exports metrics polled in the background."""
+    watcher = Watcher(
+        create_fetcher(args, BREAKER_THRESHOLD), "complete", args.servers_refresh
+    )
+    ticker = Ticker(args.refresh, args.overrun_policy)
+    exporter = Exporter(watcher, ticker, args.server_metrics)
+    host, port = args.listen
+    web.run_app(exporter.create_app(), host=host, port=port)
 
-    wrapper(wrapped_watcher)
+
+def history(args: Namespace, parser: ArgumentParser) -> None:
+    """Main helper for history operation that shows recorded samples."""
+    directory = args.history_dir or history_dir(args.host, args.port)
+    if not (directory / META_FILE).exists():
+        parser.error(f"no history in {directory}, record one with watch --history")
+    with SampleStore(directory, reader=True) as store:
+        if args.server is not None:
+            ips = [args.server]
+        else:
+            ips = store.servers_of(args.service)
+        until = time()
+        since = until - args.since
+        if args.step is None:
+            lines = sample_lines(store, ips, since, until)
+        elif args.server is not None:
+            steps = store.server_aggregates(ips, since, until, args.step)
+            lines = aggregate_lines(steps, args.server, args.mode)
+        else:
+            steps = store.service_aggregates(args.service, since, until, args.step)
+            lines = aggregate_lines(steps, args.service, args.mode)
+    Printer.print_history(lines, args.format, args.typed)
 
 
 def config_parser_snapshot(parser: ArgumentParser) -> None:
@@ -72,7 +447,7 @@ def config_parser_snapshot(parser: ArgumentParser) -> None:
         "-f",
         dest="format",
         required=False,
-        choices=("csv", "json", "table"),
+        choices=("csv", "json", "ndjson", "table"),
         default="table",
         help=FORMAT_HELP,
     )
@@ -85,6 +460,32 @@ def config_parser_snapshot(parser: ArgumentParser) -> None:
         default="summary",
         help=DETAILS_HELP,
     )
+    parser.add_argument(
+        "--mode",
+        "-m",
+        dest="mode",
+        required=False,
+        type=str,
+        choices=("simple", "complete"),
+        default="complete",
+        help=MODE_HELP,
+    )
+    parser.add_argument(
+        "--typed",
+        dest="typed",
+        required=False,
+        action="store_true",
+        help=TYPED_HELP,
+    )
+    parser.add_argument(
+        "--service",
+        "-s",
+        dest="services",
+        required=False,
+        type=service_list,
+        default=None,
+        help=SNAPSHOT_SERVICES_HELP,
+    )
     parser.set_defaults(func=snapshot)
 
 
@@ -108,6 +509,22 @@ def config_parser_watch(parser: ArgumentParser) -> None:
         default=1,
         help=REFRESH_HELP,
     )
+    parser.add_argument(
+        "--servers-refresh",
+        dest="servers_refresh",
+        required=False,
+        type=non_negative_float,
+        default=30.0,
+        help=SERVERS_REFRESH_HELP,
+    )
+    parser.add_argument(
+        "--overrun-policy",
+        dest="overrun_policy",
+        required=False,
+        choices=Ticker.POLICIES,
+        default="skip",
+        help=OVERRUN_POLICY_HELP,
+    )
     parser.add_argument(
         "--mode",
         "-m",
@@ -118,9 +535,167 @@ def config_parser_watch(parser: ArgumentParser) -> None:
         default="simple",
         help=MODE_HELP,
     )
+    parser.add_argument(
+        "--details",
+        "-d",
+        dest="details",
+        required=False,
+        choices=("summary", "full"),
+        default="summary",
+        help=WATCH_DETAILS_HELP,
+    )
+    parser.add_argument(
+        "--history",
+        dest="history",
+        required=False,
+        nargs="?",
+        type=Path,
+        const=True,
+        default=None,
+        help=HISTORY_HELP,
+    )
+    parser.add_argument(
+        "--retention",
+        dest="retention",
+        required=False,
+        type=duration,
+        default=None,
+        help=RETENTION_HELP,
+    )
+    parser.add_argument(
+        "--service",
+        "-s",
+        dest="service",
+        required=False,
+        type=str,
+        default=None,
+        help=WATCH_SERVICE_HELP,
+    )
+    parser.add_argument(
+        "--trend-points",
+        dest="trend_points",
+        required=False,
+        type=positive_int,
+        default=TREND_POINTS,
+        help=TREND_POINTS_HELP,
+    )
     parser.set_defaults(func=watch)
 
 
+def config_parser_serve(parser: ArgumentParser) -> None:
+    """Configures sub parser for serve."""
+    parser.add_argument(
+        "--listen",
+        "-l",
+        dest="listen",
+        required=False,
+        type=listen_address,
+        default=("0.0.0.0", 9100),
+        help=LISTEN_HELP,
+    )
+    parser.add_argument(
+        "--refresh",
+        "-r",
+        dest="refresh",
+        required=False,
+        type=positive_float,
+        default=15.0,
+        help=SERVE_REFRESH_HELP,
+    )
+    parser.add_argument(
+        "--servers-refresh",
+        dest="servers_refresh",
+        required=False,
+        type=non_negative_float,
+        default=30.0,
+        help=SERVERS_REFRESH_HELP,
+    )
+    parser.add_argument(
+        "--overrun-policy",
+        dest="overrun_policy",
+        required=False,
+        choices=Ticker.POLICIES,
+        default="skip",
+        help=OVERRUN_POLICY_HELP,
+    )
+    parser.add_argument(
+        "--no-server-metrics",
+        dest="server_metrics",
+        required=False,
+        action="store_false",
+        help=SERVER_METRICS_HELP,
+    )
+    parser.set_defaults(func=serve)
+
+
+def config_parser_history(parser: ArgumentParser) -> None:
+    """Configures sub parser for history."""
+    parser.add_argument(
+        "--dir",
+        dest="history_dir",
+        required=False,
+        type=Path,
+        default=None,
+        help=HISTORY_DIR_HELP,
+    )
+    servers = parser.add_mutually_exclusive_group(required=True)
+    servers.add_argument(
+        "--server",
+        dest="server",
+        type=str,
+        help=SERVER_HELP,
+    )
+    servers.add_argument(
+        "--service",
+        dest="service",
+        type=str,
+        help=SERVICE_HELP,
+    )
+    parser.add_argument(
+        "--since",
+        dest="since",
+        required=False,
+        type=duration,
+        default=3600.0,
+        help=SINCE_HELP,
+    )
+    parser.add_argument(
+        "--step",
+        dest="step",
+        required=False,
+        type=duration,
+        default=None,
+        help=STEP_HELP,
+    )
+    parser.add_argument(
+        "--mode",
+        "-m",
+        dest="mode",
+        required=False,
+        type=str,
+        choices=("simple", "complete"),
+        default="complete",
+        help=MODE_HELP,
+    )
+    parser.add_argument(
+        "--format",
+        "-f",
+        dest="format",
+        required=False,
+        choices=("csv", "json", "ndjson", "table"),
+        default="table",
+        help=FORMAT_HELP,
+    )
+    parser.add_argument(
+        "--typed",
+        dest="typed",
+        required=False,
+        action="store_true",
+        help=TYPED_HELP,
+    )
+    parser.set_defaults(func=history)
+
+
 def create_parser():
     """Builds a parser."""
     parser = ArgumentParser(description=DESCRIPTION)
@@ -150,6 +725,175 @@ def create_parser():
         default=4,
         help=PORT_HELP,
     )
+    parser.add_argument(
+        "--connections",
+        dest="connections",
+        required=False,
+        type=int,
+        default=100,
+        help=CONNECTIONS_HELP,
+    )
+    parser.add_argument(
+        "--connections-per-host",
+        dest="connections_per_host",
+        required=False,
+        type=int,
+        default=0,
+        help=CONNECTIONS_PER_HOST_HELP,
+    )
+    parser.add_argument(
+        "--keepalive",
+        dest="keepalive",
+        required=False,
+        type=float,
+        default=30.0,
+        help=KEEPALIVE_HELP,
+    )
+    parser.add_argument(
+        "--max-inflight",
+        dest="max_inflight",
+        required=False,
+        type=positive_int,
+        default=100,
+        help=MAX_INFLIGHT_HELP,
+    )
+    parser.add_argument(
+        "--rate-limit",
+        dest="rate_limit",
+        required=False,
+        type=non_negative_float,
+        default=0.0,
+        help=RATE_LIMIT_HELP,
+    )
+    parser.add_argument(
+        "--connect-timeout",
+        dest="connect_timeout",
+        required=False,
+        type=positive_float,
+        default=3.0,
+        help=CONNECT_TIMEOUT_HELP,
+    )
+    parser.add_argument(
+        "--read-timeout",
+        dest="read_timeout",
+        required=False,
+        type=positive_float,
+        default=5.0,
+        help=READ_TIMEOUT_HELP,
+    )
+    parser.add_argument(
+        "--timeout",
+        dest="timeout",
+        required=False,
+        type=positive_float,
+        default=10.0,
+        help=TIMEOUT_HELP,
+    )
+    parser.add_argument(
+        "--retry-budget",
+        dest="retry_budget",
+        required=False,
+        type=non_negative_float,
+        default=0.1,
+        help=RETRY_BUDGET_HELP,
+    )
+    parser.add_argument(
+        "--latency-target",
+        dest="latency_target",
+        required=False,
+        type=non_negative_float,
+        default=1.0,
+        help=LATENCY_TARGET_HELP,
+    )
+    parser.add_argument(
+        "--breaker-threshold",
+        dest="breaker_threshold",
+        required=False,
+        type=non_negative_int,
+        default=None,
+        help=BREAKER_THRESHOLD_HELP,
+    )
+    parser.add_argument(
+        "--breaker-reset",
+        dest="breaker_reset",
+        required=False,
+        type=positive_float,
+        default=5.0,
+        help=BREAKER_RESET_HELP,
+    )
+    parser.add_argument(
+        "--cache",
+        dest="cache",
+        required=False,
+        action="store_true",
+        help=CACHE_HELP,
+    )
+    parser.add_argument(
+        "--cache-dir",
+        dest="cache_dir",
+        required=False,
+        nargs="?",
+        type=Path,
+        const=DEFAULT_CACHE_DIR,
+        default=None,
+        help=CACHE_DIR_HELP,
+    )
+    parser.add_argument(
+        "--cache-size",
+        dest="cache_size",
+        required=False,
+        type=positive_int,
+        default=10000,
+        help=CACHE_SIZE_HELP,
+    )
+    parser.add_argument(
+        "--servers-ttl",
+        dest="servers_ttl",
+        required=False,
+        type=non_negative_float,
+        default=30.0,
+        help=SERVERS_TTL_HELP,
+    )
+    parser.add_argument(
+        "--details-ttl",
+        dest="details_ttl",
+        required=False,
+        type=non_negative_float,
+        default=5.0,
+        help=DETAILS_TTL_HELP,
+    )
+    parser.add_argument(
+        "--stale-ttl",
+        dest="stale_ttl",
+        required=False,
+        type=non_negative_float,
+        default=30.0,
+        help=STALE_TTL_HELP,
+    )
+    parser.add_argument(
+        "--index",
+        dest="index",
+        required=False,
+        type=Path,
+        default=None,
+        help=INDEX_HELP,
+    )
+    parser.add_argument(
+        "--index-ttl",
+        dest="index_ttl",
+        required=False,
+        type=non_negative_float,
+        default=3600.0,
+        help=INDEX_TTL_HELP,
+    )
+    parser.add_argument(
+        "--stats-backend",
+        dest="stats_backend",
+        required=False,
+        choices=("exact", "columnar"),
+        default="exact",
+        help=STATS_BACKEND_HELP,
+    )
     subparsers = parser.add_subparsers(help="actions")
     parser_snapshot = subparsers.add_parser(
         "snapshot",
@@ -165,6 +909,20 @@ def create_parser():
         epilog=WATCH_EPILOG,
     )
     config_parser_watch(parser_watch)
+    parser_history = subparsers.add_parser(
+        "history",
+        help="show cpx information recorded by watch",
+        prog=HISTORY_PROG,
+        epilog=HISTORY_EPILOG,
+    )
+    config_parser_history(parser_history)
+    parser_serve = subparsers.add_parser(
+        "serve",
+        help="serve cpx information as prometheus metrics",
+        prog=SERVE_PROG,
+        epilog=SERVE_EPILOG,
+    )
+    config_parser_serve(parser_serve)
     return parser
 
 
@@ -176,6 +934,8 @@ def main():
         args = parser.parse_args([input_string] + sys.argv[1:])
     else:
         args = parser.parse_args()
+    if args.stats_backend == "columnar" and not columnar.AVAILABLE:
+        parser.error("the columnar stats backend requires numpy to be installed")
     args.func(args, parser)
 
 
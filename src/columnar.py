@@ -0,0 +1,144 @@
+from typing import Dict, List, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy is an optional dependency
+    np = None
+
+from src.result_lines import SummaryResultLine
+from src.server_data import ServerData
+
+
+AVAILABLE = np is not None
+
+
+class FleetColumns:
+    """Columnar representation of a fleet, backed by NumPy arrays.
+
+    Metrics are parsed once into parallel `int16` arrays, services are encoded
+    as integer codes in order of first appearance, and summaries are computed
+    for all services at once with sort-based group reductions instead of
+    visiting servers one by one.
+    """
+
+    def __init__(
+        self,
+        ips: "np.ndarray",
+        services: "np.ndarray",
+        service_names: List[str],
+        cpu: "np.ndarray",
+        memory: "np.ndarray",
+    ) -> None:
+        if np is None:
+            raise ImportError("numpy is required by the columnar statistics backend")
+        self.ips = ips
+        self.services = services
+        self.service_names = service_names
+        self.cpu = cpu
+        self.memory = memory
+
+    def __len__(self) -> int:
+        return len(self.ips)
+
+    @classmethod
+    def from_servers(cls, servers: Sequence[ServerData]) -> "FleetColumns":
+        """Builds the columns from fetched servers."""
+        if np is None:
+            raise ImportError("numpy is required by the columnar statistics backend")
+        codes: Dict[str, int] = {}
+        services = np.fromiter(
+            (codes.setdefault(s.service, len(codes)) for s in servers),
+            dtype=np.int32,
+            count=len(servers),
+        )
+        cpu = np.fromiter((s.cpu for s in servers), dtype=np.int16, count=len(servers))
+        memory = np.fromiter(
+            (s.memory for s in servers), dtype=np.int16, count=len(servers)
+        )
+        ips = np.array([s.ip for s in servers], dtype=object)
+        return cls(ips, services, list(codes), cpu, memory)
+
+    @staticmethod
+    def _metric_summary(
+        values: "np.ndarray",
+        ips: "np.ndarray",
+        codes: "np.ndarray",
+        sizes: "np.ndarray",
+    ) -> Tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+        """Min, quartiles, max and the ips owning min and max of a metric per service.
+
+        Within each service the latest server wins ties, as in the exact backend.
+        """
+        position = np.arange(len(values))
+        # ascending values, latest server first among equal values
+        by_min = np.lexsort((-position, values, codes))
+        # ascending values, latest server last among equal values
+        by_max = np.lexsort((position, values, codes))
+        starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+        present = sizes > 0
+        first = starts[present]
+        last = first + sizes[present] - 1
+
+        count = len(sizes)
+        quantiles = np.zeros((count, 5))
+        quantiles[present, 0] = values[by_max[first]]
+        quantiles[present, 4] = values[by_max[last]]
+        argmin = np.full(count, "", dtype=object)
+        argmax = np.full(count, "", dtype=object)
+        argmin[present] = ips[by_min[first]]
+        argmax[present] = ips[by_max[last]]
+
+        # same interpolation as statistics.quantiles(n=4, method="exclusive")
+        large = sizes >= 4
+        n = sizes[large]
+        sorted_values = values[by_max].astype(np.float64)
+        m = n + 1
+        for i in range(1, 4):
+            j = np.clip(i * m // 4, 1, n - 1)
+            delta = i * m - j * 4
+            lower = sorted_values[starts[large] + j - 1]
+            upper = sorted_values[starts[large] + j]
+            quantiles[large, i] = (lower * (4 - delta) + upper * delta) / 4
+        return quantiles, argmin, argmax
+
+    def summary(self, mode: str) -> List[SummaryResultLine]:
+        """Creates a summary of each service, as `ResultsCompiler.summary` does."""
+        assert mode in ("simple", "complete")
+        valid = (self.cpu >= 0) & (self.memory >= 0)
+        codes = self.services[valid]
+        ips = self.ips[valid]
+        sizes = np.bincount(codes, minlength=len(self.service_names))
+
+        cpu, ip_cpu_min, ip_cpu_max = self._metric_summary(
+            self.cpu[valid], ips, codes, sizes
+        )
+        memory, ip_memory_min, ip_memory_max = self._metric_summary(
+            self.memory[valid], ips, codes, sizes
+        )
+        grouped_ips = np.split(
+            ips[np.argsort(codes, kind="stable")], np.cumsum(sizes)[:-1]
+        )
+
+        return [
+            SummaryResultLine(
+                service=service,
+                total_servers=int(sizes[code]),
+                ips=grouped_ips[code].tolist(),
+                ip_cpu_min=ip_cpu_min[code],
+                ip_cpu_max=ip_cpu_max[code],
+                ip_memory_min=ip_memory_min[code],
+                ip_memory_max=ip_memory_max[code],
+                cpu_min=float(cpu[code, 0]),
+                cpu_p25=float(cpu[code, 1]),
+                cpu_p50=float(cpu[code, 2]),
+                cpu_p75=float(cpu[code, 3]),
+                cpu_max=float(cpu[code, 4]),
+                memory_min=float(memory[code, 0]),
+                memory_p25=float(memory[code, 1]),
+                memory_p50=float(memory[code, 2]),
+                memory_p75=float(memory[code, 3]),
+                memory_max=float(memory[code, 4]),
+                mode=mode,
+            )
+            for code, service in enumerate(self.service_names)
+        ]
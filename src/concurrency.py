@@ -0,0 +1,82 @@
+import asyncio
+from collections import deque
+from time import monotonic
+from typing import Callable, Deque, Optional
+
+
+class AdaptiveLimiter:
+    """Limits concurrent requests, adapting the limit to how the server copes (AIMD).
+
+    Every request completing in time without error raises the limit by
+    `1 / limit`, that is by about one per round of requests (additive
+    increase). A failure or a response slower than `latency_target` seconds
+    multiplies it by `backoff` (multiplicative decrease), at most once per
+    `latency_target` so that a burst of failures from the same round only
+    counts once. The limit stays between `min_limit` and `max_limit`.
+    """
+
+    def __init__(
+        self,
+        max_limit: int,
+        initial_limit: Optional[int] = None,
+        min_limit: int = 1,
+        latency_target: float = 1.0,
+        backoff: float = 0.5,
+        clock: Callable[[], float] = monotonic,
+    ) -> None:
+        assert 0 < min_limit <= max_limit, f"invalid limits: {min_limit}, {max_limit}"
+        assert latency_target > 0, f"invalid latency target: {latency_target}"
+        assert 0 < backoff < 1, f"invalid backoff: {backoff}"
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(max_limit if initial_limit is None else initial_limit)
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.clock = clock
+        self.inflight = 0
+        self._decreased_at = None
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    async def acquire(self) -> None:
+        """Waits until a request can be sent within the current limit."""
+        while self.inflight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                else:
+                    # passes on the slot this waiter was woken up for
+                    self._wake()
+                raise
+        self.inflight += 1
+
+    def release(self, latency: float, failed: bool = False) -> None:
+        """Ends a request, adapting the limit to its latency and outcome."""
+        self.inflight -= 1
+        if failed or latency > self.latency_target:
+            now = self.clock()
+            if (
+                self._decreased_at is None
+                or now - self._decreased_at >= self.latency_target
+            ):
+                self._decreased_at = now
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        self._wake()
+
+    def cancel(self) -> None:
+        """Ends a request abandoned before completing, leaving the limit as is."""
+        self.inflight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        available = int(self.limit) - self.inflight
+        while available > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                available -= 1
@@ -4,11 +4,18 @@ import asyncio
 from dataclasses import dataclass
 import logging
 import sys
-from json import dumps, loads
-from typing import Any, Dict, List
+from functools import partial
+from json import dumps
+from time import monotonic
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, TypeVar
 from urllib.parse import urljoin
 import aiohttp
-from aiohttp import ClientSession
+from aiohttp import ClientSession, ClientTimeout, TCPConnector, hdrs
+
+from src.circuit_breaker import CircuitBreaker
+from src.concurrency import AdaptiveLimiter
+from src.decoding import Decoder, InvalidPayload
+from src.server_data import ServerData
 
 
 # this logger is useful only for debugging purposes, improvement is necessary
@@ -22,47 +29,101 @@ logging.basicConfig(
 logger = logging.getLogger("cpx-client")
 logging.getLogger("chardet.charsetprober").disabled = True
 
+T = TypeVar("T")
+
+# decodes responses with the fastest json library available
+DECODER = Decoder()
+
+
+class CpxClientError(Exception):
+    """Base of the errors raised by requests to CPX."""
+
+    pass
+
 
-class CpxClientCannotConnect(Exception):
+class CpxClientCannotConnect(CpxClientError):
     """Used to inform that CPX server is unreachable."""
 
     pass
 
 
-class CpxClientBadRequest(Exception):
+class CpxClientTimeout(CpxClientCannotConnect):
+    """Used to inform that CPX server did not respond in time."""
+
+    pass
+
+
+class CpxClientBadRequest(CpxClientError):
     """Used to inform an error in the request."""
 
     pass
 
 
-async def fetch_servers(url: str, session: ClientSession) -> List[str]:
-    """Returns a list of servers ips from CPX."""
-    response = []
-    try:
-        resp = await session.get(url)
-        resp.raise_for_status()
-        logger.info("Got response [%s] for URL: %s", resp.status, url)
-        response_text = await resp.text()
-        response = loads(response_text)
-    except aiohttp.client_exceptions.ClientConnectorError as error:
-        logger.error("Could not connect to URL: %s, error: %s", url, str(error))
-    except aiohttp.client_exceptions.ClientResponseError as error:
-        logger.info(
-            "Got response [%s] for URL: %s, error: %s", resp.status, url, str(error)
-        )
-    finally:
-        return response
+class CpxClientServerError(CpxClientBadRequest):
+    """Used to inform that CPX server failed to handle the request."""
+
+    pass
+
+
+class CpxClientCircuitOpen(CpxClientError):
+    """Used to inform that a request was not sent because CPX keeps failing."""
+
+    pass
+
+
+class ValidatedBody(NamedTuple):
+    """The raw body of a response along with its validators, if any."""
+
+    body: bytes
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+    @property
+    def validated(self) -> bool:
+        """Whether CPX can tell if the response changed since."""
+        return self.etag is not None or self.last_modified is not None
 
+    def conditions(self) -> Dict[str, str]:
+        """Headers asking CPX to answer only if the response changed."""
+        headers = {}
+        if self.etag is not None:
+            headers[hdrs.IF_NONE_MATCH] = self.etag
+        if self.last_modified is not None:
+            headers[hdrs.IF_MODIFIED_SINCE] = self.last_modified
+        return headers
 
-async def fetch_details(url: str, session: ClientSession) -> Dict[str, str]:
-    """Returns details of a server from CPX."""
+
+async def read_body(url: str, session: ClientSession) -> bytes:
+    """Returns the raw body of a response from CPX."""
+    return (await read_validated(url, session)).body
+
+
+async def read_validated(
+    url: str, session: ClientSession, previous: Optional[ValidatedBody] = None
+) -> ValidatedBody:
+    """Returns the raw body of a response from CPX, with its validators.
+
+    Given a previous response, the request is conditional and the previous
+    response itself is returned when CPX answers that it did not change.
+    """
+    headers = None if previous is None else previous.conditions()
     try:
-        resp = await session.get(url)
+        resp = await session.get(url, headers=headers)
         resp.raise_for_status()
         logger.info("Got response [%s] for URL: %s", resp.status, url)
-        response_text = await resp.text()
-        return loads(response_text)
-    except aiohttp.client_exceptions.ClientConnectorError as error:
+        if resp.status == 304 and previous is not None:
+            resp.release()
+            return previous
+        return ValidatedBody(
+            await resp.read(),
+            resp.headers.get(hdrs.ETAG),
+            resp.headers.get(hdrs.LAST_MODIFIED),
+        )
+    except asyncio.TimeoutError as error:
+        message = "Timed out on URL: %s, error: %s", url, str(error)
+        logger.error(message)
+        raise CpxClientTimeout(message)
+    except aiohttp.client_exceptions.ClientConnectionError as error:
         message = "Could not connect to URL: %s, error: %s", url, str(error)
         logger.error(message)
         raise CpxClientCannotConnect(message)
@@ -74,17 +135,92 @@ async def fetch_details(url: str, session: ClientSession) -> Dict[str, str]:
             str(error),
         )
         logger.error(message)
+        if error.status >= 500:
+            raise CpxClientServerError(message)
+        raise CpxClientBadRequest(message)
+
+
+def decode_body(url: str, decode: Callable[[bytes], T], body: bytes) -> T:
+    """Decodes the body of a response, raising a bad request if it is malformed."""
+    try:
+        return decode(body)
+    except InvalidPayload as error:
+        message = "Invalid response for URL: %s, error: %s", url, str(error)
+        logger.error(message)
         raise CpxClientBadRequest(message)
 
 
 class CpxClient:
-    """Provides an interface for asynchronously fetching servers and details."""
+    """Provides an interface for asynchronously fetching servers and details.
+
+    The client owns a single pooled ``ClientSession`` that is reused by every
+    request, it can be used as an async context manager or explicitly opened
+    and closed.
+
+    Every request times out after `total_timeout` seconds, including the wait
+    for a pooled connection, with tighter limits on establishing a connection
+    (`connect_timeout`) and on each read from it (`read_timeout`).
 
-    def __init__(self, host: str, port: int, ip_version: int = 4) -> None:
+    Requests go through a circuit breaker, refusing them for `breaker_reset`
+    seconds after `breaker_threshold` consecutive failures, and through an
+    adaptive limit of up to `max_concurrency` concurrent requests, which
+    shrinks when responses fail or take longer than `latency_target`
+    seconds. Either can be disabled with a value of 0.
+
+    The client remembers the validators (ETag, Last-Modified) of responses
+    and, unless `conditional` is False, asks CPX to answer only if a response
+    changed since, reusing the body it already has on a 304 Not Modified.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        ip_version: int = 4,
+        limit: int = 100,
+        limit_per_host: int = 0,
+        keepalive_timeout: float = 30.0,
+        connect_timeout: float = 3.0,
+        read_timeout: float = 5.0,
+        total_timeout: float = 10.0,
+        max_concurrency: int = 0,
+        latency_target: float = 1.0,
+        breaker_threshold: int = 5,
+        breaker_reset: float = 5.0,
+        conditional: bool = True,
+    ) -> None:
         assert ip_version in (4, 6), f"invalid ip version: {ip_version}"
+        assert limit >= 0, f"invalid connection limit: {limit}"
+        assert limit_per_host >= 0, f"invalid per host limit: {limit_per_host}"
         self.host = host
         self.port = port
         self.ip_version = ip_version
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = ClientTimeout(
+            total=total_timeout, sock_connect=connect_timeout, sock_read=read_timeout
+        )
+        self.limiter = None
+        if max_concurrency > 0 and latency_target > 0:
+            self.limiter = AdaptiveLimiter(
+                max_concurrency, latency_target=latency_target
+            )
+        self.breaker = None
+        if breaker_threshold > 0:
+            self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+        self.decoder = DECODER
+        self.conditional = conditional
+        self.validated: Dict[str, ValidatedBody] = {}
+        self.not_modified = 0
+        self._session = None
+
+    async def __aenter__(self) -> "CpxClient":
+        await self.open()
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        await self.close()
 
     @property
     def base_url(self) -> str:
@@ -93,16 +229,103 @@ class CpxClient:
             return f"http://{self.host}:{self.port}"
         return f"http://[{self.host}]:{self.port}"
 
+    @property
+    def session(self) -> ClientSession:
+        """The pooled session shared by all requests, created on first use."""
+        if self._session is None or self._session.closed:
+            connector = TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self._session = ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+    async def open(self) -> None:
+        """Creates the pooled session ahead of the first request."""
+        self.session
+
+    async def close(self) -> None:
+        """Closes the pooled session and all its connections."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
     def get_url(self, path: str) -> str:
         """Builds a full URL."""
         return urljoin(self.base_url, path)
 
+    async def request(self, path: str) -> bytes:
+        """Returns the body of a response, through the breaker and concurrency limit."""
+        limiter = self.limiter
+        if limiter is not None:
+            await limiter.acquire()
+        # asked once a slot is held, so that no await can take the probe slot
+        # of a half-open breaker without giving it back
+        breaker = self.breaker
+        if breaker is not None and not breaker.allow():
+            if limiter is not None:
+                limiter.cancel()
+            raise CpxClientCircuitOpen(f"Circuit open, not requesting: {path}")
+        start = monotonic()
+        failed = None
+        try:
+            body = await self._read(self.get_url(path))
+            failed = False
+            return body
+        except (CpxClientCannotConnect, CpxClientServerError):
+            failed = True
+            raise
+        except CpxClientBadRequest:
+            # the server is healthy enough to reject the request
+            failed = False
+            raise
+        finally:
+            latency = monotonic() - start
+            if limiter is not None:
+                if failed is None:
+                    limiter.cancel()
+                else:
+                    limiter.release(latency, failed)
+            if breaker is not None:
+                if failed is None:
+                    breaker.record_cancelled()
+                elif failed:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+
+    async def _read(self, url: str) -> bytes:
+        if not self.conditional:
+            return await read_body(url, self.session)
+        previous = self.validated.get(url)
+        response = await read_validated(url, self.session, previous)
+        if response is previous:
+            self.not_modified += 1
+        elif response.validated:
+            self.validated[url] = response
+        else:
+            self.validated.pop(url, None)
+        return response.body
+
+    async def get_servers(self) -> List[str]:
+        """Asynchronously fetches servers from CPX, raising if they cannot be."""
+        body = await self.request("servers")
+        return decode_body("servers", self.decoder.servers, body)
+
     async def fetch_servers(self) -> List[str]:
-        """Asynchronously fetches servers from CPX."""
-        async with ClientSession() as session:
-            return await fetch_servers(self.get_url("servers"), session)
+        """Asynchronously fetches servers from CPX, none if they cannot be."""
+        try:
+            return await self.get_servers()
+        except CpxClientError:
+            return []
 
     async def fetch_details(self, server: str) -> Dict[str, str]:
         """Asynchronously fetches details of a server from CPX."""
-        async with ClientSession() as session:
-            return await fetch_details(self.get_url(server), session)
+        body = await self.request(server)
+        return decode_body(server, self.decoder.details, body)
+
+    async def fetch_server(self, server: str) -> ServerData:
+        """Asynchronously fetches the details of a server, parsed."""
+        body = await self.request(server)
+        return decode_body(server, partial(self.decoder.server, server), body)
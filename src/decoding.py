@@ -0,0 +1,113 @@
+from json import loads
+from typing import Dict, List, Optional, Union
+
+try:
+    import msgspec
+except ImportError:  # msgspec is an optional dependency
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:  # orjson is an optional dependency
+    orjson = None
+
+from src.server_data import ServerData, parse_percentage
+
+
+class InvalidPayload(ValueError):
+    """Used to inform that a CPX response does not have the expected shape."""
+
+    pass
+
+
+if msgspec is not None:
+
+    class Details(msgspec.Struct):
+        """Schema of the details of a server reported by CPX."""
+
+        cpu: Optional[Union[str, int]] = None
+        memory: Optional[Union[str, int]] = None
+        service: Optional[str] = None
+
+
+def available_backends() -> List[str]:
+    """The json libraries that can be used, fastest first."""
+    backends = []
+    if msgspec is not None:
+        backends.append("msgspec")
+    if orjson is not None:
+        backends.append("orjson")
+    backends.append("json")
+    return backends
+
+
+class Decoder:
+    """Decodes CPX responses straight from the bytes of their bodies.
+
+    The fastest available json library is used by default: msgspec validates
+    the details against a typed schema while decoding, orjson and the
+    standard library decode into dicts that are validated afterwards. Either
+    way percentages are parsed into ints once, no text is decoded up front,
+    and malformed payloads raise `InvalidPayload`.
+    """
+
+    def __init__(self, backend: Optional[str] = None) -> None:
+        backends = available_backends()
+        if backend is None:
+            backend = backends[0]
+        assert backend in backends, f"unavailable json backend: {backend}"
+        self.backend = backend
+        if backend == "msgspec":
+            self._servers = msgspec.json.Decoder(List[str])
+            self._details = msgspec.json.Decoder(Details)
+
+    def _loads(self, body: bytes):
+        try:
+            if self.backend == "orjson":
+                return orjson.loads(body)
+            return loads(body)
+        except ValueError as error:
+            raise InvalidPayload(f"invalid json: {error}") from error
+
+    def servers(self, body: bytes) -> List[str]:
+        """Decodes the list of servers ips."""
+        if self.backend == "msgspec":
+            try:
+                return self._servers.decode(body)
+            except msgspec.DecodeError as error:
+                raise InvalidPayload(f"invalid servers: {error}") from error
+        servers = self._loads(body)
+        if not isinstance(servers, list) or not all(
+            isinstance(ip, str) for ip in servers
+        ):
+            raise InvalidPayload(f"invalid servers: {servers!r}")
+        return servers
+
+    def details(self, body: bytes) -> Dict[str, str]:
+        """Decodes the details of a server as reported by CPX."""
+        details = self._loads(body)
+        if not isinstance(details, dict):
+            raise InvalidPayload(f"invalid details: {details!r}")
+        return details
+
+    def server(self, ip: str, body: bytes) -> ServerData:
+        """Decodes the details of a server into its parsed data."""
+        if self.backend == "msgspec":
+            try:
+                details = self._details.decode(body)
+            except msgspec.DecodeError as error:
+                raise InvalidPayload(f"invalid details: {error}") from error
+            cpu, memory, service = details.cpu, details.memory, details.service
+        else:
+            details = self.details(body)
+            cpu = details.get("cpu")
+            memory = details.get("memory")
+            service = details.get("service")
+            if not isinstance(service, (str, type(None))):
+                raise InvalidPayload(f"invalid service: {service!r}")
+        try:
+            return ServerData.from_values(
+                ip, parse_percentage(cpu), parse_percentage(memory), service
+            )
+        except (AttributeError, ValueError) as error:
+            raise InvalidPayload(f"invalid details: {error}") from error
@@ -0,0 +1,232 @@
+import asyncio
+import gzip
+from time import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from aiohttp import web
+
+from src.cpx_client import logger
+from src.result_lines import SummaryResultLine
+from src.scheduler import Ticker
+from src.server_data import ServerData
+from src.watcher import Watcher
+
+
+# content types of the prometheus text format and of openmetrics, which only
+# differ by the end of exposition marker
+TEXT_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+OPENMETRICS_EOF = b"# EOF\n"
+# quantile labels of the statistics of services, with their attributes
+QUANTILES = (
+    ("0", "min"),
+    ("0.25", "p25"),
+    ("0.5", "p50"),
+    ("0.75", "p75"),
+    ("1", "max"),
+)
+
+
+def escape_label(value: str) -> str:
+    """A label value escaped as the exposition formats require."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def server_labels(server: ServerData) -> str:
+    """The labels of the gauges of a server."""
+    return (
+        f'{{ip="{escape_label(server.ip)}",service="{escape_label(server.service)}"}}'
+    )
+
+
+def metric_family(name: str, help: str, samples: Iterable[Tuple[str, float]]) -> str:
+    """The help, type and samples (labels and value) of a gauge."""
+    lines = [f"# HELP {name} {help}\n", f"# TYPE {name} gauge\n"]
+    lines.extend([f"{name}{labels} {value}\n" for labels, value in samples])
+    return "".join(lines)
+
+
+def render_metrics(
+    summaries: List[SummaryResultLine],
+    servers: Iterable[ServerData],
+    status: Dict[str, Tuple[str, float]],
+) -> str:
+    """The metrics of the fleet in the prometheus text format.
+
+    Status gives the help and value of the `cpx_<name>` gauges about polling.
+    Servers without samples have no gauges of their own.
+    """
+    families = [
+        metric_family(f"cpx_{name}", help, [("", value)])
+        for name, (help, value) in status.items()
+    ]
+    labels = [
+        (summary, f'service="{escape_label(summary.service)}"') for summary in summaries
+    ]
+    families.append(
+        metric_family(
+            "cpx_service_servers",
+            "Number of servers of the service.",
+            [(f"{{{label}}}", summary.total_servers) for summary, label in labels],
+        )
+    )
+    families.append(
+        metric_family(
+            "cpx_service_healthy",
+            "Whether the service has more than one server (1) or not (0).",
+            [
+                (f"{{{label}}}", int(summary.status == "Healthy"))
+                for summary, label in labels
+            ],
+        )
+    )
+    for metric in ("cpu", "memory"):
+        families.append(
+            metric_family(
+                f"cpx_service_{metric}_percent",
+                f"Quantiles of the {metric} usage of the servers of the service.",
+                [
+                    (
+                        f'{{{label},quantile="{quantile}"}}',
+                        getattr(summary, f"{metric}_{attribute}"),
+                    )
+                    for summary, label in labels
+                    for quantile, attribute in QUANTILES
+                ],
+            )
+        )
+    samples = [
+        (server_labels(server), server)
+        for server in servers
+        if server.cpu >= 0 and server.memory >= 0
+    ]
+    for metric in ("cpu", "memory"):
+        families.append(
+            metric_family(
+                f"cpx_server_{metric}_percent",
+                f"The latest {metric} usage of the server.",
+                [(label, getattr(server, metric)) for label, server in samples],
+            )
+        )
+    return "".join(families)
+
+
+class Exporter:
+    """Serves metrics of the fleet to any number of scrapers, from one poll loop.
+
+    CPX is polled by a watcher on the cadence of a ticker, in the background,
+    and the metrics are rendered once per poll (along with their gzipped
+    variants as they are asked for), so that a scrape only sends bytes
+    already at hand: its latency does not depend on the size of the fleet nor
+    on CPX, and scrapers add no load to CPX.
+    """
+
+    def __init__(
+        self, watcher: Watcher, ticker: Ticker, server_metrics: bool = True
+    ) -> None:
+        self.watcher = watcher
+        self.ticker = ticker
+        self.server_metrics = server_metrics
+        self.polled_at = 0.0
+        self.poll_duration = 0.0
+        self.scrapes = 0
+        self.body = b""
+        self._variants: Dict[Tuple[bool, bool], bytes] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.render()
+
+    @property
+    def status(self) -> Dict[str, Tuple[str, float]]:
+        """The help and value of the gauges about polling."""
+        watcher = self.watcher
+        return {
+            "up": (
+                "Whether the latest poll got fresh data from CPX (1) or not (0).",
+                int(self.polled_at > 0 and not watcher.stale),
+            ),
+            "last_poll_timestamp_seconds": (
+                "When the latest poll ended, in seconds since the epoch.",
+                self.polled_at,
+            ),
+            "poll_duration_seconds": (
+                "Seconds the latest poll took.",
+                round(self.poll_duration, 6),
+            ),
+            "servers": ("Number of servers listed by CPX.", len(watcher.server_ips)),
+            "servers_polled": (
+                "Number of servers whose details the latest poll got.",
+                watcher.refreshed,
+            ),
+            "servers_failed": (
+                "Number of servers whose details the latest poll failed to get.",
+                watcher.failed,
+            ),
+        }
+
+    def render(self) -> None:
+        """Renders the metrics of the latest poll."""
+        watcher = self.watcher
+        servers = watcher.aggregator.servers.values() if self.server_metrics else []
+        self.body = render_metrics(watcher.lines, servers, self.status).encode()
+        self._variants = {}
+
+    def variant(self, openmetrics: bool, compressed: bool) -> bytes:
+        """The metrics in a format, maybe gzipped, rendered once per poll."""
+        key = (openmetrics, compressed)
+        body = self._variants.get(key)
+        if body is None:
+            body = self.body + OPENMETRICS_EOF if openmetrics else self.body
+            if compressed:
+                body = gzip.compress(body, compresslevel=6)
+            self._variants[key] = body
+        return body
+
+    async def poll(self, deadline: Optional[float] = None) -> None:
+        """Polls CPX once, then renders the metrics."""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            await self.watcher.refresh(deadline)
+        except Exception:
+            # the loop carries on, serving the last good metrics
+            logger.exception("Could not poll CPX")
+            return
+        self.poll_duration = loop.time() - started
+        self.polled_at = time()
+        self.render()
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        """Answers a scrape with the metrics of the latest poll."""
+        self.scrapes += 1
+        openmetrics = "application/openmetrics-text" in request.headers.get(
+            "Accept", ""
+        )
+        compressed = "gzip" in request.headers.get("Accept-Encoding", "")
+        headers = {
+            "Content-Type": OPENMETRICS_CONTENT_TYPE
+            if openmetrics
+            else TEXT_CONTENT_TYPE
+        }
+        if compressed:
+            headers["Content-Encoding"] = "gzip"
+        return web.Response(body=self.variant(openmetrics, compressed), headers=headers)
+
+    async def start(self, _: web.Application) -> None:
+        """Opens the connections to CPX and starts the poll loop."""
+        await self.watcher.fetcher.open()
+        self._task = asyncio.ensure_future(self.ticker.run(self.poll))
+
+    async def stop(self, _: web.Application) -> None:
+        """Stops the poll loop and closes the connections to CPX."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        await self.watcher.fetcher.close()
+
+    def create_app(self) -> web.Application:
+        """The web application serving the metrics on /metrics."""
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_metrics)
+        app.on_startup.append(self.start)
+        app.on_cleanup.append(self.stop)
+        return app
@@ -1,64 +1,235 @@
 import asyncio
 from dataclasses import dataclass
 from json import dumps
-from typing import Dict, List
+from typing import AsyncIterator, Collection, Dict, List, Optional, Type
 
-from src.cpx_client import CpxClient, CpxClientCannotConnect
+from src.cache import CachedCpxClient, ResponseCache
+from src.cpx_client import CpxClient, CpxClientError
 from src.printer import Printer
 from src.results_compiler import ResultsCompiler
-from src.server_data import ServerData
+from src.retry import (
+    DEFAULT_POLICIES,
+    MIN_RETRIES,
+    RetryBudget,
+    RetryPolicy,
+    policy_for,
+)
+from src.scheduler import Scheduler
+from src.server_data import MISSING, ServerData
+from src.service_index import ServiceIndex
+from src.services_aggregator import ServicesAggregator
 
 
 class Fetcher:
     """Fetches and compiles servers and services from CPX API"""
 
-    def __init__(self, host: str, port: int, ip_version: int) -> None:
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        ip_version: int,
+        limit: int = 100,
+        limit_per_host: int = 0,
+        keepalive_timeout: float = 30.0,
+        max_inflight: int = 100,
+        rate_limit: float = 0.0,
+        stats_backend: str = "exact",
+        connect_timeout: float = 3.0,
+        read_timeout: float = 5.0,
+        total_timeout: float = 10.0,
+        retry_budget: float = 0.1,
+        latency_target: float = 1.0,
+        breaker_threshold: int = 0,
+        breaker_reset: float = 5.0,
+        cache: Optional[ResponseCache] = None,
+        servers_ttl: float = 30.0,
+        details_ttl: float = 5.0,
+        stale_ttl: float = 30.0,
+    ) -> None:
         self.host = host
         self.port = port
         self.ip_version = ip_version
+        self.stats_backend = stats_backend
+        self.retry_budget = retry_budget
+        client_options = dict(
+            limit=limit,
+            limit_per_host=limit_per_host,
+            keepalive_timeout=keepalive_timeout,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            total_timeout=total_timeout,
+            max_concurrency=max_inflight,
+            latency_target=latency_target,
+            breaker_threshold=breaker_threshold,
+            breaker_reset=breaker_reset,
+        )
+        if cache is None:
+            self.client = CpxClient(host, port, ip_version, **client_options)
+        else:
+            self.client = CachedCpxClient(
+                host,
+                port,
+                ip_version,
+                cache=cache,
+                servers_ttl=servers_ttl,
+                details_ttl=details_ttl,
+                stale_ttl=stale_ttl,
+                **client_options,
+            )
+        self.scheduler = Scheduler(max_inflight, rate_limit)
+
+    async def __aenter__(self) -> "Fetcher":
+        await self.open()
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        await self.close()
+
+    async def open(self) -> None:
+        """Prepares the client, with its connection pool and cache."""
+        await self.client.open()
+
+    async def close(self) -> None:
+        """Releases the connection pool held by the client."""
+        await self.client.close()
+
+    def budget(self, requests: int) -> RetryBudget:
+        """The retry budget of a batch of requests, allowing one retry of each.
+
+        The requests of a batch can all time out together when CPX is briefly
+        overloaded by the batch itself: as the concurrency limit shrinks
+        meanwhile, their retries are not sent at once.
+        """
+        return RetryBudget(self.retry_budget, max(MIN_RETRIES, requests))
 
     async def fetch_all(self) -> List[ServerData]:
         """Fetches a list of servers ips and corresponding details of each one from CPX."""
-        client = CpxClient(self.host, self.port, self.ip_version)
+        client = self.client
         server_ips = await client.fetch_servers()
         if len(server_ips) > 0:
-            tasks = [self.fetch_details(client, ip) for ip in server_ips]
-            return await asyncio.gather(*tasks)
+            budget = self.budget(len(server_ips))
+            return await self.scheduler.map(
+                lambda ip: self.fetch_details(client, ip, budget), server_ips
+            )
         return []
 
+    async def iter_details(
+        self, server_ips: Optional[List[str]] = None
+    ) -> AsyncIterator[ServerData]:
+        """Yields details of each server from CPX as soon as they are fetched.
+
+        The list of servers is fetched from CPX unless it is provided. Retries
+        of all servers share one budget.
+        """
+        client = self.client
+        if server_ips is None:
+            server_ips = await client.fetch_servers()
+        budget = self.budget(len(server_ips))
+        async for server in self.scheduler.as_completed(
+            lambda ip: self.fetch_details(client, ip, budget), server_ips
+        ):
+            yield server
+
+    async def iter_service_details(
+        self, services: Collection[str], index: ServiceIndex
+    ) -> AsyncIterator[ServerData]:
+        """Yields details of the servers of some services as soon as they are fetched.
+
+        Only the servers the index does not rule out are polled, and the index
+        is updated with what they report. Servers whose details could not be
+        fetched are yielded if the index places them in one of the services.
+        """
+        server_ips = await self.client.fetch_servers()
+        if len(server_ips) > 0:
+            # an empty list is a failure to get it, not an empty fleet
+            index.retain(server_ips)
+        async for server in self.iter_details(index.select(services, server_ips)):
+            if server.missing:
+                if index.service(server.ip) in services:
+                    yield server
+                continue
+            index.record(server)
+            if server.service in services:
+                yield server
+
     @staticmethod
     async def fetch_details(
-        client: CpxClient, ip: str, retry: int = 5, delay: int = 1, backoff: int = 2
+        client: CpxClient,
+        ip: str,
+        budget: Optional[RetryBudget] = None,
+        policies: Dict[Type[CpxClientError], RetryPolicy] = DEFAULT_POLICIES,
     ) -> ServerData:
-        """Fetches details of a single server from CPX with retry and backoff mechanism."""
-        while retry > 0:
+        """Fetches details of a single server from CPX, retrying with jittered backoff.
+
+        Failures are retried as their error class policy allows, as long as the
+        retry budget shared by the run is not exhausted. Servers whose details
+        could not be fetched are reported with unknown metrics and service.
+        """
+        if budget is None:
+            budget = RetryBudget()
+        budget.request()
+        attempt = 0
+        while True:
             try:
-                details = await client.fetch_details(ip)
-                return ServerData(ip, details)
-            except CpxClientCannotConnect:
-                retry -= 1
-                delay *= backoff
-                await asyncio.sleep(delay)
-        return ServerData(
-            ip,
-            {
-                "cpu": None,
-                "memory": None,
-                "service": None,
-            },
-        )
+                return await client.fetch_server(ip)
+            except CpxClientError as error:
+                policy = policy_for(error, policies)
+                if attempt >= policy.retries or not budget.try_spend():
+                    return ServerData.from_values(ip, MISSING, MISSING, None)
+                await asyncio.sleep(policy.delay(attempt, budget.random))
+                attempt += 1
 
     async def display_once(
-        self, format: str, details: str, mode: str = "complete", window=None
+        self,
+        format: str,
+        details: str,
+        mode: str = "complete",
+        screen=None,
+        typed: bool = False,
+        services: Optional[Collection[str]] = None,
+        index: Optional[ServiceIndex] = None,
     ) -> None:
-        """Prints all information fetchable from CPX to stdout."""
-        assert format in ("csv", "json", "table")
+        """Prints all information fetchable from CPX to stdout.
+
+        Servers are processed as they arrive: summaries only keep the
+        statistics aggregated so far (except for the columnar backend, which
+        computes them in bulk), and full csv/json reports in simple mode are
+        printed line by line without waiting for the slowest server.
+
+        Typed csv/json reports keep numbers and lists of ips as such.
+
+        Given services, only their servers are reported, and only the servers
+        that the service index does not rule out are polled.
+        """
+        assert format in ("csv", "json", "ndjson", "table")
         assert details in ("summary", "full")
 
-        results = await self.fetch_all()
-        if details == "summary":
-            compiled_results = ResultsCompiler.summary(results, mode)
-            Printer.print_summary(compiled_results, format, window)
+        def iter_details() -> AsyncIterator[ServerData]:
+            if services is None:
+                return self.iter_details()
+            return self.iter_service_details(
+                services, ServiceIndex() if index is None else index
+            )
+
+        if details == "summary" and self.stats_backend == "columnar":
+            results = [server async for server in iter_details()]
+            compiled_results = ResultsCompiler.summary(
+                results, mode, self.stats_backend
+            )
+            Printer.print_summary(compiled_results, format, screen, typed=typed)
+        elif details == "summary":
+            aggregator = ServicesAggregator()
+            async for server in iter_details():
+                aggregator.add(server)
+            compiled_results = ResultsCompiler.summary_from_aggregator(aggregator, mode)
+            Printer.print_summary(compiled_results, format, screen, typed=typed)
+        elif format != "table" and mode == "simple":
+            lines = (
+                ResultsCompiler.full_line(server, mode)
+                async for server in iter_details()
+            )
+            await Printer.stream_full(lines, format, typed)
         else:
-            compiled_results = ResultsCompiler.full(results, mode)
-            Printer.print_full(compiled_results, format)
+            results = [server async for server in iter_details()]
+            compiled_results = ResultsCompiler.full(results, mode, self.stats_backend)
+            Printer.print_full(compiled_results, format, typed)
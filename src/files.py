@@ -0,0 +1,15 @@
+import os
+from pathlib import Path
+
+
+def replace_file(path: Path, content: str) -> None:
+    """Writes a file at once, so that readers never see it partly written.
+
+    The content goes to a temporary file of this process next to it, which
+    then replaces the file, creating its directory if needed.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_suffix(f".{os.getpid()}.tmp")
+    with open(temporary, "w") as file:
+        file.write(content)
+    os.replace(temporary, path)
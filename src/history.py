@@ -0,0 +1,382 @@
+import asyncio
+import fcntl
+import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from struct import Struct
+from typing import Deque, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from src.cache import DEFAULT_CACHE_DIR
+from src.cpx_client import logger
+from src.result_lines import AggregateResultLine, SampleResultLine
+from src.rings import RingFile
+from src.rollups import TIERS, Aggregate, RollupTier
+from src.server_data import ServerData
+
+
+# where samples of each cpx api are kept by default
+DEFAULT_HISTORY_DIR = DEFAULT_CACHE_DIR / "history"
+META_FILE = "meta.json"
+INDEX_FILE = "servers.tsv"
+SERVICES_FILE = "services.tsv"
+SAMPLES_FILE = "samples.ring"
+LOCK_FILE = "lock"
+
+# tick, cpu and memory of a sample
+RECORD = Struct("<Ihh")
+
+
+def history_dir(host: str, port: int) -> Path:
+    """The default directory of the samples of a cpx api."""
+    return DEFAULT_HISTORY_DIR / f"{host}_{port}"
+
+
+class Sample(NamedTuple):
+    """The metrics of a server at a given time (epoch seconds)."""
+
+    timestamp: float
+    cpu: int
+    memory: int
+
+
+def read_index(path: Path) -> Tuple[List[str], int]:
+    """The complete lines of an index, if any, and their size in bytes.
+
+    A last line without a newline is still being written, and is left out.
+    """
+    if not path.exists():
+        return [], 0
+    content = path.read_bytes()
+    size = content.rfind(b"\n") + 1
+    return content[:size].decode().splitlines(), size
+
+
+class SampleStore:
+    """On-disk time series of server samples, in memory-mapped ring buffers.
+
+    Each server gets a ring of fixed-size records covering `retention`
+    seconds at one sample every `resolution` seconds, all rings being laid
+    out in a single memory-mapped file. A sample goes to the slot of its
+    tick (its time in units of the resolution) modulo the size of the ring,
+    so that writing it is a single `pack_into`. Servers and services are
+    given rings in order of appearance, kept in append-only indexes.
+
+    As samples are recorded, they are also added to the per-service rollup
+    tiers (`TIERS`), which keep histograms of longer periods.
+
+    Retention and resolution are fixed when the store is created, and taken
+    from it when opening an existing one without specifying them.
+
+    Rings are assigned in memory, so a store has a single writer: unless
+    opened as a reader, it holds an exclusive lock on its directory while
+    open. Readers only read its files, as they are when it is opened, and
+    can do so while it is being written.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        retention: Optional[float] = None,
+        resolution: Optional[float] = None,
+        reader: bool = False,
+    ) -> None:
+        self.directory = directory
+        self.reader = reader
+        self.retention = retention
+        self.resolution = resolution
+        self.servers: Dict[str, str] = {}
+        self.rings: Dict[str, int] = {}
+        self.service_rings: Dict[str, int] = {}
+        self.tiers = [
+            RollupTier(directory, name, seconds, buckets)
+            for name, (seconds, buckets) in TIERS.items()
+        ]
+        self.ring_file: Optional[RingFile] = None
+        self._index = None
+        self._services_index = None
+        self._lock = None
+
+    def __enter__(self) -> "SampleStore":
+        self.open()
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def open(self) -> None:
+        """Opens the store, creating it if it does not exist (unless reading it)."""
+        if not self.reader:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._acquire_lock()
+        try:
+            self._open_files()
+        except BaseException:
+            self.close()
+            raise
+
+    def _open_files(self) -> None:
+        self._open_meta()
+        index_path = self.directory / INDEX_FILE
+        lines, index_size = read_index(index_path)
+        for line in lines:
+            ip, service = line.split("\t")
+            self.rings.setdefault(ip, len(self.rings))
+            self.servers[ip] = service
+        services_path = self.directory / SERVICES_FILE
+        lines, services_size = read_index(services_path)
+        for line in lines:
+            self.service_rings[line] = len(self.service_rings)
+        slots = int(self.retention // self.resolution)
+        self.ring_file = RingFile(self.directory / SAMPLES_FILE, RECORD, slots)
+        self.ring_file.open(len(self.rings), self.reader)
+        for tier in self.tiers:
+            tier.open(len(self.service_rings), self.reader)
+        if self.reader:
+            return
+        self._index = open(index_path, "a")
+        self._services_index = open(services_path, "a")
+        # drops a line left incomplete by a writer that did not close the store
+        self._index.truncate(index_size)
+        self._services_index.truncate(services_size)
+
+    def _acquire_lock(self) -> None:
+        lock = open(self.directory / LOCK_FILE, "a")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            raise ValueError(
+                f"history in {self.directory} is being recorded by another process"
+            )
+        self._lock = lock
+
+    def _open_meta(self) -> None:
+        meta_path = self.directory / META_FILE
+        if self.reader and not meta_path.exists():
+            raise ValueError(f"no history in {self.directory}")
+        if meta_path.exists():
+            with open(meta_path, "r") as file:
+                meta = json.load(file)
+            for name in ("retention", "resolution"):
+                wanted = getattr(self, name)
+                if wanted is not None and wanted != meta[name]:
+                    raise ValueError(
+                        f"history in {self.directory} has a {name} of"
+                        f" {meta[name]}s, not {wanted}s"
+                    )
+                setattr(self, name, meta[name])
+        else:
+            if self.retention is None:
+                self.retention = 3600.0
+            if self.resolution is None:
+                self.resolution = 1.0
+            with open(meta_path, "w") as file:
+                json.dump(
+                    {"retention": self.retention, "resolution": self.resolution}, file
+                )
+        assert self.retention >= self.resolution > 0, "invalid retention/resolution"
+
+    def close(self) -> None:
+        """Writes pending samples to disk and closes the store."""
+        if self.ring_file is not None:
+            self.ring_file.close()
+            self.ring_file = None
+        for tier in self.tiers:
+            tier.close()
+        for index in (self._index, self._services_index):
+            if index is not None:
+                index.close()
+        self._index = self._services_index = None
+        if self._lock is not None:
+            # closing the file releases the lock
+            self._lock.close()
+            self._lock = None
+
+    def _register(self, ip: str, service: str) -> int:
+        ring = self.rings.get(ip)
+        if ring is None:
+            ring = self.rings[ip] = len(self.rings)
+            self.ring_file.ensure(ring)
+        self.servers[ip] = service
+        self._index.write(f"{ip}\t{service}\n")
+        return ring
+
+    def _service_ring(self, service: str) -> int:
+        ring = self.service_rings.get(service)
+        if ring is None:
+            ring = self.service_rings[service] = len(self.service_rings)
+            self._services_index.write(f"{service}\n")
+        return ring
+
+    def append(self, servers: Iterable[ServerData], timestamp: float) -> int:
+        """Records samples of servers taken at the same time, returns how many."""
+        tick = int(timestamp // self.resolution)
+        write = self.ring_file.write
+        rings = self.rings
+        services = self.servers
+        groups: Dict[str, Tuple[List[int], List[int]]] = {}
+        written = 0
+        for server in servers:
+            if server.missing:
+                continue
+            ring = rings.get(server.ip)
+            if ring is None or services[server.ip] != server.service:
+                ring = self._register(server.ip, server.service)
+            write(ring, tick, server.cpu, server.memory)
+            group = groups.get(server.service)
+            if group is None:
+                group = groups[server.service] = ([], [])
+            group[0].append(server.cpu)
+            group[1].append(server.memory)
+            written += 1
+        by_ring = {self._service_ring(name): group for name, group in groups.items()}
+        for tier in self.tiers:
+            tier.add(by_ring, timestamp)
+        self._index.flush()
+        self._services_index.flush()
+        return written
+
+    def samples(self, ip: str, since: float, until: float) -> List[Sample]:
+        """The samples of a server between two times (inclusive), oldest first."""
+        ring = self.rings.get(ip)
+        if ring is None:
+            return []
+        resolution = self.resolution
+        samples = [
+            Sample(tick * resolution, cpu, memory)
+            for tick, (cpu, memory) in self.ring_file.read(
+                ring, int(since // resolution), int(until // resolution)
+            )
+        ]
+        samples.sort()
+        return samples
+
+    def servers_of(self, service: str) -> List[str]:
+        """The servers of a service, as of their latest samples."""
+        return [ip for ip, name in self.servers.items() if name == service]
+
+    def server_aggregates(
+        self, ips: Iterable[str], since: float, until: float, step: float
+    ) -> Dict[float, Aggregate]:
+        """Aggregates of the raw samples of servers in steps, by step start."""
+        steps: Dict[float, Aggregate] = {}
+        for ip in ips:
+            for sample in self.samples(ip, since, until):
+                start = sample.timestamp // step * step
+                aggregate = steps.get(start)
+                if aggregate is None:
+                    aggregate = steps[start] = Aggregate()
+                aggregate.add(sample.cpu, sample.memory)
+        return steps
+
+    def service_aggregates(
+        self, service: str, since: float, until: float, step: float
+    ) -> Dict[float, Aggregate]:
+        """Aggregates of the samples of a service in steps, by step start.
+
+        They come from the coarsest rollup tier whose buckets fit in a step
+        and which goes back far enough (or else back the furthest), and from
+        raw samples for steps finer than every tier.
+        """
+        tiers = [tier for tier in self.tiers if step % tier.seconds == 0]
+        ring = self.service_rings.get(service)
+        if not tiers or ring is None:
+            return self.server_aggregates(self.servers_of(service), since, until, step)
+        covering = [tier for tier in tiers if until - since <= tier.retention]
+        if covering:
+            tier = max(covering, key=lambda tier: tier.seconds)
+        else:
+            tier = max(tiers, key=lambda tier: tier.retention)
+        return tier.aggregates(ring, since, until, step)
+
+
+def format_time(timestamp: float) -> str:
+    """An epoch time as ISO 8601 in UTC, to the second."""
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime(
+        "%Y-%m-%dT%H:%M:%SZ"
+    )
+
+
+def sample_lines(
+    store: SampleStore, ips: Iterable[str], since: float, until: float
+) -> List[SampleResultLine]:
+    """The samples of servers between two times, by time then server."""
+    rows = [
+        (sample.timestamp, ip, store.servers[ip], sample.cpu, sample.memory)
+        for ip in ips
+        for sample in store.samples(ip, since, until)
+    ]
+    rows.sort()
+    return [
+        SampleResultLine(format_time(timestamp), ip, service, cpu, memory)
+        for timestamp, ip, service, cpu, memory in rows
+    ]
+
+
+def aggregate_lines(
+    steps: Dict[float, Aggregate], series: str, mode: str
+) -> List[AggregateResultLine]:
+    """The statistics of a series (a server or a service) at each step, in order."""
+    lines = []
+    for start in sorted(steps):
+        aggregate = steps[start]
+        lines.append(
+            AggregateResultLine(
+                format_time(start),
+                series,
+                aggregate.count,
+                *aggregate.stats("cpu"),
+                *aggregate.stats("memory"),
+                mode,
+            )
+        )
+    return lines
+
+
+class SampleRecorder:
+    """Appends samples to a store from a worker thread.
+
+    The event loop only hands batches over: a single worker writes them in
+    order, and when it falls behind by `max_pending` batches, new ones are
+    dropped (and counted) rather than queued without bounds.
+    """
+
+    def __init__(self, store: SampleStore, max_pending: int = 2) -> None:
+        assert max_pending > 0, f"invalid pending batches: {max_pending}"
+        self.store = store
+        self.max_pending = max_pending
+        self.recorded = 0
+        self.dropped = 0
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="history")
+        self._pending: Deque[asyncio.Future] = deque()
+
+    def record(self, servers: List[ServerData], timestamp: float) -> None:
+        """Schedules the writing of samples taken at the same time."""
+        pending = self._pending
+        while pending and pending[0].done():
+            self._settle(pending.popleft())
+        if len(pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        loop = asyncio.get_running_loop()
+        pending.append(
+            loop.run_in_executor(self._executor, self.store.append, servers, timestamp)
+        )
+
+    def _settle(self, future: asyncio.Future) -> None:
+        try:
+            self.recorded += future.result()
+        except (OSError, ValueError) as error:
+            logger.error("Could not record samples, error: %s", str(error))
+
+    async def close(self) -> None:
+        """Waits for pending batches, then closes the store."""
+        while self._pending:
+            future = self._pending.popleft()
+            await asyncio.wait([future])
+            self._settle(future)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self.store.close)
+        self._executor.shutdown()
@@ -1,86 +1,192 @@
 from curses import A_STANDOUT
-from typing import List
+from typing import (
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
-from src.result_lines import FullResultLine, SummaryResultLine
+from src.formatters import Formatter, compile_formatter
+from src.result_lines import (
+    AggregateResultLine,
+    FullResultLine,
+    InstanceResultLine,
+    SampleResultLine,
+    SummaryResultLine,
+)
+from src.screen import Screen
+from src.writers import STREAM_FORMATS, RowWriter
+
+
+T = TypeVar("T")
+HistoryLine = Union[SampleResultLine, AggregateResultLine]
+ResultLine = Union[SummaryResultLine, FullResultLine, InstanceResultLine, HistoryLine]
 
 
 class Printer:
     """Provides utilities for printing summary or full results for snapshot or watch modes."""
 
     @staticmethod
-    def print_summary(lines: List[SummaryResultLine], format: str, window=None) -> None:
-        """Prints the summary in csv, json, or table formats."""
-        if format == "csv":
-            Printer.print_csv_summary(lines)
-        elif format == "json":
-            Printer.print_json_summary(lines)
-        else:
-            Printer.print_table_summary(lines, window)
+    def formatter(
+        lines: Sequence[ResultLine], format: str, width: int = 0
+    ) -> Formatter:
+        """The row formatter of a batch of lines, all of the same type and mode."""
+        return compile_formatter(type(lines[0]), lines[0].mode, format, width)
 
     @staticmethod
-    def print_csv_summary(lines: List[SummaryResultLine]) -> None:
-        """Prints the summary in csv format."""
-        print(lines[0].csv_header_line)
-        for line in lines:
-            print(line.csv_line)
+    def print_summary(
+        lines: List[SummaryResultLine],
+        format: str,
+        screen: Optional[Screen] = None,
+        status: Optional[str] = None,
+        ages: Optional[Dict[str, float]] = None,
+        typed: bool = False,
+    ) -> None:
+        """Prints the summary in csv, json, ndjson or table formats."""
+        if format in STREAM_FORMATS:
+            Printer.write_rows(lines, format, typed)
+        else:
+            Printer.print_table_summary(lines, screen, status, ages)
 
     @staticmethod
-    def print_json_summary(lines: List[SummaryResultLine]) -> None:
-        """Prints the summary in json format."""
-        print("[" + ",".join([line.json_line for line in lines]) + "]")
+    def print_table_summary(
+        lines: List[SummaryResultLine],
+        screen: Optional[Screen] = None,
+        status: Optional[str] = None,
+        ages: Optional[Dict[str, float]] = None,
+    ) -> None:
+        """Prints the summary in table format.
 
-    @staticmethod
-    def print_table_summary(lines: List[SummaryResultLine], window=None) -> None:
-        """Prints the summary in table format."""
+        On screen, a status line is displayed above the table, and the age in
+        seconds of the latest sample of each service is appended to its row.
+        """
+        if len(lines) == 0:
+            return
         max_name_len = max(map(lambda l: len(l.service), lines))
         header = lines[0].table_header_line(max_name_len)
-        header_sub_line = "-" * len(header)
-        text_lines = [
-            line.table_line(max_name_len)
-            for line in sorted(lines, key=lambda l: l.service)
-        ]
-        if window is None:
-            print(header)
-            print(header_sub_line)
-            for line in text_lines:
-                print(line)
-        else:
-            window.clear()
-            window.addstr(1, 2, header)
-            window.addstr(2, 2, header_sub_line)
-            for idx, line in enumerate(text_lines):
-                if "Unhealthy" in line:
-                    window.addstr(idx + 3, 2, line, A_STANDOUT)
-                else:
-                    window.addstr(idx + 3, 2, line)
-            window.refresh()
+        if ages is not None:
+            header += "Age"
+        sorted_lines = sorted(lines, key=lambda l: l.service)
+
+        table_line = Printer.formatter(lines, "table", max_name_len)
+
+        def format_line(line: SummaryResultLine) -> str:
+            text = table_line(line)
+            if ages is not None:
+                text += f"{ages.get(line.service, 0):.0f}s"
+            return text
+
+        Printer._print_table(header, sorted_lines, format_line, screen, status)
 
     @staticmethod
-    def print_full(lines: List[FullResultLine], format: str) -> None:
-        """Prints the full results in csv, json, or table formats."""
-        if format == "csv":
-            Printer.print_csv_full(lines)
-        elif format == "json":
-            Printer.print_json_full(lines)
+    def print_full(
+        lines: List[FullResultLine], format: str, typed: bool = False
+    ) -> None:
+        """Prints the full results in csv, json, ndjson or table formats."""
+        if format in STREAM_FORMATS:
+            Printer.write_rows(lines, format, typed)
         else:
             Printer.print_table_full(lines)
 
     @staticmethod
-    def print_csv_full(lines: List[FullResultLine]) -> None:
-        """Prints the full results in csv format."""
-        print(lines[0].csv_header_line)
-        for line in lines:
-            print(line.csv_line)
+    def write_rows(
+        lines: Iterable[ResultLine], format: str, typed: bool = False
+    ) -> None:
+        """Prints lines in csv, json or ndjson formats, in large chunks."""
+        with RowWriter(format, typed=typed) as writer:
+            writer.write_all(lines)
+
+    @staticmethod
+    async def stream_full(
+        lines: AsyncIterator[FullResultLine], format: str, typed: bool = False
+    ) -> None:
+        """Prints the full results in csv, json or ndjson formats as lines arrive."""
+        with RowWriter(format, typed=typed) as writer:
+            async for line in lines:
+                writer.write(line)
 
     @staticmethod
-    def print_json_full(lines: List[FullResultLine]) -> None:
-        """Prints the full results in json format."""
-        print("[" + ",".join([line.json_line for line in lines]) + "]")
+    def print_table_full(
+        lines: List[FullResultLine],
+        screen: Optional[Screen] = None,
+        status: Optional[str] = None,
+        presorted: bool = False,
+    ) -> None:
+        """Prints the full results in table format, sorted by service unless they are."""
+        if len(lines) == 0:
+            return
+        max_name_len = max(map(lambda l: len(l.service), lines))
+        header = lines[0].table_header_line(max_name_len)
+        sorted_lines = lines if presorted else sorted(lines, key=lambda l: l.service)
+        table_line = Printer.formatter(lines, "table", max_name_len)
+        if screen is None:
+            print(header)
+            for line in sorted_lines:
+                print(table_line(line))
+            return
+        Printer._print_table(header, sorted_lines, table_line, screen, status)
+
+    @staticmethod
+    def print_table_instances(
+        lines: List[InstanceResultLine],
+        trend_len: int,
+        screen: Optional[Screen] = None,
+        status: Optional[str] = None,
+    ) -> None:
+        """Prints the servers of a service with their sparklines in table format."""
+        if len(lines) == 0:
+            if screen is not None:
+                screen.draw([(status or "", 0)], [], lambda line: ("", 0))
+            return
+        header = lines[0].table_header_line(trend_len)
+        table_line = Printer.formatter(lines, "table", trend_len)
+        Printer._print_table(header, lines, table_line, screen, status)
+
+    @staticmethod
+    def print_history(
+        lines: List[HistoryLine], format: str, typed: bool = False
+    ) -> None:
+        """Prints samples or aggregates in csv, json, ndjson or table formats, in order."""
+        if format in STREAM_FORMATS:
+            Printer.write_rows(lines, format, typed)
+            return
+        if len(lines) == 0:
+            return
+        if isinstance(lines[0], AggregateResultLine):
+            max_name_len = max(map(lambda l: len(l.series), lines))
+        else:
+            max_name_len = max(map(lambda l: len(l.service), lines))
+        header = lines[0].table_header_line(max_name_len)
+        table_line = Printer.formatter(lines, "table", max_name_len)
+        Printer._print_table(header, lines, table_line, None, None)
 
     @staticmethod
-    def print_table_full(lines: List[FullResultLine]) -> None:
-        """Prints the full results in table format."""
-        max_name_len = max(map(lambda l: len(l.service_summary.service), lines))
-        print(lines[0].table_header_line(max_name_len))
-        for line in sorted(lines, key=lambda l: l.service):
-            print(line.table_line(max_name_len))
+    def _print_table(
+        header: str,
+        lines: Sequence[T],
+        format_line: Callable[[T], str],
+        screen: Optional[Screen],
+        status: Optional[str],
+    ) -> None:
+        """Prints table rows, on screen only formatting the rows in view."""
+        header_sub_line = "-" * len(header)
+        if screen is None:
+            print(header)
+            print(header_sub_line)
+            for line in lines:
+                print(format_line(line))
+            return
+
+        def format_row(line: T) -> Tuple[str, int]:
+            attr = A_STANDOUT if line.status == "Unhealthy" else 0
+            return format_line(line), attr
+
+        screen.draw(
+            [(status or "", 0), (header, 0), (header_sub_line, 0)], lines, format_row
+        )
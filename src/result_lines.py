@@ -1,8 +1,7 @@
-import csv
-from dataclasses import asdict, dataclass
-from io import StringIO
-from json import dumps
-from typing import Dict, List, Tuple
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from src.formatters import compile_formatter
 
 
 @dataclass
@@ -38,7 +37,12 @@ class SummaryResultLine:
     @property
     def columns(self) -> List[str]:
         """The columns to be displayed depending on mode (simple or complete)."""
-        if self.mode == "simple":
+        return self.columns_for(self.mode)
+
+    @staticmethod
+    def columns_for(mode: str) -> List[str]:
+        """The columns to be displayed in the given mode (simple or complete)."""
+        if mode == "simple":
             return [
                 "service",
                 "status",
@@ -71,6 +75,11 @@ class SummaryResultLine:
             "memory_max",
         ]
 
+    @staticmethod
+    def attribute(column: str) -> str:
+        """The attribute holding the value of a column."""
+        return column
+
     @property
     def csv_header_line(self) -> str:
         """The csv header dependng on the available columns."""
@@ -79,19 +88,12 @@ class SummaryResultLine:
     @property
     def csv_line(self) -> str:
         """The csv line dependng on the available columns."""
-        values = {**asdict(self), "status": self.status}
-        output = StringIO()
-        spamwriter = csv.writer(
-            output, delimiter=",", quotechar='"', quoting=csv.QUOTE_ALL
-        )
-        spamwriter.writerow([str(values[c]) for c in self.columns])
-        return output.getvalue().replace("\n", "")
+        return compile_formatter(type(self), self.mode, "csv")(self)
 
     @property
     def json_line(self) -> str:
         """The json dump of the line depending on available columns."""
-        values = {**asdict(self), "status": self.status}
-        return dumps({c: str(values[c]) for c in self.columns})
+        return compile_formatter(type(self), self.mode, "json")(self)
 
     @staticmethod
     def columns_formats(max_service_name_len: int) -> Dict[str, Tuple[str, int]]:
@@ -128,13 +130,10 @@ class SummaryResultLine:
 
     def table_line(self, max_service_name_len: int) -> str:
         """The formatted table line depending on available columns."""
-        values = {**asdict(self), "status": self.status}
-        columns = [c for c in self.columns if c != "ips"]
-        formats = self.columns_formats(max_service_name_len)
-        line = ""
-        for c in columns:
-            line += formats[c][2](values[c]).ljust(formats[c][1])
-        return line
+        formatter = compile_formatter(
+            type(self), self.mode, "table", max_service_name_len
+        )
+        return formatter(self)
 
 
 @dataclass
@@ -146,11 +145,13 @@ class FullResultLine:
     memory: int
     cpu: int
     mode: str
-    service_summary: SummaryResultLine
+    service_summary: Optional[SummaryResultLine] = None
 
     @property
     def status(self) -> str:
         """The status of the service hosted in this server."""
+        if self.service_summary is None:
+            return "Unknown"
         if self.service_summary.total_servers > 1:
             return "Healthy"
         return "Unhealthy"
@@ -158,7 +159,12 @@ class FullResultLine:
     @property
     def columns(self) -> List[str]:
         """The columns to be displayed depending on mode (simple or complete)."""
-        if self.mode == "simple":
+        return self.columns_for(self.mode)
+
+    @staticmethod
+    def columns_for(mode: str) -> List[str]:
+        """The columns to be displayed in the given mode (simple or complete)."""
+        if mode == "simple":
             return [
                 "ip",
                 "service",
@@ -182,6 +188,13 @@ class FullResultLine:
             "memory_max",
         ]
 
+    @staticmethod
+    def attribute(column: str) -> str:
+        """The attribute holding the value of a column, maybe in the service summary."""
+        if column in ("ip", "service", "memory", "cpu", "status"):
+            return column
+        return f"service_summary.{column}"
+
     @property
     def csv_header_line(self) -> str:
         """The csv header dependng on the available columns."""
@@ -190,21 +203,12 @@ class FullResultLine:
     @property
     def csv_line(self) -> str:
         """The csv line dependng on the available columns."""
-        values = {**asdict(self), "status": self.status}
-        values.update(**asdict(self.service_summary))
-        output = StringIO()
-        spamwriter = csv.writer(
-            output, delimiter=",", quotechar='"', quoting=csv.QUOTE_ALL
-        )
-        spamwriter.writerow([str(values[c]) for c in self.columns])
-        return output.getvalue().replace("\n", "")
+        return compile_formatter(type(self), self.mode, "csv")(self)
 
     @property
     def json_line(self) -> str:
         """The json dump of the line depending on available columns."""
-        values = {**asdict(self), "status": self.status}
-        values.update(**asdict(self.service_summary))
-        return dumps({c: str(values[c]) for c in self.columns})
+        return compile_formatter(type(self), self.mode, "json")(self)
 
     @staticmethod
     def columns_formats(max_service_name_len: int) -> Dict[str, Tuple[str, int]]:
@@ -237,10 +241,222 @@ class FullResultLine:
 
     def table_line(self, max_service_name_len: int) -> str:
         """The formatted table line depending on available columns."""
-        values = {**asdict(self), "status": self.status}
-        values.update(**asdict(self.service_summary))
+        formatter = compile_formatter(
+            type(self), self.mode, "table", max_service_name_len
+        )
+        return formatter(self)
+
+
+@dataclass
+class SampleResultLine:
+    """Represents a line in a history report, a sample of a server."""
+
+    time: str
+    ip: str
+    service: str
+    cpu: int
+    memory: int
+    mode: str = "simple"
+
+    @property
+    def columns(self) -> List[str]:
+        """The columns to be displayed."""
+        return self.columns_for(self.mode)
+
+    @staticmethod
+    def columns_for(mode: str) -> List[str]:
+        """The columns to be displayed, the same in every mode."""
+        return ["time", "ip", "service", "cpu", "memory"]
+
+    @staticmethod
+    def attribute(column: str) -> str:
+        """The attribute holding the value of a column."""
+        return column
+
+    @property
+    def csv_header_line(self) -> str:
+        """The csv header dependng on the available columns."""
+        return ",".join(self.columns)
+
+    @staticmethod
+    def columns_formats(max_service_name_len: int) -> Dict[str, Tuple[str, int]]:
+        """Sets length and formating for values displayed in each column."""
+        return {
+            # column: (title, length, value formatter)
+            "time": ("Time", 22, lambda v: str(v)),
+            "ip": ("IP", 16, lambda v: str(v)),
+            "service": ("Service", max(8, max_service_name_len + 1), lambda v: str(v)),
+            "cpu": ("CPU", 7, lambda v: str(int(v)) + "%"),
+            "memory": ("Mem", 7, lambda v: str(int(v)) + "%"),
+        }
+
+    def table_header_line(self, max_service_name_len: int) -> str:
+        """The formatted table header."""
         formats = self.columns_formats(max_service_name_len)
-        line = ""
+        header_line = ""
+        for c in self.columns:
+            header_line += formats[c][0].ljust(formats[c][1])
+        return header_line
+
+
+@dataclass
+class AggregateResultLine:
+    """Represents a line in an aggregated history report, a step of a series."""
+
+    time: str
+    series: str
+    samples: int
+    cpu_min: float
+    cpu_p25: float
+    cpu_p50: float
+    cpu_p75: float
+    cpu_max: float
+    cpu_mean: float
+    memory_min: float
+    memory_p25: float
+    memory_p50: float
+    memory_p75: float
+    memory_max: float
+    memory_mean: float
+    mode: str
+
+    @property
+    def columns(self) -> List[str]:
+        """The columns to be displayed depending on mode (simple or complete)."""
+        return self.columns_for(self.mode)
+
+    @staticmethod
+    def columns_for(mode: str) -> List[str]:
+        """The columns to be displayed in the given mode (simple or complete)."""
+        if mode == "simple":
+            return [
+                "time",
+                "series",
+                "samples",
+                "cpu_min",
+                "cpu_mean",
+                "cpu_max",
+                "memory_min",
+                "memory_mean",
+                "memory_max",
+            ]
+        return [
+            "time",
+            "series",
+            "samples",
+            "cpu_min",
+            "cpu_p25",
+            "cpu_p50",
+            "cpu_p75",
+            "cpu_max",
+            "cpu_mean",
+            "memory_min",
+            "memory_p25",
+            "memory_p50",
+            "memory_p75",
+            "memory_max",
+            "memory_mean",
+        ]
+
+    @staticmethod
+    def attribute(column: str) -> str:
+        """The attribute holding the value of a column."""
+        return column
+
+    @property
+    def csv_header_line(self) -> str:
+        """The csv header dependng on the available columns."""
+        return ",".join(self.columns)
+
+    @staticmethod
+    def columns_formats(max_series_name_len: int) -> Dict[str, Tuple[str, int]]:
+        """Sets length and formating for values displayed in each column."""
+        return {
+            # column: (title, length, value formatter)
+            "time": ("Time", 22, lambda v: str(v)),
+            "series": ("Series", max(8, max_series_name_len + 1), lambda v: str(v)),
+            "samples": ("Samples", 9, lambda v: str(v)),
+            "cpu_min": ("CPU min", 8, lambda v: str(int(v)) + "%"),
+            "cpu_p25": ("CPU Q1", 7, lambda v: str(int(v)) + "%"),
+            "cpu_p50": ("CPU Q2", 7, lambda v: str(int(v)) + "%"),
+            "cpu_p75": ("CPU Q3", 7, lambda v: str(int(v)) + "%"),
+            "cpu_max": ("CPU max", 8, lambda v: str(int(v)) + "%"),
+            "cpu_mean": ("CPU avg", 8, lambda v: f"{v:.1f}%"),
+            "memory_min": ("Mem min", 8, lambda v: str(int(v)) + "%"),
+            "memory_p25": ("Mem Q1", 7, lambda v: str(int(v)) + "%"),
+            "memory_p50": ("Mem Q2", 7, lambda v: str(int(v)) + "%"),
+            "memory_p75": ("Mem Q3", 7, lambda v: str(int(v)) + "%"),
+            "memory_max": ("Mem max", 8, lambda v: str(int(v)) + "%"),
+            "memory_mean": ("Mem avg", 8, lambda v: f"{v:.1f}%"),
+        }
+
+    def table_header_line(self, max_series_name_len: int) -> str:
+        """The formatted table header depending on available columns."""
+        formats = self.columns_formats(max_series_name_len)
+        header_line = ""
+        for c in self.columns:
+            header_line += formats[c][0].ljust(formats[c][1])
+        return header_line
+
+
+@dataclass
+class InstanceResultLine:
+    """Represents a line in a service report, a server with its latest samples."""
+
+    ip: str
+    cpu: int
+    memory: int
+    cpu_trend: str
+    memory_trend: str
+    failed: bool
+    mode: str
+
+    @property
+    def status(self) -> str:
+        """Whether the latest poll of the server succeeded."""
+        if self.failed:
+            return "Unhealthy"
+        return "Healthy"
+
+    @property
+    def columns(self) -> List[str]:
+        """The columns to be displayed depending on mode (simple or complete)."""
+        return self.columns_for(self.mode)
+
+    @staticmethod
+    def columns_for(mode: str) -> List[str]:
+        """The columns to be displayed in the given mode (simple or complete)."""
+        if mode == "simple":
+            return ["ip", "cpu", "cpu_trend", "memory", "memory_trend"]
+        return ["ip", "status", "cpu", "cpu_trend", "memory", "memory_trend"]
+
+    @staticmethod
+    def attribute(column: str) -> str:
+        """The attribute holding the value of a column."""
+        return column
+
+    @property
+    def csv_header_line(self) -> str:
+        """The csv header dependng on the available columns."""
+        return ",".join(self.columns)
+
+    @staticmethod
+    def columns_formats(trend_len: int) -> Dict[str, Tuple[str, int]]:
+        """Sets length and formating for values displayed in each column."""
+        return {
+            # column: (title, length, value formatter)
+            "ip": ("IP", 16, lambda v: str(v)),
+            "status": ("Status", 10, lambda v: str(v)),
+            "cpu": ("CPU", 6, lambda v: str(int(v)) + "%"),
+            "cpu_trend": ("CPU trend", max(10, trend_len + 2), lambda v: str(v)),
+            "memory": ("Mem", 6, lambda v: str(int(v)) + "%"),
+            "memory_trend": ("Mem trend", max(10, trend_len + 2), lambda v: str(v)),
+        }
+
+    def table_header_line(self, trend_len: int) -> str:
+        """The formatted table header depending on available columns."""
+        formats = self.columns_formats(trend_len)
+        header_line = ""
         for c in self.columns:
-            line += formats[c][2](values[c]).ljust(formats[c][1])
-        return line
+            header_line += formats[c][0].ljust(formats[c][1])
+        return header_line
@@ -1,61 +1,94 @@
-from typing import List
+from typing import List, Optional
+from src.columnar import FleetColumns
 from src.result_lines import FullResultLine, SummaryResultLine
 
 from src.server_data import ServerData
-from src.services_statistics import SerivesStatistics
+from src.services_aggregator import ServiceAggregate, ServicesAggregator
 
 
 class ResultsCompiler:
     """Compiles and augment information about a list of servers."""
 
     @staticmethod
-    def full(servers: List[ServerData], mode: str) -> List[FullResultLine]:
+    def full(
+        servers: List[ServerData], mode: str, backend: str = "exact"
+    ) -> List[FullResultLine]:
         """Creates a report per server augmenting with some information about the hosted service."""
         services_summaries = {
             summary.service: summary
-            for summary in ResultsCompiler.summary(servers, mode)
+            for summary in ResultsCompiler.summary(servers, mode, backend)
         }
         return [
-            FullResultLine(
-                server.service,
-                server.ip,
-                server.memory,
-                server.cpu,
-                mode,
-                services_summaries[server.service],
-            )
+            ResultsCompiler.full_line(server, mode, services_summaries[server.service])
             for server in servers
         ]
 
     @staticmethod
-    def summary(servers: List[ServerData], mode: str) -> List[SummaryResultLine]:
+    def full_line(
+        server: ServerData, mode: str, summary: Optional[SummaryResultLine] = None
+    ) -> FullResultLine:
+        """Creates the report line of a single server.
+
+        The service summary can be omitted in simple mode, whose columns do not
+        depend on it, allowing lines to be produced before all servers are known.
+        """
+        assert summary is not None or mode == "simple"
+        return FullResultLine(
+            server.service,
+            server.ip,
+            server.memory,
+            server.cpu,
+            mode,
+            summary,
+        )
+
+    @staticmethod
+    def summary(
+        servers: List[ServerData], mode: str, backend: str = "exact"
+    ) -> List[SummaryResultLine]:
         """Creates a summary of each service given information about all servers."""
+        if backend == "columnar":
+            return FleetColumns.from_servers(servers).summary(mode)
+        aggregator = ServicesAggregator(servers)
+        return ResultsCompiler.summary_from_aggregator(aggregator, mode)
+
+    @staticmethod
+    def summary_from_aggregator(
+        aggregator: ServicesAggregator, mode: str
+    ) -> List[SummaryResultLine]:
+        """Creates a summary of each service from incrementally aggregated statistics."""
+        return [
+            ResultsCompiler.summary_line(service, aggregator[service], mode)
+            for service in aggregator.services
+        ]
+
+    @staticmethod
+    def summary_line(
+        service: str, aggregate: ServiceAggregate, mode: str
+    ) -> SummaryResultLine:
+        """Creates the summary of a single service."""
         assert mode in ("simple", "complete")
 
-        services_statistics = SerivesStatistics(servers)
-
-        results = []
-        for service in services_statistics.services:
-            results.append(
-                SummaryResultLine(
-                    service=service,
-                    total_servers=len(services_statistics.ips[service]),
-                    ips=services_statistics.ips[service],
-                    ip_cpu_min=services_statistics.ip_cpu_min[service],
-                    ip_cpu_max=services_statistics.ip_cpu_max[service],
-                    ip_memory_min=services_statistics.ip_memory_min[service],
-                    ip_memory_max=services_statistics.ip_memory_max[service],
-                    cpu_min=services_statistics.cpu_quantiles[service][0],
-                    cpu_p25=services_statistics.cpu_quantiles[service][1],
-                    cpu_p50=services_statistics.cpu_quantiles[service][2],
-                    cpu_p75=services_statistics.cpu_quantiles[service][3],
-                    cpu_max=services_statistics.cpu_quantiles[service][4],
-                    memory_min=services_statistics.memory_quantiles[service][0],
-                    memory_p25=services_statistics.memory_quantiles[service][1],
-                    memory_p50=services_statistics.memory_quantiles[service][2],
-                    memory_p75=services_statistics.memory_quantiles[service][3],
-                    memory_max=services_statistics.memory_quantiles[service][4],
-                    mode=mode,
-                )
-            )
-        return results
+        has_samples = len(aggregate.cpu) > 0
+        cpu_quantiles = aggregate.cpu_quantiles
+        memory_quantiles = aggregate.memory_quantiles
+        return SummaryResultLine(
+            service=service,
+            total_servers=len(aggregate.ips),
+            ips=list(aggregate.ips),
+            ip_cpu_min=aggregate.cpu.argmin if has_samples else "",
+            ip_cpu_max=aggregate.cpu.argmax if has_samples else "",
+            ip_memory_min=aggregate.memory.argmin if has_samples else "",
+            ip_memory_max=aggregate.memory.argmax if has_samples else "",
+            cpu_min=cpu_quantiles[0],
+            cpu_p25=cpu_quantiles[1],
+            cpu_p50=cpu_quantiles[2],
+            cpu_p75=cpu_quantiles[3],
+            cpu_max=cpu_quantiles[4],
+            memory_min=memory_quantiles[0],
+            memory_p25=memory_quantiles[1],
+            memory_p50=memory_quantiles[2],
+            memory_p75=memory_quantiles[3],
+            memory_max=memory_quantiles[4],
+            mode=mode,
+        )
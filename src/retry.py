@@ -0,0 +1,91 @@
+from dataclasses import dataclass
+from random import Random
+from typing import Dict, Optional, Type
+
+from src.cpx_client import (
+    CpxClientBadRequest,
+    CpxClientCannotConnect,
+    CpxClientCircuitOpen,
+    CpxClientError,
+    CpxClientServerError,
+    CpxClientTimeout,
+)
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """How requests failing with a class of errors are retried.
+
+    Delays grow exponentially from `base_delay` up to `max_delay`, and the
+    actual delay is drawn uniformly below it ("full jitter"), so that clients
+    failing together do not retry together.
+    """
+
+    retries: int
+    base_delay: float = 0.0
+    max_delay: float = 0.0
+
+    def delay(self, attempt: int, random: Random) -> float:
+        """Seconds to wait before the given retry, counting from 0."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+
+# the first policy whose error class matches applies, so subclasses come first
+DEFAULT_POLICIES: Dict[Type[CpxClientError], RetryPolicy] = {
+    CpxClientTimeout: RetryPolicy(retries=2, base_delay=0.5, max_delay=2.0),
+    CpxClientCannotConnect: RetryPolicy(retries=3, base_delay=0.5, max_delay=4.0),
+    CpxClientServerError: RetryPolicy(retries=2, base_delay=0.5, max_delay=4.0),
+    CpxClientBadRequest: RetryPolicy(retries=0),
+    # retrying would be refused as well until the breaker lets a probe through
+    CpxClientCircuitOpen: RetryPolicy(retries=0),
+}
+
+
+def policy_for(
+    error: CpxClientError,
+    policies: Dict[Type[CpxClientError], RetryPolicy] = DEFAULT_POLICIES,
+) -> RetryPolicy:
+    """The policy applying to an error, not retrying unknown ones."""
+    for error_class, policy in policies.items():
+        if isinstance(error, error_class):
+            return policy
+    return RetryPolicy(retries=0)
+
+
+# retries always allowed, so that a few isolated failures can be retried
+MIN_RETRIES = 10
+
+
+class RetryBudget:
+    """Caps the number of retries spent by a whole run, such as a snapshot.
+
+    Retries are allowed up to `ratio` of the requests made so far, plus
+    `min_retries` that are always allowed. When CPX is degraded and most
+    requests fail, the budget runs out and load stays bounded instead of
+    being multiplied by the retries of every request.
+    """
+
+    def __init__(
+        self,
+        ratio: float = 0.1,
+        min_retries: int = MIN_RETRIES,
+        seed: Optional[int] = None,
+    ) -> None:
+        assert ratio >= 0, f"invalid retry ratio: {ratio}"
+        assert min_retries >= 0, f"invalid min retries: {min_retries}"
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.requests = 0
+        self.retries = 0
+        self.random = Random(seed)
+
+    def request(self) -> None:
+        """Accounts for a first attempt of a request."""
+        self.requests += 1
+
+    def try_spend(self) -> bool:
+        """Takes a retry from the budget, returns False if none is left."""
+        if self.retries >= self.min_retries + self.ratio * self.requests:
+            return False
+        self.retries += 1
+        return True
@@ -0,0 +1,119 @@
+import mmap
+from pathlib import Path
+from struct import Struct
+from typing import Iterator, Optional, Tuple
+
+
+# rings allocated by default when a file is created, doubled whenever they run out
+INITIAL_CAPACITY = 1024
+
+
+class RingFile:
+    """Fixed-size records in rings of `slots` records, all in one memory-mapped file.
+
+    Rings are numbered from 0 and laid out one after the other; the file is
+    grown (doubling the number of rings) when a ring past its end is needed.
+    Records hold a tick first, the time of their values plus one, so that
+    empty slots (all zeros) are told apart and slots overwritten by later
+    rounds of a ring are recognized.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        record: Struct,
+        slots: int,
+        initial_capacity: int = INITIAL_CAPACITY,
+    ) -> None:
+        assert slots > 0, f"invalid number of slots: {slots}"
+        assert initial_capacity > 0, f"invalid initial capacity: {initial_capacity}"
+        self.path = path
+        self.record = record
+        self.slots = slots
+        self.ring_size = slots * record.size
+        self.initial_capacity = initial_capacity
+        self.capacity = 0
+        self._file = None
+        self._map = None
+
+    def open(self, rings: int = 0, readonly: bool = False) -> None:
+        """Maps the file, creating it, with room for at least some rings.
+
+        Read-only, the file is mapped as it is, without creating nor growing it.
+        """
+        if readonly:
+            self._open_readonly()
+            return
+        self.path.touch()
+        self._file = open(self.path, "r+b")
+        existing = self.path.stat().st_size // self.ring_size
+        self._resize(max(self.initial_capacity, existing, rings))
+
+    def _open_readonly(self) -> None:
+        if not self.path.exists():
+            return
+        self._file = open(self.path, "rb")
+        capacity = self.path.stat().st_size // self.ring_size
+        if capacity > 0:
+            self._map = mmap.mmap(
+                self._file.fileno(), capacity * self.ring_size, access=mmap.ACCESS_READ
+            )
+        self.capacity = capacity
+
+    def _resize(self, capacity: int) -> None:
+        if self._map is not None:
+            self._map.close()
+        size = capacity * self.ring_size
+        self._file.seek(0, 2)
+        if self._file.tell() < size:
+            self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self.capacity = capacity
+
+    def close(self) -> None:
+        """Writes pending records to disk and unmaps the file."""
+        if self._map is not None:
+            self._map.flush()
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def flush(self) -> None:
+        """Writes pending records to disk."""
+        self._map.flush()
+
+    def ensure(self, ring: int) -> None:
+        """Grows the file so that it holds a ring."""
+        if ring >= self.capacity:
+            capacity = self.capacity
+            while ring >= capacity:
+                capacity *= 2
+            self._resize(capacity)
+
+    def write(self, ring: int, tick: int, *values) -> None:
+        """Writes the record of a tick, over the one of an older round if any."""
+        offset = ring * self.ring_size + (tick % self.slots) * self.record.size
+        self.record.pack_into(self._map, offset, tick + 1, *values)
+
+    def get(self, ring: int, tick: int) -> Optional[Tuple]:
+        """The values recorded for a tick, if any."""
+        offset = ring * self.ring_size + (tick % self.slots) * self.record.size
+        values = self.record.unpack_from(self._map, offset)
+        if values[0] != tick + 1:
+            return None
+        return values[1:]
+
+    def read(self, ring: int, first: int, last: int) -> Iterator[Tuple[int, Tuple]]:
+        """The ticks and values of a ring between two ticks (inclusive), unordered."""
+        if ring >= self.capacity:
+            return
+        first = max(first, last - self.slots + 1)
+        start = ring * self.ring_size
+        for values in self.record.iter_unpack(
+            self._map[start : start + self.ring_size]
+        ):
+            tick = values[0] - 1
+            if first <= tick <= last:
+                yield tick, values[1:]
@@ -0,0 +1,142 @@
+from bisect import bisect_right
+from collections import Counter
+from itertools import accumulate
+from pathlib import Path
+from struct import Struct
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from src.rings import RingFile
+from src.services_statistics import interpolate_quartiles
+
+
+# percentages are integers from 0 to 100, each with its own bin
+BINS = 101
+# tick, then the cpu and memory histograms of a bucket
+BUCKET = Struct(f"<I{2 * BINS}I")
+
+# seconds covered by each bucket of a tier, and buckets kept
+TIERS = {"1m": (60, 1440), "1h": (3600, 720)}
+# rings of services allocated when a tier is created: their buckets are much
+# larger than samples and services far fewer than servers
+SERVICE_CAPACITY = 16
+
+
+def clamp(value: int) -> int:
+    """A percentage within the bins of a histogram."""
+    return min(max(value, 0), BINS - 1)
+
+
+class Aggregate:
+    """Histograms of the cpu and memory of many samples.
+
+    As percentages are integers, one bin per value makes statistics exact,
+    and aggregates merge by adding their bins, whatever their number of
+    samples.
+    """
+
+    __slots__ = ("bins",)
+
+    def __init__(self, bins: Optional[Sequence[int]] = None) -> None:
+        self.bins = [0] * (2 * BINS) if bins is None else list(bins)
+
+    def add(self, cpu: int, memory: int) -> None:
+        """Accounts for a sample."""
+        self.bins[clamp(cpu)] += 1
+        self.bins[BINS + clamp(memory)] += 1
+
+    def add_all(self, cpus: List[int], memories: List[int]) -> None:
+        """Accounts for many samples, counting each distinct value once."""
+        bins = self.bins
+        for value, count in Counter(cpus).items():
+            bins[clamp(value)] += count
+        for value, count in Counter(memories).items():
+            bins[BINS + clamp(value)] += count
+
+    def merge(self, bins: Sequence[int]) -> None:
+        """Accounts for the samples of other histograms."""
+        self.bins = [a + b for a, b in zip(self.bins, bins)]
+
+    @property
+    def count(self) -> int:
+        """The number of samples."""
+        return sum(self.bins[:BINS])
+
+    def stats(self, metric: str) -> Tuple[float, float, float, float, float, float]:
+        """Min, quartiles, max and mean of a metric (cpu or memory).
+
+        Quartiles are those of `statistics.quantiles`, as in summaries, and
+        zero with fewer than 4 samples.
+        """
+        assert metric in ("cpu", "memory"), f"invalid metric: {metric}"
+        bins = self.bins[:BINS] if metric == "cpu" else self.bins[BINS:]
+        ranks = list(accumulate(bins))
+        size = ranks[-1]
+        if size == 0:
+            return (0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+
+        def nth(rank: int) -> float:
+            return float(bisect_right(ranks, rank))
+
+        mean = sum(value * count for value, count in enumerate(bins)) / size
+        quartiles = [0.0, 0.0, 0.0]
+        if size >= 4:
+            quartiles = interpolate_quartiles(size, nth)
+        return (nth(0), *quartiles, nth(size - 1), mean)
+
+
+class RollupTier:
+    """Aggregates of the samples of each service over buckets of fixed duration.
+
+    Each service gets a ring of `buckets` histograms in a memory-mapped file,
+    which samples are added to as they are recorded, so that queries over
+    long periods read one bucket per period instead of every sample.
+    """
+
+    def __init__(self, directory: Path, name: str, seconds: int, buckets: int):
+        self.name = name
+        self.seconds = seconds
+        self.buckets = buckets
+        self.ring_file = RingFile(
+            directory / f"rollup-{name}.ring", BUCKET, buckets, SERVICE_CAPACITY
+        )
+
+    @property
+    def retention(self) -> int:
+        """Seconds of samples kept."""
+        return self.seconds * self.buckets
+
+    def open(self, rings: int, readonly: bool = False) -> None:
+        """Opens the file of the tier."""
+        self.ring_file.open(rings, readonly)
+
+    def close(self) -> None:
+        """Writes pending buckets to disk and closes the file of the tier."""
+        self.ring_file.close()
+
+    def add(
+        self, groups: Dict[int, Tuple[List[int], List[int]]], timestamp: float
+    ) -> None:
+        """Adds the cpu and memory samples of services (by ring) taken at a time."""
+        ring_file = self.ring_file
+        tick = int(timestamp // self.seconds)
+        for ring, (cpus, memories) in groups.items():
+            ring_file.ensure(ring)
+            aggregate = Aggregate(ring_file.get(ring, tick))
+            aggregate.add_all(cpus, memories)
+            ring_file.write(ring, tick, *aggregate.bins)
+
+    def aggregates(
+        self, ring: int, since: float, until: float, step: float
+    ) -> Dict[float, Aggregate]:
+        """Aggregates of a service in steps between two times, by step start."""
+        steps: Dict[float, Aggregate] = {}
+        first = int(since // self.seconds)
+        last = int(until // self.seconds)
+        for tick, bins in self.ring_file.read(ring, first, last):
+            start = tick * self.seconds // step * step
+            aggregate = steps.get(start)
+            if aggregate is None:
+                steps[start] = Aggregate(bins)
+            else:
+                aggregate.merge(bins)
+        return steps
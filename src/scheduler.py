@@ -0,0 +1,154 @@
+import asyncio
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    List,
+    Optional,
+    Sequence,
+    TypeVar,
+)
+
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class RateLimiter:
+    """Spaces out acquisitions so that at most `rate` of them happen per second."""
+
+    def __init__(self, rate: float) -> None:
+        assert rate > 0, f"invalid rate: {rate}"
+        self.interval = 1.0 / rate
+        self._next_slot = 0.0
+
+    async def acquire(self) -> None:
+        """Waits until the next free slot, slots are reserved in arrival order."""
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class Scheduler:
+    """Runs a coroutine function over many items keeping a bounded number in flight.
+
+    A fixed pool of workers pulls items from a queue, so the number of pending
+    requests stays steady at `max_inflight` until the queue drains. When `rate`
+    is positive, no more than `rate` items are started per second.
+    """
+
+    def __init__(self, max_inflight: int = 100, rate: float = 0.0) -> None:
+        assert max_inflight > 0, f"invalid max inflight: {max_inflight}"
+        assert rate >= 0, f"invalid rate: {rate}"
+        self.max_inflight = max_inflight
+        self.rate = rate
+
+    async def as_completed(
+        self, func: Callable[[T], Awaitable[R]], items: Sequence[T]
+    ) -> AsyncIterator[R]:
+        """Yields the result of `func` for every item, in completion order."""
+        if len(items) == 0:
+            return
+
+        pending = asyncio.Queue()
+        for item in items:
+            pending.put_nowait(item)
+        done = asyncio.Queue()
+        limiter = RateLimiter(self.rate) if self.rate > 0 else None
+
+        async def worker() -> None:
+            while True:
+                try:
+                    item = pending.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                if limiter is not None:
+                    await limiter.acquire()
+                try:
+                    done.put_nowait((None, await func(item)))
+                except Exception as error:
+                    done.put_nowait((error, None))
+
+        workers = [
+            asyncio.ensure_future(worker())
+            for _ in range(min(self.max_inflight, len(items)))
+        ]
+        try:
+            for _ in range(len(items)):
+                error, result = await done.get()
+                if error is not None:
+                    raise error
+                yield result
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def map(
+        self, func: Callable[[T], Awaitable[R]], items: Sequence[T]
+    ) -> List[R]:
+        """Returns the result of `func` for every item, in the order of the items."""
+
+        async def indexed(pair):
+            idx, item = pair
+            return idx, await func(item)
+
+        results = [None] * len(items)
+        async for idx, result in self.as_completed(indexed, list(enumerate(items))):
+            results[idx] = result
+        return results
+
+
+class Ticker:
+    """Fires a cycle on a fixed cadence, without drifting by the time cycles take.
+
+    Ticks are aligned to a grid of `period` seconds from the first one, and
+    each cycle is due by the start of the next tick. When a cycle blows its
+    deadline the overrun is counted and the policy decides what happens to
+    the ticks missed meanwhile:
+    - `skip` drops them and waits for the next tick on the grid;
+    - `coalesce` runs them all as one cycle right away;
+    - `partial` passes the deadline to the cycle so it can stop and show what
+      it got so far, then carries on right away like `coalesce`.
+    """
+
+    POLICIES = ("skip", "coalesce", "partial")
+
+    def __init__(self, period: float, policy: str = "skip") -> None:
+        assert period > 0, f"invalid period: {period}"
+        assert policy in self.POLICIES, f"invalid overrun policy: {policy}"
+        self.period = period
+        self.policy = policy
+        self.cycles = 0
+        self.overruns = 0
+        self.skipped = 0
+
+    async def run(
+        self,
+        cycle: Callable[[Optional[float]], Awaitable[None]],
+        ticks: Optional[int] = None,
+    ) -> None:
+        """Runs the cycle on every tick, forever or for the given number of ticks."""
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        tick = 0
+        while ticks is None or self.cycles < ticks:
+            deadline = start + (tick + 1) * self.period
+            await cycle(deadline if self.policy == "partial" else None)
+            self.cycles += 1
+            now = loop.time()
+            if now <= deadline:
+                tick += 1
+            else:
+                self.overruns += 1
+                # the latest tick whose time has already come
+                current = int((now - start) // self.period)
+                if self.policy == "skip":
+                    self.skipped += current - tick
+                    tick = current + 1
+                else:
+                    self.skipped += max(current - tick - 1, 0)
+                    tick = current
+            await asyncio.sleep(max(start + tick * self.period - loop.time(), 0))
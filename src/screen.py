@@ -0,0 +1,94 @@
+from curses import (
+    KEY_DOWN,
+    KEY_END,
+    KEY_HOME,
+    KEY_NPAGE,
+    KEY_PPAGE,
+    KEY_RESIZE,
+    KEY_UP,
+    doupdate,
+)
+from typing import Callable, List, Sequence, Tuple, TypeVar
+
+
+T = TypeVar("T")
+
+# a line on screen: its text and curses attributes
+Line = Tuple[str, int]
+
+SCROLL_KEYS = {
+    KEY_UP: lambda offset, page: offset - 1,
+    KEY_DOWN: lambda offset, page: offset + 1,
+    KEY_PPAGE: lambda offset, page: offset - page,
+    KEY_NPAGE: lambda offset, page: offset + page,
+    KEY_HOME: lambda offset, page: 0,
+    KEY_END: lambda offset, page: float("inf"),
+}
+
+
+class Screen:
+    """Draws frames on a curses window, rewriting only the lines that changed.
+
+    A frame is made of fixed header lines followed by rows, of which only the
+    ones fitting on screen are formatted and drawn. Rows can be scrolled with
+    the arrow, page up/down, home and end keys.
+    """
+
+    def __init__(self, window) -> None:
+        self.window = window
+        self.offset = 0
+        self.frame: List[Line] = []
+        self._page = 1
+        self._total_rows = 0
+        window.nodelay(True)
+        window.keypad(True)
+
+    def handle_keys(self) -> bool:
+        """Consumes pending key presses, returns whether the frame must be redrawn."""
+        redraw = False
+        while True:
+            key = self.window.getch()
+            if key == -1:
+                return redraw
+            if key == KEY_RESIZE:
+                self.frame = []
+                self.window.clear()
+                redraw = True
+            elif key in SCROLL_KEYS:
+                offset = SCROLL_KEYS[key](self.offset, self._page)
+                last_page = max(self._total_rows - self._page, 0)
+                self.offset = int(min(max(offset, 0), last_page))
+                redraw = True
+
+    def draw(
+        self,
+        header: List[Line],
+        rows: Sequence[T],
+        format_row: Callable[[T], Line],
+    ) -> None:
+        """Draws the header and the visible rows, formatting only the latter."""
+        height, width = self.window.getmaxyx()
+        # the last line shows the scroll position
+        self._page = max(height - len(header) - 1, 1)
+        self._total_rows = len(rows)
+        self.offset = min(self.offset, max(len(rows) - self._page, 0))
+        visible = rows[self.offset : self.offset + self._page]
+        frame = list(header) + [format_row(row) for row in visible]
+        if len(rows) > self._page:
+            last = min(self.offset + self._page, len(rows))
+            frame.append((f"rows {self.offset + 1}-{last} of {len(rows)}", 0))
+
+        for y, (text, attr) in enumerate(frame[:height]):
+            # avoids writing to the bottom right corner, which curses rejects
+            text = text[: max(width - 3, 0)]
+            if y < len(self.frame) and self.frame[y] == (text, attr):
+                continue
+            self.window.move(y, 0)
+            self.window.clrtoeol()
+            self.window.addstr(y, 2, text, attr)
+        for y in range(len(frame), min(len(self.frame), height)):
+            self.window.move(y, 0)
+            self.window.clrtoeol()
+        self.frame = [(text[: max(width - 3, 0)], attr) for text, attr in frame]
+        self.window.noutrefresh()
+        doupdate()
@@ -1,30 +1,78 @@
-from dataclasses import dataclass
 from json import dumps
-from typing import Dict
+from sys import intern
+from typing import Dict, Optional, Union
+
+
+# value of a metric that could not be obtained from CPX
+MISSING = -1
+
+
+def parse_percentage(value: Optional[Union[str, int]]) -> int:
+    """Converts a percentage like "61%" into an int, MISSING if there is none."""
+    if value is None or value == "":
+        return MISSING
+    if isinstance(value, int):
+        return value
+    return int(value.replace("%", ""))
 
 
-@dataclass
 class ServerData:
-    """Represents the information related to a single server."""
+    """Represents the information related to a single server.
 
-    ip: str
-    details: Dict[str, str]
+    Metrics are parsed and the service name is interned once at construction,
+    and slots keep the per server footprint small for large fleets.
+    """
 
-    def __str__(self) -> str:
-        """A useful string representation of this server."""
-        return f"[{self.ip}] {dumps(self.details)}"
+    __slots__ = ("ip", "cpu", "memory", "service")
 
-    @property
-    def memory(self) -> int:
-        """The pct of memory used in this server."""
-        return int((self.details.get("memory", "") or "-1").replace("%", ""))
+    def __init__(self, ip: str, details: Dict[str, str]) -> None:
+        self.ip = ip
+        self.cpu = parse_percentage(details.get("cpu"))
+        self.memory = parse_percentage(details.get("memory"))
+        self.service = intern(details.get("service") or "unknown")
+
+    @classmethod
+    def from_values(
+        cls, ip: str, cpu: int, memory: int, service: Optional[str]
+    ) -> "ServerData":
+        """Creates a server from already parsed values."""
+        server = cls.__new__(cls)
+        server.ip = ip
+        server.cpu = cpu
+        server.memory = memory
+        server.service = intern(service or "unknown")
+        return server
 
     @property
-    def cpu(self) -> int:
-        """The pct of user used in this server."""
-        return int((self.details.get("cpu", "") or "-1").replace("%", ""))
+    def details(self) -> Dict[str, Optional[str]]:
+        """The details as reported by CPX."""
+        return {
+            "cpu": None if self.cpu == MISSING else f"{self.cpu}%",
+            "memory": None if self.memory == MISSING else f"{self.memory}%",
+            "service": self.service,
+        }
 
     @property
-    def service(self) -> str:
-        """The name of the server hosted this server."""
-        return self.details.get("service", "unknown") or "unknown"
+    def missing(self) -> bool:
+        """Whether CPX failed to report the metrics of this server."""
+        return self.cpu == MISSING and self.memory == MISSING
+
+    def __str__(self) -> str:
+        """A useful string representation of this server."""
+        return f"[{self.ip}] {dumps(self.details)}"
+
+    def __repr__(self) -> str:
+        return (
+            f"ServerData(ip={self.ip!r}, cpu={self.cpu!r}, "
+            f"memory={self.memory!r}, service={self.service!r})"
+        )
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, ServerData):
+            return NotImplemented
+        return (self.ip, self.cpu, self.memory, self.service) == (
+            other.ip,
+            other.cpu,
+            other.memory,
+            other.service,
+        )
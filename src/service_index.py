@@ -0,0 +1,126 @@
+from pathlib import Path
+from time import time
+from typing import Callable, Collection, Dict, Iterable, List, NamedTuple, Optional
+
+from src.cache import DEFAULT_CACHE_DIR
+from src.cpx_client import logger
+from src.files import replace_file
+from src.server_data import ServerData
+
+
+# where the services of the servers of each cpx api are kept by default
+DEFAULT_INDEX_DIR = DEFAULT_CACHE_DIR / "index"
+
+
+def index_path(host: str, port: int) -> Path:
+    """The default file of the service index of a cpx api."""
+    return DEFAULT_INDEX_DIR / f"{host}_{port}.tsv"
+
+
+class IndexEntry(NamedTuple):
+    """The service of a server and when it was last seen (epoch seconds)."""
+
+    service: str
+    verified_at: float
+
+
+class ServiceIndex:
+    """The service of each server, as last seen in its details.
+
+    Questions about some services only need the details of their servers:
+    the index tells which servers to poll, those of the services along with
+    the ones it does not know yet. Servers that are no longer listed by CPX
+    are forgotten, and the service of a server is verified by polling it
+    again once its entry is older than `ttl` seconds, whatever its service.
+
+    When a path is given, entries are loaded from it on `load` and written
+    back on `save`, so that successive runs share them.
+    """
+
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        ttl: float = 3600.0,
+        clock: Callable[[], float] = time,
+    ) -> None:
+        assert ttl >= 0, f"invalid index ttl: {ttl}"
+        self.path = path
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[str, IndexEntry] = {}
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def service(self, ip: str) -> Optional[str]:
+        """The service of a server, if known."""
+        entry = self._entries.get(ip)
+        return None if entry is None else entry.service
+
+    def record(self, server: ServerData) -> None:
+        """Takes note of the service of a server whose details were just fetched."""
+        if server.missing:
+            return
+        self._entries[server.ip] = IndexEntry(server.service, self.clock())
+        self._dirty = True
+
+    def retain(self, server_ips: Iterable[str]) -> None:
+        """Forgets the servers that are not in the current list of servers."""
+        entries = self._entries
+        current = set(server_ips)
+        departed = [ip for ip in entries if ip not in current]
+        for ip in departed:
+            del entries[ip]
+        if departed:
+            self._dirty = True
+
+    def select(self, services: Collection[str], server_ips: List[str]) -> List[str]:
+        """The servers to poll for some services, in order.
+
+        Those are the servers known to be in one of the services, and the ones
+        whose service is unknown or due for verification.
+        """
+        entries = self._entries
+        expired = self.clock() - self.ttl
+        selected = []
+        for ip in server_ips:
+            entry = entries.get(ip)
+            if entry is None or entry.verified_at < expired:
+                self.misses += 1
+                selected.append(ip)
+            else:
+                self.hits += 1
+                if entry.service in services:
+                    selected.append(ip)
+        return selected
+
+    def load(self) -> None:
+        """Reads the index file, if any, ignoring it altogether if it is malformed."""
+        path = self.path
+        if path is None or not path.exists():
+            return
+        try:
+            with open(path, "r") as file:
+                for line in file:
+                    ip, service, verified_at = line.rstrip("\n").split("\t")
+                    self._entries[ip] = IndexEntry(service, float(verified_at))
+        except (OSError, ValueError) as error:
+            logger.error("Ignoring unreadable index: %s, error: %s", path, str(error))
+            self._entries.clear()
+
+    def save(self) -> None:
+        """Writes the index file, when servers were recorded or forgotten since."""
+        path = self.path
+        if path is None or not self._dirty:
+            return
+        replace_file(
+            path,
+            "".join(
+                f"{ip}\t{entry.service}\t{entry.verified_at}\n"
+                for ip, entry in self._entries.items()
+            ),
+        )
+        self._dirty = False
@@ -0,0 +1,197 @@
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Set
+
+from src.server_data import ServerData
+from src.services_statistics import interpolate_quartiles
+
+
+class ValueDistribution:
+    """Keeps a multiset of integer samples, each one owned by a server ip.
+
+    Samples are bucketed by value, so adding or removing one costs a dict update
+    plus a bisect over the distinct values, and order statistics walk the
+    distinct values only. CPU and memory are percentages, hence there are at
+    most 101 distinct values regardless of the number of servers.
+    """
+
+    def __init__(self) -> None:
+        self.owners: Dict[int, Dict[str, None]] = {}
+        self.values: List[int] = []
+        self.total = 0
+
+    def __len__(self) -> int:
+        return self.total
+
+    def add(self, value: int, ip: str) -> None:
+        """Adds a sample owned by the given ip."""
+        owners = self.owners.get(value)
+        if owners is None:
+            owners = self.owners[value] = {}
+            insort(self.values, value)
+        owners[ip] = None
+        self.total += 1
+
+    def remove(self, value: int, ip: str) -> None:
+        """Removes the sample owned by the given ip."""
+        owners = self.owners[value]
+        del owners[ip]
+        self.total -= 1
+        if len(owners) == 0:
+            del self.owners[value]
+            del self.values[bisect_left(self.values, value)]
+
+    @property
+    def min(self) -> int:
+        """The smallest sample."""
+        return self.values[0]
+
+    @property
+    def max(self) -> int:
+        """The largest sample."""
+        return self.values[-1]
+
+    @property
+    def argmin(self) -> str:
+        """The ip owning the smallest sample, the latest one on ties."""
+        return next(reversed(self.owners[self.values[0]]))
+
+    @property
+    def argmax(self) -> str:
+        """The ip owning the largest sample, the latest one on ties."""
+        return next(reversed(self.owners[self.values[-1]]))
+
+    def nth(self, index: int) -> int:
+        """The sample at the given position if all samples were sorted."""
+        for value in self.values:
+            index -= len(self.owners[value])
+            if index < 0:
+                return value
+        raise IndexError("sample index out of range")
+
+    def quantiles(self) -> List[float]:
+        """Min, quartiles and max, matching `services_statistics.get_quantiles`."""
+        size = self.total
+        if size == 0:
+            return [0.0, 0.0, 0.0, 0.0, 0.0]
+        min_val = float(self.min)
+        max_val = float(self.max)
+        if size < 4:
+            return [min_val, 0.0, 0.0, 0.0, max_val]
+        return [min_val] + interpolate_quartiles(size, self.nth) + [max_val]
+
+
+class ServiceAggregate:
+    """Statistics of the servers hosting a single service."""
+
+    def __init__(self) -> None:
+        self.ips: Dict[str, None] = {}
+        self.cpu = ValueDistribution()
+        self.memory = ValueDistribution()
+        self.servers = 0
+        self._cpu_quantiles = None
+        self._memory_quantiles = None
+
+    def add(self, server: ServerData) -> None:
+        """Accounts for a server, ignoring its metrics if they are unknown."""
+        self.servers += 1
+        if server.memory >= 0 and server.cpu >= 0:
+            self.ips[server.ip] = None
+            self.cpu.add(server.cpu, server.ip)
+            self.memory.add(server.memory, server.ip)
+            self._cpu_quantiles = self._memory_quantiles = None
+
+    def remove(self, server: ServerData) -> None:
+        """Stops accounting for a server previously added."""
+        self.servers -= 1
+        if server.memory >= 0 and server.cpu >= 0:
+            del self.ips[server.ip]
+            self.cpu.remove(server.cpu, server.ip)
+            self.memory.remove(server.memory, server.ip)
+            self._cpu_quantiles = self._memory_quantiles = None
+
+    @property
+    def cpu_quantiles(self) -> List[float]:
+        """Min, quartiles and max of cpu usage, cached until the next change."""
+        if self._cpu_quantiles is None:
+            self._cpu_quantiles = self.cpu.quantiles()
+        return self._cpu_quantiles
+
+    @property
+    def memory_quantiles(self) -> List[float]:
+        """Min, quartiles and max of memory usage, cached until the next change."""
+        if self._memory_quantiles is None:
+            self._memory_quantiles = self.memory.quantiles()
+        return self._memory_quantiles
+
+
+class ServicesAggregator:
+    """Incrementally maintains statistics about services as servers change.
+
+    Every operation only touches the services of the servers involved, and
+    services whose statistics changed are tracked in `changed` until
+    `clear_changed` is called, so consumers can redo work just for them.
+    """
+
+    def __init__(self, servers: Iterable[ServerData] = ()) -> None:
+        self.servers: Dict[str, ServerData] = {}
+        self.aggregates: Dict[str, ServiceAggregate] = {}
+        self.changed: Set[str] = set()
+        for server in servers:
+            self.add(server)
+
+    @property
+    def services(self) -> List[str]:
+        """The services hosted in at least one server."""
+        return list(self.aggregates)
+
+    def __getitem__(self, service: str) -> ServiceAggregate:
+        return self.aggregates[service]
+
+    def add(self, server: ServerData) -> None:
+        """Accounts for a new server, or updates it if it is already known."""
+        old = self.servers.get(server.ip)
+        if old is not None:
+            self.update(server, old)
+            return
+        self.servers[server.ip] = server
+        self._add(server)
+
+    def update(self, server: ServerData, old: Optional[ServerData] = None) -> bool:
+        """Replaces the previous data of a server, returns whether anything changed."""
+        if old is None:
+            old = self.servers[server.ip]
+        self.servers[server.ip] = server
+        if (old.service, old.cpu, old.memory) == (
+            server.service,
+            server.cpu,
+            server.memory,
+        ):
+            return False
+        self._remove(old)
+        self._add(server)
+        return True
+
+    def remove(self, ip: str) -> Optional[ServerData]:
+        """Stops accounting for a server, returns its last known data if any."""
+        server = self.servers.pop(ip, None)
+        if server is not None:
+            self._remove(server)
+        return server
+
+    def clear_changed(self) -> None:
+        """Forgets which services changed so far."""
+        self.changed.clear()
+
+    def _add(self, server: ServerData) -> None:
+        aggregate = self.aggregates.get(server.service)
+        if aggregate is None:
+            aggregate = self.aggregates[server.service] = ServiceAggregate()
+        aggregate.add(server)
+        self.changed.add(server.service)
+
+    def _remove(self, server: ServerData) -> None:
+        aggregate = self.aggregates[server.service]
+        aggregate.remove(server)
+        if aggregate.servers == 0:
+            del self.aggregates[server.service]
+        self.changed.add(server.service)
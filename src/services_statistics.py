@@ -1,6 +1,6 @@
 from collections import defaultdict
 from statistics import quantiles
-from typing import List
+from typing import Callable, Iterable, List
 
 from src.server_data import ServerData
 
@@ -17,10 +17,30 @@ def get_quantiles(numbers: List[int]) -> List[float]:
     return [0.0, 0.0, 0.0, 0.0, 0.0]
 
 
+def interpolate_quartiles(size: int, nth: Callable[[int], float]) -> List[float]:
+    """Quartiles of `size` ranked samples, `nth` returning the sample at a given rank.
+
+    Interpolates the same way as `statistics.quantiles(n=4, method="exclusive")`
+    without requiring the samples to be materialized in a sorted list.
+    """
+    assert size >= 4, f"at least 4 samples are required, found {size}"
+    result = []
+    m = size + 1
+    for i in range(1, 4):
+        j = min(max(i * m // 4, 1), size - 1)
+        delta = i * m - j * 4
+        result.append((nth(j - 1) * (4 - delta) + nth(j) * delta) / 4)
+    return result
+
+
 class SerivesStatistics:
-    """Generates statistics about services given a list of servers."""
+    """Generates statistics about services given a list of servers.
 
-    def __init__(self, servers: List[ServerData]) -> None:
+    Servers can also be fed one at a time with `add`, in which case `compile`
+    must be called once all of them arrived to compute the quantiles.
+    """
+
+    def __init__(self, servers: Iterable[ServerData] = ()) -> None:
         self.memory_counts = defaultdict(list)
         self.cpu_counts = defaultdict(list)
         self.ips = defaultdict(list)
@@ -32,35 +52,40 @@ class SerivesStatistics:
         self.cpu_quantiles = defaultdict(list)
         self.services = set()
 
-        min_cpu = defaultdict(lambda: 100)
-        max_cpu = defaultdict(int)
-        min_memory = defaultdict(lambda: 100)
-        max_memory = defaultdict(int)
+        self._min_cpu = defaultdict(lambda: 100)
+        self._max_cpu = defaultdict(int)
+        self._min_memory = defaultdict(lambda: 100)
+        self._max_memory = defaultdict(int)
 
         for server in servers:
-            service = server.service
-            self.services.add(service)
-            memory = server.memory
-            cpu = server.cpu
-            if memory >= 0 and cpu >= 0:
-                if memory <= min_memory[service]:
-                    self.ip_memory_min[service] = server.ip
-                    min_memory[service] = memory
-                if memory >= max_memory[service]:
-                    self.ip_memory_max[service] = server.ip
-                    max_memory[service] = memory
-                if cpu <= min_cpu[service]:
-                    self.ip_cpu_min[service] = server.ip
-                    min_cpu[service] = cpu
-                if cpu >= max_cpu[service]:
-                    self.ip_cpu_max[service] = server.ip
-                    max_cpu[service] = cpu
-                self.memory_counts[service].append(memory)
-                self.cpu_counts[service].append(cpu)
-                self.ips[service].append(server.ip)
+            self.add(server)
+        self.compile()
+
+    def add(self, server: ServerData) -> None:
+        """Accounts for a single server."""
+        service = server.service
+        self.services.add(service)
+        memory = server.memory
+        cpu = server.cpu
+        if memory >= 0 and cpu >= 0:
+            if memory <= self._min_memory[service]:
+                self.ip_memory_min[service] = server.ip
+                self._min_memory[service] = memory
+            if memory >= self._max_memory[service]:
+                self.ip_memory_max[service] = server.ip
+                self._max_memory[service] = memory
+            if cpu <= self._min_cpu[service]:
+                self.ip_cpu_min[service] = server.ip
+                self._min_cpu[service] = cpu
+            if cpu >= self._max_cpu[service]:
+                self.ip_cpu_max[service] = server.ip
+                self._max_cpu[service] = cpu
+            self.memory_counts[service].append(memory)
+            self.cpu_counts[service].append(cpu)
+            self.ips[service].append(server.ip)
 
+    def compile(self) -> None:
+        """Computes the quantiles of every service from the servers added so far."""
         for service in self.services:
-            self.memory_quantiles[service].extend(
-                get_quantiles(self.memory_counts[service])
-            )
-            self.cpu_quantiles[service].extend(get_quantiles(self.cpu_counts[service]))
+            self.memory_quantiles[service] = get_quantiles(self.memory_counts[service])
+            self.cpu_quantiles[service] = get_quantiles(self.cpu_counts[service])
@@ -0,0 +1,53 @@
+from collections import deque
+from typing import Deque, Dict, Iterable, Tuple
+
+from src.server_data import ServerData
+
+
+# block characters of sparklines, from lowest to highest
+TICKS = "▁▂▃▄▅▆▇█"
+# samples kept of each server, one per refresh
+TREND_POINTS = 30
+
+
+def sparkline(values: Iterable[int]) -> str:
+    """Percentages drawn as a line of block characters, one per value."""
+    top = len(TICKS) - 1
+    return "".join([TICKS[min(max(value, 0), 100) * top // 100] for value in values])
+
+
+class Trends:
+    """The latest samples of each server, in bounded ring buffers.
+
+    Each server gets buffers of its last `points` cpu and memory samples,
+    the oldest dropped as new ones are added, so memory stays bounded however
+    long watch mode runs.
+    """
+
+    def __init__(self, points: int = TREND_POINTS) -> None:
+        assert points > 0, f"invalid number of points: {points}"
+        self.points = points
+        self.buffers: Dict[str, Tuple[Deque[int], Deque[int]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.buffers)
+
+    def add(self, server: ServerData) -> None:
+        """Appends the sample of a server."""
+        buffers = self.buffers.get(server.ip)
+        if buffers is None:
+            buffers = self.buffers[server.ip] = (
+                deque(maxlen=self.points),
+                deque(maxlen=self.points),
+            )
+        buffers[0].append(server.cpu)
+        buffers[1].append(server.memory)
+
+    def remove(self, ip: str) -> None:
+        """Forgets the samples of a server."""
+        self.buffers.pop(ip, None)
+
+    def sparklines(self, ip: str) -> Tuple[str, str]:
+        """The cpu and memory sparklines of a server."""
+        cpus, memories = self.buffers.get(ip, ((), ()))
+        return sparkline(cpus), sparkline(memories)
@@ -0,0 +1,339 @@
+import asyncio
+from collections import deque
+from dataclasses import dataclass
+from sys import intern
+from time import time
+from typing import Callable, Deque, Dict, List, Optional, Set
+
+from src.cpx_client import CpxClientError
+from src.fetcher import Fetcher
+from src.history import SampleRecorder
+from src.result_lines import FullResultLine, InstanceResultLine, SummaryResultLine
+from src.results_compiler import ResultsCompiler
+from src.server_data import ServerData
+from src.service_index import ServiceIndex
+from src.services_aggregator import ServicesAggregator
+from src.trends import TREND_POINTS, Trends
+
+
+# number of membership changes remembered by the watcher
+EVENTS_KEPT = 100
+
+
+@dataclass(frozen=True)
+class MembershipEvent:
+    """A server that joined or left a service, at a given loop time."""
+
+    kind: str
+    ip: str
+    service: str
+    at: float
+
+    def __str__(self) -> str:
+        sign = "+" if self.kind == "joined" else "-"
+        return f"{sign}{self.ip} ({self.service})"
+
+
+class Watcher:
+    """Long-lived state of watch mode, kept between refreshes.
+
+    The list of servers is refreshed on its own (slower) cadence, details are
+    polled through the fetcher's pooled connections, and statistics are
+    updated in place so that only services whose servers changed get their
+    summary recomputed.
+
+    While polling, an optional callback is invoked at most every
+    `progress_interval` seconds with summaries already updated, so the screen
+    can show fresh samples as they arrive instead of after the slowest server.
+
+    When CPX fails, the last good data is kept: the previous list of servers
+    if it cannot be fetched, and the previous sample of each server whose
+    details cannot be. The watcher is `stale` while CPX as a whole is failing
+    (the list of servers cannot be fetched or the breaker is open), servers
+    whose details alone failed are in `failed_ips`.
+
+    Each new list of servers is diffed against the previous one: servers that
+    left are dropped from the statistics right away, servers that joined are
+    polled first, and both are recorded as membership `events` (a server
+    joins its service once its first sample tells which one it is).
+
+    With a recorder, the samples polled by each refresh are handed over to
+    be kept in a history.
+
+    Given a service, only its servers are polled once known: every server is
+    polled while its service is not in the service index (at first, when it
+    joins, or when its entry is due for verification), after which the
+    servers of other services are left out. The last `trend_points` samples
+    of each server of the service are kept for its sparklines.
+    """
+
+    def __init__(
+        self,
+        fetcher: Fetcher,
+        mode: str,
+        servers_refresh: float = 30.0,
+        progress_interval: float = 0.1,
+        recorder: Optional[SampleRecorder] = None,
+        service: Optional[str] = None,
+        trend_points: int = TREND_POINTS,
+        index: Optional[ServiceIndex] = None,
+    ) -> None:
+        assert mode in ("simple", "complete")
+        self.fetcher = fetcher
+        self.mode = mode
+        self.servers_refresh = servers_refresh
+        self.progress_interval = progress_interval
+        self.recorder = recorder
+        self.service = service
+        self.index = ServiceIndex() if index is None else index
+        self.trends = Trends(trend_points)
+        self.failed_ips: Set[str] = set()
+        self.polled: List[ServerData] = []
+        self.server_ips: List[str] = []
+        self.poll_ips: List[str] = []
+        self.server_set: Set[str] = set()
+        self.joining: Set[str] = set()
+        self.events: Deque[MembershipEvent] = deque(maxlen=EVENTS_KEPT)
+        self.servers_refreshed_at: Optional[float] = None
+        # statistics are updated in place, the columnar backend only computes
+        # them in bulk for snapshots
+        self.aggregator = ServicesAggregator()
+        self.summaries: Dict[str, SummaryResultLine] = {}
+        self.complete = True
+        self.refreshed = 0
+        self.failed = 0
+        self.servers_failed = False
+        self.sampled_at: Dict[str, float] = {}
+        self._rows: Dict[str, List[FullResultLine]] = {}
+        self._stale_rows: Set[str] = set()
+        self._full_lines: Optional[List[FullResultLine]] = None
+
+    @property
+    def lines(self) -> List[SummaryResultLine]:
+        """The current summary of each service, sorted by service name."""
+        return [self.summaries[service] for service in sorted(self.summaries)]
+
+    @property
+    def full_lines(self) -> List[FullResultLine]:
+        """The current report of each server with a summarized service, by service.
+
+        Lines are kept between calls, and only those of the services whose
+        summary changed since are rebuilt.
+        """
+        if self._full_lines is None:
+            self._update_rows()
+            rows = self._rows
+            self._full_lines = [
+                line for service in sorted(rows) for line in rows[service]
+            ]
+        return self._full_lines
+
+    def _update_rows(self) -> None:
+        stale = self._stale_rows
+        if not stale:
+            return
+        rows = self._rows
+        for service in stale:
+            rows.pop(service, None)
+        for server in self.aggregator.servers.values():
+            service = server.service
+            if service in stale and service in self.summaries:
+                line = ResultsCompiler.full_line(
+                    server, self.mode, self.summaries[service]
+                )
+                rows.setdefault(service, []).append(line)
+        stale.clear()
+
+    def servers_to_poll(self) -> List[str]:
+        """The servers to poll, all but the known ones of other services."""
+        if self.service is None:
+            return self.server_ips
+        return self.index.select([self.service], self.server_ips)
+
+    @property
+    def instance_lines(self) -> List[InstanceResultLine]:
+        """The latest samples and sparklines of each server of the service, by ip."""
+        lines = []
+        servers = self.aggregator.servers
+        for ip in sorted(servers):
+            server = servers[ip]
+            cpu_trend, memory_trend = self.trends.sparklines(ip)
+            lines.append(
+                InstanceResultLine(
+                    ip,
+                    server.cpu,
+                    server.memory,
+                    cpu_trend,
+                    memory_trend,
+                    ip in self.failed_ips,
+                    self.mode,
+                )
+            )
+        return lines
+
+    @property
+    def stale(self) -> bool:
+        """Whether CPX is failing, so that the last good data is shown."""
+        breaker = self.fetcher.client.breaker
+        return self.servers_failed or (breaker is not None and not breaker.closed)
+
+    def recent_events(self, seconds: float) -> List[MembershipEvent]:
+        """The membership changes of the last seconds, oldest first."""
+        since = asyncio.get_running_loop().time() - seconds
+        return [event for event in self.events if event.at >= since]
+
+    def ages(self) -> Dict[str, float]:
+        """Seconds since the latest sample of each service was received."""
+        now = asyncio.get_running_loop().time()
+        return {
+            service: now - self.sampled_at.get(service, now)
+            for service in self.summaries
+        }
+
+    def servers_refresh_due(self) -> bool:
+        """Whether the list of servers is older than its refresh period."""
+        if self.servers_refreshed_at is None:
+            return True
+        now = asyncio.get_running_loop().time()
+        return now - self.servers_refreshed_at >= self.servers_refresh
+
+    async def refresh_servers(self) -> None:
+        """Fetches the list of servers, forgetting the ones that left.
+
+        The previous list is kept if it cannot be fetched, and fetching it again
+        is attempted on the next refresh.
+        """
+        try:
+            server_ips = await self.fetcher.client.get_servers()
+        except CpxClientError:
+            self.servers_failed = True
+            return
+        self.servers_failed = False
+        self.servers_refreshed_at = asyncio.get_running_loop().time()
+        self.update_servers(server_ips)
+
+    def update_servers(self, server_ips: List[str]) -> None:
+        """Applies a new list of servers, from its difference with the previous one."""
+        server_ips = [intern(ip) for ip in server_ips]
+        current = set(server_ips)
+        previous = self.server_set
+        joined = current - previous
+        now = asyncio.get_running_loop().time()
+        for ip in previous - current:
+            self.joining.discard(ip)
+            self.trends.remove(ip)
+            server = self.aggregator.remove(ip)
+            if server is not None:
+                self.events.append(MembershipEvent("left", ip, server.service, now))
+        if previous:
+            # the first list is the initial membership, not a change of it
+            self.joining |= joined
+        # new servers are polled first, the others keep their order
+        self.server_ips = [ip for ip in server_ips if ip in joined] + [
+            ip for ip in server_ips if ip not in joined
+        ]
+        self.server_set = current
+        if self.service is not None:
+            self.index.retain(server_ips)
+
+    async def refresh(
+        self,
+        deadline: Optional[float] = None,
+        on_progress: Optional[Callable[[], None]] = None,
+    ) -> List[SummaryResultLine]:
+        """Polls details of every known server and returns the updated summary.
+
+        When a deadline is given polling stops once it is reached, and the
+        summary reflects the servers polled so far along with the previous data
+        of the others.
+        """
+        if self.servers_refresh_due():
+            await self.refresh_servers()
+        self.complete = True
+        self.refreshed = 0
+        self.failed = 0
+        self.failed_ips.clear()
+        self.poll_ips = self.servers_to_poll()
+        self.polled = []
+        if on_progress is not None:
+            # shows the last known values right away
+            on_progress()
+        if deadline is None:
+            await self.poll(on_progress)
+        else:
+            timeout = max(deadline - asyncio.get_running_loop().time(), 0)
+            try:
+                await asyncio.wait_for(self.poll(on_progress), timeout)
+            except asyncio.TimeoutError:
+                self.complete = False
+        if self.recorder is not None and self.polled:
+            self.recorder.record(self.polled, time())
+        self.update_summaries()
+        return self.lines
+
+    async def poll(self, on_progress: Optional[Callable[[], None]] = None) -> None:
+        """Polls details of every known server, updating statistics as they arrive."""
+        loop = asyncio.get_running_loop()
+        progressed_at = loop.time()
+        details = self.fetcher.iter_details(self.poll_ips)
+        try:
+            async for server in details:
+                if server.missing and server.ip in self.aggregator.servers:
+                    # keeps the last good sample rather than an empty one
+                    self.failed += 1
+                    self.failed_ips.add(server.ip)
+                    continue
+                if self.service is not None:
+                    if server.missing:
+                        # its service is still unknown, it is polled again
+                        continue
+                    self.index.record(server)
+                    if server.service != self.service:
+                        # left out of later polls, and of the statistics if it moved
+                        self.joining.discard(server.ip)
+                        self.aggregator.remove(server.ip)
+                        self.trends.remove(server.ip)
+                        continue
+                if server.ip in self.joining and not server.missing:
+                    self.joining.discard(server.ip)
+                    self.events.append(
+                        MembershipEvent(
+                            "joined", server.ip, server.service, loop.time()
+                        )
+                    )
+                self.aggregator.add(server)
+                if self.service is not None:
+                    self.trends.add(server)
+                if self.recorder is not None:
+                    self.polled.append(server)
+                self.refreshed += 1
+                now = loop.time()
+                self.sampled_at[server.service] = now
+                if (
+                    on_progress is not None
+                    and now - progressed_at >= self.progress_interval
+                ):
+                    progressed_at = now
+                    self.update_summaries()
+                    on_progress()
+        finally:
+            # stops pending requests as soon as polling is interrupted
+            await details.aclose()
+
+    def update_summaries(self) -> None:
+        """Recomputes the summaries of the services that changed since last time.
+
+        Services whose last server left or moved are forgotten altogether.
+        """
+        for service in self.aggregator.changed:
+            if service in self.aggregator.aggregates:
+                self.summaries[service] = ResultsCompiler.summary_line(
+                    service, self.aggregator[service], self.mode
+                )
+            else:
+                self.summaries.pop(service, None)
+                self.sampled_at.pop(service, None)
+        if self.aggregator.changed:
+            self._stale_rows |= self.aggregator.changed
+            self._full_lines = None
+        self.aggregator.clear_changed()
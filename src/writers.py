@@ -0,0 +1,102 @@
+import csv
+import sys
+from io import StringIO
+from typing import Iterable, Optional, TextIO
+
+from src.formatters import compile_formatter, compile_values
+
+
+STREAM_FORMATS = ("csv", "json", "ndjson")
+
+# characters buffered before being written to the output in one go
+CHUNK_SIZE = 1 << 16
+
+
+class RowWriter:
+    """Writes the rows of a csv, json or ndjson report as lines come.
+
+    Rows are buffered and written to the output in large chunks. csv rows go
+    through a single csv writer, json reports are written as an array one
+    element at a time, and ndjson reports as one object per line, so memory
+    stays constant no matter the number of rows.
+
+    Typed reports keep numbers as numbers: csv only quotes text fields and
+    joins the ips of services with spaces, json writes them as arrays.
+
+    Lines of a report must all be of the same type and mode, which are taken
+    from the first one.
+    """
+
+    def __init__(
+        self,
+        format: str,
+        stream: Optional[TextIO] = None,
+        chunk_size: int = CHUNK_SIZE,
+        typed: bool = False,
+    ) -> None:
+        assert format in STREAM_FORMATS, f"invalid format: {format}"
+        self.format = format
+        self.typed = typed
+        self.stream = sys.stdout if stream is None else stream
+        self.chunk_size = chunk_size
+        self.rows = 0
+        self._buffer = StringIO()
+        self._csv = csv.writer(
+            self._buffer,
+            delimiter=",",
+            quotechar='"',
+            quoting=csv.QUOTE_NONNUMERIC if typed else csv.QUOTE_ALL,
+        )
+        self._render = None
+
+    def __enter__(self) -> "RowWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def _start(self, line) -> None:
+        line_type = type(line)
+        if self.format == "csv":
+            self._render = compile_values(line_type, line.mode, join_lists=self.typed)
+            self._buffer.write(line.csv_header_line + "\n")
+        else:
+            self._render = compile_formatter(
+                line_type, line.mode, "json", typed=self.typed
+            )
+            if self.format == "json":
+                self._buffer.write("[")
+
+    def write(self, line) -> None:
+        """Writes the row of a line."""
+        if self.rows == 0:
+            self._start(line)
+        if self.format == "csv":
+            self._csv.writerow(self._render(line))
+        elif self.format == "json":
+            if self.rows > 0:
+                self._buffer.write(",")
+            self._buffer.write(self._render(line))
+        else:
+            self._buffer.write(self._render(line) + "\n")
+        self.rows += 1
+        if self._buffer.tell() >= self.chunk_size:
+            self.flush()
+
+    def write_all(self, lines: Iterable) -> None:
+        """Writes the rows of many lines."""
+        for line in lines:
+            self.write(line)
+
+    def flush(self) -> None:
+        """Writes buffered rows to the output."""
+        self.stream.write(self._buffer.getvalue())
+        self._buffer.seek(0)
+        self._buffer.truncate()
+
+    def close(self) -> None:
+        """Ends the report and writes everything left to the output."""
+        if self.format == "json":
+            self._buffer.write("]\n" if self.rows > 0 else "[]\n")
+        self.flush()
+        self.stream.flush()
@@ -0,0 +1,164 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from json import dumps
+
+from src.cache import CachedCpxClient, ResponseCache
+from src.cpx_client import CpxClientServerError
+from tests.utils import FakeClock
+
+
+def test_cache_evicts_least_recently_used():
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", b"1")
+    cache.put("b", b"2")
+    assert cache.get("a").body == b"1"
+    cache.put("c", b"3")
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert len(cache) == 2
+
+
+def test_cache_persists_on_disk(tmp_path):
+    clock = FakeClock(1000.0)
+    cache = ResponseCache(directory=tmp_path, clock=clock)
+    cache.put("a", b"1")
+    cache.save()
+
+    clock.now += 10
+    loaded = ResponseCache(directory=tmp_path, clock=clock)
+    loaded.load()
+    entry = loaded.get("a")
+    assert entry.body == b"1"
+    assert loaded.age(entry) == 10
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        b"not a cache",
+        b'{"a": 1}',
+        b'[["a", "MQ==", 1000], ["b"]]',
+        b'[["a", "not base64!", 1000]]',
+        b'[["a", "MQ==", "yesterday"]]',
+    ],
+)
+def test_cache_ignores_unreadable_file(tmp_path, content):
+    (tmp_path / "responses.json").write_bytes(content)
+    cache = ResponseCache(directory=tmp_path)
+    cache.load()
+    assert len(cache) == 0
+
+
+@pytest.fixture
+def server(loop, aiohttp_server):
+    app = web.Application()
+    app["state"] = {"requests": 0, "status": 200, "delay": 0.01}
+
+    async def get_servers_list(request):
+        state = request.app["state"]
+        state["requests"] += 1
+        await asyncio.sleep(state["delay"])
+        return web.Response(
+            status=state["status"],
+            body=dumps(["10.58.1.67", str(state["requests"])]).encode(),
+        )
+
+    app.router.add_get("/servers", get_servers_list)
+    return loop.run_until_complete(aiohttp_server(app))
+
+
+@pytest.mark.asyncio
+async def test_client_serves_fresh_then_stale(server):
+    clock = FakeClock(1000.0)
+    cache = ResponseCache(clock=clock)
+    async with CachedCpxClient(
+        "127.0.0.1", server.port, cache=cache, servers_ttl=10, stale_ttl=20
+    ) as client:
+        # concurrent misses share one request
+        first, second = await asyncio.gather(client.get_servers(), client.get_servers())
+        assert first == second == ["10.58.1.67", "1"]
+        assert server.app["state"]["requests"] == 1
+
+        clock.now += 5
+        assert await client.get_servers() == ["10.58.1.67", "1"]
+        assert server.app["state"]["requests"] == 1
+
+        clock.now += 10
+        # stale: answered right away, revalidated in the background
+        assert await client.get_servers() == ["10.58.1.67", "1"]
+        await asyncio.gather(*client._pending.values())
+        assert server.app["state"]["requests"] == 2
+        assert await client.get_servers() == ["10.58.1.67", "2"]
+
+        clock.now += 60
+        assert await client.get_servers() == ["10.58.1.67", "3"]
+
+    assert (cache.hits, cache.stale_hits, cache.misses) == (2, 1, 3)
+
+
+@pytest.mark.asyncio
+async def test_client_keeps_stale_entry_on_failed_revalidation(server):
+    clock = FakeClock(1000.0)
+    cache = ResponseCache(clock=clock)
+    async with CachedCpxClient(
+        "127.0.0.1", server.port, cache=cache, servers_ttl=10, stale_ttl=20
+    ) as client:
+        await client.get_servers()
+        server.app["state"]["status"] = 503
+
+        clock.now += 15
+        assert await client.get_servers() == ["10.58.1.67", "1"]
+        await asyncio.gather(*client._pending.values(), return_exceptions=True)
+        assert await client.get_servers() == ["10.58.1.67", "1"]
+
+        clock.now += 20
+        with pytest.raises(CpxClientServerError):
+            await client.get_servers()
+
+
+@pytest.mark.asyncio
+async def test_client_shares_cache_across_runs(server, tmp_path):
+    for _ in range(2):
+        async with CachedCpxClient(
+            "127.0.0.1", server.port, cache=ResponseCache(directory=tmp_path)
+        ) as client:
+            assert await client.get_servers() == ["10.58.1.67", "1"]
+    assert server.app["state"]["requests"] == 1
+
+
+@pytest.mark.asyncio
+async def test_client_saves_revalidated_responses(server, tmp_path):
+    clock = FakeClock(1000.0)
+
+    def run():
+        return CachedCpxClient(
+            "127.0.0.1",
+            server.port,
+            cache=ResponseCache(directory=tmp_path, clock=clock),
+            servers_ttl=10,
+            stale_ttl=20,
+        )
+
+    async with run() as client:
+        assert await client.get_servers() == ["10.58.1.67", "1"]
+    clock.now += 15
+    async with run() as client:
+        # stale, revalidated in the background before the run ends
+        assert await client.get_servers() == ["10.58.1.67", "1"]
+    async with run() as client:
+        assert await client.get_servers() == ["10.58.1.67", "2"]
+    assert server.app["state"]["requests"] == 2
+
+    server.app["state"]["delay"] = 1
+    clock.now += 15
+    async with run() as client:
+        client.close_timeout = 0.05
+        assert await client.get_servers() == ["10.58.1.67", "2"]
+    # revalidations overrunning the close timeout are stopped
+    server.app["state"]["delay"] = 0.01
+    async with run() as client:
+        assert await client.get_servers() == ["10.58.1.67", "2"]
@@ -0,0 +1,55 @@
+from src.circuit_breaker import CircuitBreaker
+from tests.utils import FakeClock
+
+
+def test_breaker_opens_after_consecutive_failures():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=5, clock=clock)
+
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    # a success in between resets the count
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.trips == 1
+    assert not breaker.allow()
+
+
+def test_breaker_probes_once_half_open():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=5, clock=clock)
+    breaker.record_failure()
+
+    clock.now = 5
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    # a single probe at a time
+    assert not breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.trips == 1
+
+    clock.now = 10
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.closed
+    assert breaker.allow()
+
+
+def test_breaker_frees_probe_on_cancel():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=5, clock=clock)
+    breaker.record_failure()
+    clock.now = 5
+
+    assert breaker.allow()
+    breaker.record_cancelled()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
@@ -1,6 +1,14 @@
+import asyncio
+
 import pytest
 
-from src.cli import create_parser
+from src.cache import DEFAULT_CACHE_DIR
+from src.cli import (
+    BREAKER_THRESHOLD,
+    create_fetcher,
+    create_parser,
+    run_until_interrupted,
+)
 from tests.utils import captured_output
 
 
@@ -19,7 +27,45 @@ def test_parser_snapshot_with_basic_args():
     assert args.port == 8080
     assert args.ip_version == 4
     assert args.format == "table"
+    assert not args.typed
     assert args.details == "summary"
+    assert args.mode == "complete"
+    assert args.connections == 100
+    assert args.connections_per_host == 0
+    assert args.keepalive == 30.0
+    assert args.max_inflight == 100
+    assert args.rate_limit == 0.0
+    assert args.connect_timeout == 3.0
+    assert args.read_timeout == 5.0
+    assert args.timeout == 10.0
+    assert args.retry_budget == 0.1
+    assert args.latency_target == 1.0
+    assert args.breaker_threshold is None
+    assert args.breaker_reset == 5.0
+    assert not args.cache
+    assert args.cache_dir is None
+    assert args.servers_ttl == 30.0
+    assert args.details_ttl == 5.0
+    assert args.services is None
+    assert args.index is None
+    assert args.index_ttl == 3600.0
+
+
+def test_breaker_is_off_by_default_for_snapshots():
+    parser = create_parser()
+    args = parser.parse_args(["-b", "localhost", "-p", "8080", "snapshot"])
+    assert create_fetcher(args).client.breaker is None
+    breaker = create_fetcher(args, BREAKER_THRESHOLD).client.breaker
+    assert breaker.failure_threshold == BREAKER_THRESHOLD
+
+    args = parser.parse_args(
+        ["-b", "localhost", "-p", "8080", "--breaker-threshold", "3", "snapshot"]
+    )
+    assert create_fetcher(args).client.breaker.failure_threshold == 3
+    args = parser.parse_args(
+        ["-b", "localhost", "-p", "8080", "--breaker-threshold", "0", "watch"]
+    )
+    assert create_fetcher(args, BREAKER_THRESHOLD).client.breaker is None
 
 
 def test_parser_snapshot_with_specific_args():
@@ -32,11 +78,41 @@ def test_parser_snapshot_with_specific_args():
             "8080",
             "-i",
             "6",
+            "--connections",
+            "20",
+            "--connections-per-host",
+            "10",
+            "--timeout",
+            "2.5",
+            "--retry-budget",
+            "0",
+            "--latency-target",
+            "0.5",
+            "--breaker-threshold",
+            "0",
+            "--cache-dir",
+            "--details-ttl",
+            "60",
+            "--keepalive",
+            "5",
+            "--max-inflight",
+            "8",
+            "--rate-limit",
+            "50",
+            "--index",
+            "/tmp/index.tsv",
+            "--index-ttl",
+            "0",
             "snapshot",
             "-d",
             "full",
             "-f",
             "csv",
+            "-m",
+            "simple",
+            "--typed",
+            "--service",
+            "AuthService, GeoService,",
         ]
     )
     assert args.host == "localhost"
@@ -44,6 +120,25 @@ def test_parser_snapshot_with_specific_args():
     assert args.ip_version == 6
     assert args.format == "csv"
     assert args.details == "full"
+    assert args.mode == "simple"
+    assert args.typed
+    assert args.connections == 20
+    assert args.connections_per_host == 10
+    assert args.keepalive == 5.0
+    assert args.max_inflight == 8
+    assert args.rate_limit == 50.0
+    assert args.timeout == 2.5
+    assert args.retry_budget == 0.0
+    assert args.latency_target == 0.5
+    assert args.breaker_threshold == 0
+    assert args.cache_dir == DEFAULT_CACHE_DIR
+    assert args.details_ttl == 60.0
+    assert str(args.index) == "/tmp/index.tsv"
+    assert args.index_ttl == 0.0
+    assert args.services == ["AuthService", "GeoService"]
+
+    with captured_output(), pytest.raises(SystemExit):
+        parser.parse_args(["-b", "localhost", "-p", "8080", "snapshot", "-s", ","])
 
 
 def test_parser_watch_with_basic_args():
@@ -61,6 +156,11 @@ def test_parser_watch_with_basic_args():
     assert args.port == 8080
     assert args.mode == "simple"
     assert args.refresh == 1
+    assert args.servers_refresh == 30.0
+    assert args.overrun_policy == "skip"
+    assert args.history is None
+    assert args.service is None
+    assert args.trend_points == 30
 
 
 def test_parser_watch_with_specific_args():
@@ -78,6 +178,17 @@ def test_parser_watch_with_specific_args():
             "complete",
             "-r",
             "20",
+            "--servers-refresh",
+            "120",
+            "--overrun-policy",
+            "partial",
+            "--history",
+            "--retention",
+            "2h",
+            "--service",
+            "AuthService",
+            "--trend-points",
+            "60",
         ]
     )
     assert args.host == "localhost"
@@ -85,6 +196,12 @@ def test_parser_watch_with_specific_args():
     assert args.ip_version == 6
     assert args.mode == "complete"
     assert args.refresh == 20
+    assert args.servers_refresh == 120.0
+    assert args.overrun_policy == "partial"
+    assert args.history is True
+    assert args.retention == 7200.0
+    assert args.service == "AuthService"
+    assert args.trend_points == 60
 
 
 def test_parser_watch_enforces_refresh_range():
@@ -105,3 +222,101 @@ def test_parser_watch_enforces_refresh_range():
                 ]
             )
         assert "refresh must be between 1 and 60 inclusive, found 90" in err.getvalue()
+
+
+def test_parser_enforces_positive_max_inflight():
+    with captured_output() as (_, err):
+        with pytest.raises(SystemExit):
+            parser = create_parser()
+            parser.parse_args(
+                ["-b", "localhost", "-p", "8080", "--max-inflight", "0", "snapshot"]
+            )
+        assert "value must be a positive integer, found 0" in err.getvalue()
+
+
+def test_parser_rejects_non_positive_timeout():
+    parser = create_parser()
+    with captured_output(), pytest.raises(SystemExit):
+        parser.parse_args(["-b", "localhost", "-p", "8080", "--timeout", "0"])
+
+
+def test_parser_history():
+    parser = create_parser()
+    args = parser.parse_args(
+        ["-b", "localhost", "-p", "8080", "history", "--service", "AuthService"]
+    )
+    assert args.service == "AuthService"
+    assert args.server is None
+    assert args.since == 3600.0
+    assert args.format == "table"
+    assert args.step is None
+    assert args.mode == "complete"
+
+    args = parser.parse_args(
+        ["-b", "localhost", "-p", "8080", "history", "--server", "10.0.0.1"]
+        + ["--since", "90s", "-f", "csv", "--dir", "/tmp/history"]
+    )
+    assert args.server == "10.0.0.1"
+    assert args.since == 90.0
+    assert str(args.history_dir) == "/tmp/history"
+
+    args = parser.parse_args(
+        ["-b", "localhost", "-p", "8080", "history", "--service", "a"]
+        + ["--since", "1d", "--step", "1h", "-m", "simple"]
+    )
+    assert (args.since, args.step, args.mode) == (86400.0, 3600.0, "simple")
+
+    with captured_output(), pytest.raises(SystemExit):
+        parser.parse_args(["-b", "localhost", "-p", "8080", "history"])
+    with captured_output(), pytest.raises(SystemExit):
+        parser.parse_args(
+            ["-b", "localhost", "-p", "8080", "history", "--service", "a"]
+            + ["--since", "soon"]
+        )
+
+
+def test_parser_serve():
+    parser = create_parser()
+    args = parser.parse_args(["-b", "localhost", "-p", "8080", "serve"])
+    assert args.listen == ("0.0.0.0", 9100)
+    assert args.refresh == 15.0
+    assert args.server_metrics
+
+    args = parser.parse_args(
+        ["-b", "localhost", "-p", "8080", "serve", "--listen", "127.0.0.1:9200"]
+        + ["-r", "5", "--no-server-metrics"]
+    )
+    assert args.listen == ("127.0.0.1", 9200)
+    assert args.refresh == 5.0
+    assert not args.server_metrics
+    assert parser.parse_args(
+        ["-b", "localhost", "-p", "8080", "serve", "-l", "[::1]:9100"]
+    ).listen == ("::1", 9100)
+
+    for listen in ("9100", ":http", ":0", "localhost:70000"):
+        with captured_output(), pytest.raises(SystemExit):
+            parser.parse_args(
+                ["-b", "localhost", "-p", "8080", "serve", "--listen", listen]
+            )
+
+
+@pytest.mark.parametrize("inside", [True, False])
+def test_run_until_interrupted_completes_cleanup(inside):
+    steps = []
+
+    def interrupt():
+        raise KeyboardInterrupt
+
+    async def main():
+        try:
+            if inside:
+                await asyncio.sleep(0)
+                interrupt()
+            asyncio.get_running_loop().call_soon(interrupt)
+            await asyncio.sleep(10)
+        finally:
+            await asyncio.sleep(0)
+            steps.append("cleaned up")
+
+    run_until_interrupted(main())
+    assert steps == ["cleaned up"]
@@ -0,0 +1,40 @@
+import random
+
+import pytest
+
+from src.results_compiler import ResultsCompiler
+from src.server_data import ServerData
+from tests.utils import servers
+
+pytest.importorskip("numpy")
+
+from src.columnar import FleetColumns
+
+
+def test_columnar_summary_matches_exact(servers):
+    rng = random.Random(3)
+    fleet = servers + [
+        ServerData(
+            f"10.1.0.{idx}",
+            {
+                "cpu": f"{rng.randint(0, 100)}%",
+                "memory": f"{rng.randint(0, 100)}%",
+                "service": f"service{rng.randint(0, 5)}",
+            },
+        )
+        for idx in range(200)
+    ]
+    fleet.append(ServerData("10.2.0.1", {}))
+    fleet.append(ServerData("10.2.0.2", {"cpu": "1%", "memory": "9%", "service": "a"}))
+
+    columns = FleetColumns.from_servers(fleet)
+    assert len(columns) == len(fleet)
+    for mode in ("simple", "complete"):
+        assert columns.summary(mode) == ResultsCompiler.summary(fleet, mode)
+
+
+def test_columnar_backend_in_results_compiler(servers):
+    summary = ResultsCompiler.summary(servers, "complete", "columnar")
+    assert [line.service for line in summary] == ["something", "somethingElse"]
+    assert summary[0].cpu_p50 == 3.0
+    assert summary[1].ip_memory_max == "10.0.0.5"
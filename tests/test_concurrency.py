@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from src.concurrency import AdaptiveLimiter
+from tests.utils import FakeClock
+
+
+def test_limiter_increases_additively():
+    limiter = AdaptiveLimiter(10, initial_limit=2)
+    limiter.inflight = 2
+    limiter.release(0.1)
+    limiter.release(0.1)
+    # about one more slot per round of requests
+    assert int(limiter.limit) == 2
+    assert limiter.limit == pytest.approx(2.5 + 1 / 2.5)
+
+    for _ in range(100):
+        limiter.inflight += 1
+        limiter.release(0.1)
+    assert limiter.limit == 10
+
+
+def test_limiter_decreases_multiplicatively_once_per_target():
+    clock = FakeClock()
+    limiter = AdaptiveLimiter(16, latency_target=1.0, clock=clock)
+    limiter.inflight = 3
+
+    limiter.release(0.1, failed=True)
+    # failures of the same round only count once
+    limiter.release(2.0)
+    assert limiter.limit == 8
+
+    clock.now = 1.0
+    limiter.release(2.0)
+    assert limiter.limit == 4
+
+    for _ in range(10):
+        clock.now += 1
+        limiter.inflight += 1
+        limiter.release(0, failed=True)
+    assert limiter.limit == 1
+
+
+@pytest.mark.asyncio
+async def test_limiter_bounds_concurrency():
+    limiter = AdaptiveLimiter(2)
+    running = []
+    peak = 0
+
+    async def request():
+        nonlocal peak
+        await limiter.acquire()
+        running.append(1)
+        peak = max(peak, len(running))
+        await asyncio.sleep(0.01)
+        running.pop()
+        limiter.release(0.01)
+
+    await asyncio.gather(*(request() for _ in range(6)))
+    assert peak == 2
+    assert limiter.inflight == 0
+
+
+@pytest.mark.asyncio
+async def test_limiter_cancelled_waiter_passes_slot_on():
+    limiter = AdaptiveLimiter(1)
+    await limiter.acquire()
+    first = asyncio.ensure_future(limiter.acquire())
+    second = asyncio.ensure_future(limiter.acquire())
+    await asyncio.sleep(0)
+
+    first.cancel()
+    limiter.cancel()
+    await asyncio.sleep(0)
+    assert first.cancelled()
+    assert second.done()
+    assert limiter.inflight == 1
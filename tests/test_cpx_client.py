@@ -1,14 +1,27 @@
+import asyncio
+
 import pytest
 from aiohttp import web
 
 from json import dumps
 
-from src.cpx_client import fetch_servers, fetch_details
+from src.cpx_client import (
+    CpxClient,
+    CpxClientBadRequest,
+    CpxClientCircuitOpen,
+    CpxClientServerError,
+    CpxClientTimeout,
+)
 
 
 async def get_servers_list(request):
+    state = request.app["state"]
+    if request.headers.get("If-None-Match") == state["etag"]:
+        return web.Response(status=304, headers={"ETag": state["etag"]})
+    state["sent"] += 1
     return web.Response(
-        body=dumps(["10.58.1.67", "10.58.1.20", "10.58.1.95"]).encode("utf-8")
+        body=dumps(["10.58.1.67", "10.58.1.20", "10.58.1.95"]).encode("utf-8"),
+        headers={"ETag": state["etag"]},
     )
 
 
@@ -20,17 +33,35 @@ async def get_server_details(request):
     )
 
 
+async def get_slow_details(request):
+    await asyncio.sleep(1)
+    return await get_server_details(request)
+
+
+async def get_failing_details(request):
+    return web.Response(status=503)
+
+
+async def get_invalid_details(request):
+    return web.Response(body=b'{"cpu": "many"}')
+
+
 @pytest.fixture
-def cli(loop, aiohttp_client):
+def cpx_server(loop, aiohttp_server):
     app = web.Application()
+    app["state"] = {"etag": '"v1"', "sent": 0}
     app.router.add_get("/servers", get_servers_list)
     app.router.add_get("/10.58.1.67", get_server_details)
-    return loop.run_until_complete(aiohttp_client(app))
+    app.router.add_get("/10.58.1.20", get_invalid_details)
+    app.router.add_get("/10.58.1.95", get_slow_details)
+    app.router.add_get("/10.58.1.96", get_failing_details)
+    return loop.run_until_complete(aiohttp_server(app))
 
 
 @pytest.mark.asyncio
-async def test_fetch_servers(cli):
-    servers = await fetch_servers("servers", cli)
+async def test_fetch_servers(cpx_server):
+    async with CpxClient("127.0.0.1", cpx_server.port) as client:
+        servers = await client.fetch_servers()
     assert len(servers) == 3
     assert "10.58.1.67" in servers
     assert "10.58.1.20" in servers
@@ -38,8 +69,135 @@ async def test_fetch_servers(cli):
 
 
 @pytest.mark.asyncio
-async def test_fetch_details(cli):
-    details = await fetch_details("10.58.1.67", cli)
+async def test_fetch_details(cpx_server):
+    async with CpxClient("127.0.0.1", cpx_server.port) as client:
+        details = await client.fetch_details("10.58.1.67")
     assert details["cpu"] == "33%"
     assert details["memory"] == "14%"
     assert details["service"] == "StorageService"
+
+
+@pytest.mark.asyncio
+async def test_fetch_server(cpx_server):
+    async with CpxClient("127.0.0.1", cpx_server.port) as client:
+        server = await client.fetch_server("10.58.1.67")
+        assert server.ip == "10.58.1.67"
+        assert server.cpu == 33
+        assert server.memory == 14
+        assert server.service == "StorageService"
+
+        with pytest.raises(CpxClientBadRequest):
+            await client.fetch_server("10.58.1.20")
+        with pytest.raises(CpxClientServerError):
+            await client.fetch_server("10.58.1.96")
+
+
+@pytest.mark.asyncio
+async def test_client_reuses_pooled_session(cpx_server):
+    async with CpxClient(
+        "127.0.0.1", cpx_server.port, limit=4, limit_per_host=2
+    ) as client:
+        session = client.session
+        servers = await client.fetch_servers()
+        details = await client.fetch_details("10.58.1.67")
+        assert client.session is session
+        assert session.connector.limit == 4
+        assert session.connector.limit_per_host == 2
+    assert len(servers) == 3
+    assert details["service"] == "StorageService"
+    assert session.closed
+
+
+@pytest.mark.asyncio
+async def test_client_times_out(cpx_server):
+    async with CpxClient("127.0.0.1", cpx_server.port, read_timeout=0.05) as client:
+        with pytest.raises(CpxClientTimeout):
+            await client.fetch_server("10.58.1.95")
+
+
+@pytest.mark.asyncio
+async def test_client_breaker_opens_on_failures(cpx_server):
+    async with CpxClient(
+        "127.0.0.1", cpx_server.port, max_concurrency=4, breaker_threshold=2
+    ) as client:
+        # bad requests do not count as failures of cpx
+        for _ in range(3):
+            with pytest.raises(CpxClientBadRequest):
+                await client.fetch_server("10.58.1.20")
+        assert client.breaker.closed
+
+        for _ in range(2):
+            with pytest.raises(CpxClientServerError):
+                await client.fetch_server("10.58.1.96")
+        assert not client.breaker.closed
+        assert client.limiter.limit < 4
+        assert client.limiter.inflight == 0
+
+        with pytest.raises(CpxClientCircuitOpen):
+            await client.fetch_server("10.58.1.96")
+        with pytest.raises(CpxClientCircuitOpen):
+            await client.get_servers()
+
+
+@pytest.mark.asyncio
+async def test_client_breaker_probe_survives_cancellation(cpx_server):
+    async with CpxClient(
+        "127.0.0.1",
+        cpx_server.port,
+        max_concurrency=1,
+        breaker_threshold=1,
+        breaker_reset=0.01,
+    ) as client:
+        with pytest.raises(CpxClientServerError):
+            await client.fetch_server("10.58.1.96")
+        await asyncio.sleep(0.02)
+        assert client.breaker.state == "half-open"
+
+        # a probe cancelled while waiting for a slot does not hold the breaker
+        await client.limiter.acquire()
+        probe = asyncio.ensure_future(client.fetch_server("10.58.1.67"))
+        await asyncio.sleep(0)
+        probe.cancel()
+        await asyncio.gather(probe, return_exceptions=True)
+        client.limiter.cancel()
+
+        server = await client.fetch_server("10.58.1.67")
+        assert server.service == "StorageService"
+        assert client.breaker.closed
+
+
+@pytest.mark.asyncio
+async def test_client_breaker_can_be_disabled(cpx_server):
+    async with CpxClient("127.0.0.1", cpx_server.port, breaker_threshold=0) as client:
+        assert client.breaker is None
+        assert client.limiter is None
+        for _ in range(6):
+            with pytest.raises(CpxClientServerError):
+                await client.fetch_server("10.58.1.96")
+
+
+@pytest.mark.asyncio
+async def test_client_sends_conditional_requests(cpx_server):
+    state = cpx_server.app["state"]
+    servers = ["10.58.1.67", "10.58.1.20", "10.58.1.95"]
+    async with CpxClient("127.0.0.1", cpx_server.port) as client:
+        assert await client.get_servers() == servers
+        # not modified, the body received before is reused
+        assert await client.get_servers() == servers
+        assert state["sent"] == 1
+        assert client.not_modified == 1
+
+        state["etag"] = '"v2"'
+        assert await client.get_servers() == servers
+        assert state["sent"] == 2
+        assert client.validated[client.get_url("servers")].etag == '"v2"'
+
+        # responses without validators are not remembered
+        await client.fetch_server("10.58.1.67")
+        assert client.get_url("10.58.1.67") not in client.validated
+
+    async with CpxClient("127.0.0.1", cpx_server.port, conditional=False) as client:
+        await client.get_servers()
+        await client.get_servers()
+        assert client.not_modified == 0
+        assert state["sent"] == 4
@@ -0,0 +1,61 @@
+import pytest
+
+from src.decoding import Decoder, InvalidPayload, available_backends
+from src.server_data import MISSING
+
+
+@pytest.fixture(params=available_backends())
+def decoder(request):
+    return Decoder(request.param)
+
+
+def test_default_backend_is_fastest():
+    assert Decoder().backend == available_backends()[0]
+    assert available_backends()[-1] == "json"
+
+
+def test_decode_servers(decoder):
+    assert decoder.servers(b'["10.0.0.1", "10.0.0.2"]') == ["10.0.0.1", "10.0.0.2"]
+    assert decoder.servers(b"[]") == []
+
+
+@pytest.mark.parametrize("body", [b"", b"[1, 2]", b'{"ip": "10.0.0.1"}', b"[nope"])
+def test_decode_invalid_servers(decoder, body):
+    with pytest.raises(InvalidPayload):
+        decoder.servers(body)
+
+
+def test_decode_server(decoder):
+    body = b'{"cpu": "33%", "memory": "14%", "service": "StorageService"}'
+    server = decoder.server("10.0.0.1", body)
+    assert (server.ip, server.cpu, server.memory, server.service) == (
+        "10.0.0.1",
+        33,
+        14,
+        "StorageService",
+    )
+    assert decoder.details(body) == {
+        "cpu": "33%",
+        "memory": "14%",
+        "service": "StorageService",
+    }
+
+
+def test_decode_server_with_missing_values(decoder):
+    server = decoder.server("10.0.0.1", b'{"cpu": 7, "memory": null}')
+    assert (server.cpu, server.memory, server.service) == (7, MISSING, "unknown")
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        b"[]",
+        b'{"cpu": "lots"}',
+        b'{"cpu": 1.5}',
+        b'{"cpu": "1%", "service": 3}',
+        b'{"cpu": "1%"',
+    ],
+)
+def test_decode_invalid_server(decoder, body):
+    with pytest.raises(InvalidPayload):
+        decoder.server("10.0.0.1", body)
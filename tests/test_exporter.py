@@ -0,0 +1,102 @@
+import gzip
+
+import pytest
+
+from unittest.mock import AsyncMock, patch
+
+from src.exporter import Exporter, escape_label, render_metrics
+from src.fetcher import Fetcher
+from src.results_compiler import ResultsCompiler
+from src.scheduler import Ticker
+from src.server_data import MISSING, ServerData
+from src.watcher import Watcher
+from tests.utils import servers
+
+
+DETAILS = {
+    "10.0.0.1": {"cpu": "10%", "memory": "20%", "service": "a"},
+    "10.0.0.2": {"cpu": "30%", "memory": "40%", "service": "a"},
+    "10.0.0.3": {"cpu": "50%", "memory": "60%", "service": 'b"'},
+}
+
+
+@pytest.fixture
+def cpx_client_mock():
+    cpx_client = AsyncMock()
+    cpx_client.fetch_server = AsyncMock(
+        side_effect=lambda ip: ServerData(ip, DETAILS[ip])
+    )
+    cpx_client.get_servers = AsyncMock(return_value=list(DETAILS))
+    cpx_client.breaker = None
+    return cpx_client
+
+
+def test_escape_label():
+    assert escape_label('a\\b"c\nd') == 'a\\\\b\\"c\\nd'
+
+
+def test_render_metrics(servers):
+    summaries = ResultsCompiler.summary(servers, "complete")
+    missing = ServerData.from_values("10.0.0.9", MISSING, MISSING, None)
+    text = render_metrics(
+        summaries, servers + [missing], {"up": ("Whether CPX is up.", 1)}
+    )
+    lines = text.splitlines()
+
+    assert lines[:3] == [
+        "# HELP cpx_up Whether CPX is up.",
+        "# TYPE cpx_up gauge",
+        "cpx_up 1",
+    ]
+    assert 'cpx_service_servers{service="something"} 5' in lines
+    assert 'cpx_service_healthy{service="something"} 1' in lines
+    assert 'cpx_service_cpu_percent{service="something",quantile="0"} 1.0' in lines
+    assert 'cpx_service_cpu_percent{service="something",quantile="0.5"} 3.0' in lines
+    assert (
+        'cpx_server_memory_percent{ip="192.168.1.101",service="something"} 11' in lines
+    )
+    # servers without samples have no gauges
+    assert "10.0.0.9" not in text
+
+
+@pytest.mark.asyncio
+@patch("src.fetcher.CpxClient")
+async def test_exporter_serves_latest_poll(client, cpx_client_mock, aiohttp_client):
+    client.return_value = cpx_client_mock
+    watcher = Watcher(Fetcher("10.0.0.1", 8080, 4), "complete")
+    exporter = Exporter(watcher, Ticker(3600))
+    assert b"cpx_up 0" in exporter.body
+
+    await exporter.poll()
+    http = await aiohttp_client(exporter.create_app())
+
+    response = await http.get("/metrics", headers={"Accept-Encoding": "identity"})
+    assert response.status == 200
+    assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    text = await response.text()
+    assert "cpx_up 1" in text
+    assert "cpx_servers_polled 3" in text
+    assert 'cpx_service_healthy{service="b\\""} 0' in text
+    assert 'cpx_server_cpu_percent{ip="10.0.0.2",service="a"} 30' in text
+
+    response = await http.get(
+        "/metrics",
+        headers={"Accept": "application/openmetrics-text", "Accept-Encoding": "gzip"},
+    )
+    assert response.headers["Content-Type"].startswith("application/openmetrics-text")
+    body = await response.read()
+    assert body.endswith(b"# EOF\n")
+    # rendered once per poll, however many scrapes
+    assert exporter.variant(True, True) is exporter.variant(True, True)
+    assert gzip.decompress(exporter.variant(True, True)).endswith(b"# EOF\n")
+
+
+def test_exporter_without_server_metrics(servers):
+    watcher = Watcher(Fetcher("10.0.0.1", 8080, 4), "complete")
+    for server in servers:
+        watcher.aggregator.add(server)
+    watcher.update_summaries()
+    exporter = Exporter(watcher, Ticker(3600), server_metrics=False)
+
+    assert b"cpx_service_servers" in exporter.body
+    assert b"192.168.1.101" not in exporter.body
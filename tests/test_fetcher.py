@@ -1,22 +1,35 @@
+import asyncio
+from json import dumps
+
 import pytest
+from aiohttp import web
 
 from unittest.mock import AsyncMock, patch
-from src.cpx_client import CpxClientCannotConnect
+from src.cpx_client import (
+    CpxClientBadRequest,
+    CpxClientCannotConnect,
+    CpxClientServerError,
+)
 
 from src.fetcher import Fetcher
+from src.retry import RetryBudget
 from src.server_data import ServerData
+from src.service_index import ServiceIndex
 from tests.utils import captured_output, servers
 
 
 @pytest.fixture
 def cpx_client_mock():
     cpx_client = AsyncMock()
-    cpx_client.fetch_details = AsyncMock(
-        return_value={
-            "cpu": "7%",
-            "memory": "10%",
-            "service": "some",
-        }
+    cpx_client.fetch_server = AsyncMock(
+        side_effect=lambda ip: ServerData(
+            ip,
+            {
+                "cpu": "7%",
+                "memory": "10%",
+                "service": "some",
+            },
+        )
     )
     cpx_client.fetch_servers = AsyncMock(return_value=["192.168.1.100"])
     return cpx_client
@@ -27,17 +40,20 @@ def cpx_client_fail_once_mock():
     cpx_client = AsyncMock()
     cpx_client.failed = 0
 
-    def fetch_details(_):
+    def fetch_server(ip):
         if cpx_client.failed == 0:
             cpx_client.failed = 1
             raise CpxClientCannotConnect()
-        return {
-            "cpu": "7%",
-            "memory": "10%",
-            "service": "some",
-        }
-
-    cpx_client.fetch_details = AsyncMock(side_effect=fetch_details)
+        return ServerData(
+            ip,
+            {
+                "cpu": "7%",
+                "memory": "10%",
+                "service": "some",
+            },
+        )
+
+    cpx_client.fetch_server = AsyncMock(side_effect=fetch_server)
     cpx_client.fetch_servers = AsyncMock(return_value=["192.168.1.100"])
     return cpx_client
 
@@ -46,10 +62,10 @@ def cpx_client_fail_once_mock():
 def cpx_client_fail_always():
     cpx_client = AsyncMock()
 
-    def fetch_details(_):
+    def fetch_server(_):
         raise CpxClientCannotConnect()
 
-    cpx_client.fetch_details = AsyncMock(side_effect=fetch_details)
+    cpx_client.fetch_server = AsyncMock(side_effect=fetch_server)
     cpx_client.fetch_servers = AsyncMock(return_value=["192.168.1.100"])
     return cpx_client
 
@@ -79,6 +95,41 @@ async def test_fetch_details_retry(asyncio_mock, cpx_client_fail_once_mock):
     assert response.service == "some"
 
 
+@pytest.mark.asyncio
+@patch("src.fetcher.asyncio")
+async def test_fetch_details_policies(asyncio_mock):
+    asyncio_mock.sleep = AsyncMock()
+    cpx_client = AsyncMock()
+
+    cpx_client.fetch_server = AsyncMock(side_effect=CpxClientServerError())
+    response = await Fetcher.fetch_details(cpx_client, "192.168.1.100")
+    assert response.service == "unknown"
+    # the default policy retries server errors twice
+    assert cpx_client.fetch_server.await_count == 3
+    assert asyncio_mock.sleep.await_count == 2
+
+    cpx_client.fetch_server = AsyncMock(side_effect=CpxClientBadRequest())
+    response = await Fetcher.fetch_details(cpx_client, "192.168.1.100")
+    assert response.service == "unknown"
+    assert cpx_client.fetch_server.await_count == 1
+
+
+@pytest.mark.asyncio
+@patch("src.fetcher.asyncio")
+async def test_fetch_details_retry_budget(asyncio_mock, cpx_client_fail_always):
+    asyncio_mock.sleep = AsyncMock()
+    budget = RetryBudget(ratio=0, min_retries=2)
+
+    for ip in ("192.168.1.100", "192.168.1.101"):
+        response = await Fetcher.fetch_details(cpx_client_fail_always, ip, budget)
+        assert response.cpu == -1
+
+    # the budget allowed two retries over both servers
+    assert budget.requests == 2
+    assert budget.retries == 2
+    assert cpx_client_fail_always.fetch_server.await_count == 4
+
+
 @pytest.mark.asyncio
 @patch("src.fetcher.CpxClient")
 async def test_fetch_all(client, cpx_client_mock):
@@ -122,12 +173,33 @@ async def test_fetch_all_empty(client, cpx_client_empty_mock):
     assert len(servers) == 0
 
 
+def iter_servers_mock(servers):
+    async def iter_details(_):
+        for server in servers:
+            yield server
+
+    return iter_details
+
+
+@pytest.mark.asyncio
+@patch("src.fetcher.CpxClient")
+async def test_iter_details(client, cpx_client_mock):
+    client.return_value = cpx_client_mock
+
+    fetcher = Fetcher("192.168.1.100", 8080, 4)
+    servers = [server async for server in fetcher.iter_details()]
+
+    assert len(servers) == 1
+    assert servers[0].cpu == 7
+    assert servers[0].service == "some"
+
+
 @pytest.mark.asyncio
-@patch.object(Fetcher, "fetch_all")
-async def test_display_summary(fetcher_fetch_all_mock, servers):
-    fetcher_fetch_all_mock.return_value = servers
+async def test_display_summary(servers):
     fetcher = Fetcher("10.0.0.1", 8080, 4)
-    with captured_output() as (out, _):
+    with patch.object(
+        Fetcher, "iter_details", iter_servers_mock(servers)
+    ), captured_output() as (out, _):
         await fetcher.display_once("table", "summary")
         output = out.getvalue()
         assert "something" in output
@@ -137,11 +209,11 @@ async def test_display_summary(fetcher_fetch_all_mock, servers):
 
 
 @pytest.mark.asyncio
-@patch.object(Fetcher, "fetch_all")
-async def test_display_full(fetcher_fetch_all_mock, servers):
-    fetcher_fetch_all_mock.return_value = servers
+async def test_display_full(servers):
     fetcher = Fetcher("10.0.0.1", 8080, 4)
-    with captured_output() as (out, _):
+    with patch.object(
+        Fetcher, "iter_details", iter_servers_mock(servers)
+    ), captured_output() as (out, _):
         await fetcher.display_once("table", "full")
         output = out.getvalue()
         assert "something" in output
@@ -156,3 +228,105 @@ async def test_display_full(fetcher_fetch_all_mock, servers):
         assert "192.168.1.103" in output
         assert "192.168.1.104" in output
         assert "192.168.1.105" in output
+
+
+@pytest.mark.asyncio
+async def test_display_full_streamed(servers):
+    fetcher = Fetcher("10.0.0.1", 8080, 4)
+    with patch.object(
+        Fetcher, "iter_details", iter_servers_mock(servers)
+    ), captured_output() as (out, _):
+        await fetcher.display_once("csv", "full", "simple")
+        output = out.getvalue().splitlines()
+        assert output[0] == "ip,service,memory,cpu"
+        assert len(output) == len(servers) + 1
+        assert '"10.0.0.5","somethingElse","15","5"' in output
+
+
+@pytest.mark.asyncio
+@patch("src.fetcher.CpxClient")
+async def test_iter_service_details(client):
+    details = {
+        "10.0.0.1": {"cpu": "1%", "memory": "2%", "service": "a"},
+        "10.0.0.2": {"cpu": "3%", "memory": "4%", "service": "b"},
+        "10.0.0.3": {"cpu": "5%", "memory": "6%", "service": "c"},
+    }
+    cpx_client = AsyncMock()
+    cpx_client.fetch_server = AsyncMock(
+        side_effect=lambda ip: ServerData(ip, details[ip])
+    )
+    cpx_client.fetch_servers = AsyncMock(return_value=list(details))
+    client.return_value = cpx_client
+    fetcher = Fetcher("10.0.0.1", 8080, 4)
+    index = ServiceIndex()
+
+    servers = [s async for s in fetcher.iter_service_details(["a", "c"], index)]
+    # unknown servers are polled, and only the ones of the services reported
+    assert sorted(server.ip for server in servers) == ["10.0.0.1", "10.0.0.3"]
+    assert cpx_client.fetch_server.await_count == 3
+
+    servers = [s async for s in fetcher.iter_service_details(["b"], index)]
+    assert [server.ip for server in servers] == ["10.0.0.2"]
+    assert cpx_client.fetch_server.await_count == 4
+    assert (index.hits, index.misses) == (3, 3)
+
+
+@pytest.mark.asyncio
+async def test_display_services(servers):
+    fetcher = Fetcher("10.0.0.1", 8080, 4)
+
+    async def iter_service_details(_, services, index):
+        for server in servers:
+            if server.service in services:
+                yield server
+
+    with patch.object(
+        Fetcher, "iter_service_details", iter_service_details
+    ), captured_output() as (out, _):
+        await fetcher.display_once("table", "summary", services=["somethingElse"])
+        output = out.getvalue()
+        assert "somethingElse" in output
+        assert "something " not in output
+
+
+@pytest.fixture
+def overloaded_server(loop, aiohttp_server):
+    """Serves 64 servers, stalling requests beyond 16 at once."""
+    app = web.Application()
+    app["state"] = state = {"inflight": 0, "requests": 0}
+    ips = [f"10.0.0.{i}" for i in range(64)]
+
+    async def get_servers(request):
+        return web.Response(body=dumps(ips).encode())
+
+    async def get_details(request):
+        state["requests"] += 1
+        state["inflight"] += 1
+        try:
+            await asyncio.sleep(1 if state["inflight"] > 16 else 0.01)
+            return web.Response(
+                body=dumps({"cpu": "1%", "memory": "2%", "service": "a"}).encode()
+            )
+        finally:
+            state["inflight"] -= 1
+
+    app.router.add_get("/servers", get_servers)
+    app.router.add_get("/{ip}", get_details)
+    return loop.run_until_complete(aiohttp_server(app))
+
+
+@pytest.mark.asyncio
+async def test_fetch_all_under_transient_overload(overloaded_server):
+    async with Fetcher(
+        "127.0.0.1",
+        overloaded_server.port,
+        4,
+        max_inflight=64,
+        read_timeout=0.1,
+        latency_target=0.1,
+    ) as fetcher:
+        servers = await fetcher.fetch_all()
+    # the burst times out for most servers, whose retries all go through
+    assert overloaded_server.app["state"]["requests"] > 100
+    assert len(servers) == 64
+    assert not any(server.missing for server in servers)
@@ -0,0 +1,11 @@
+from src.files import replace_file
+
+
+def test_replace_file(tmp_path):
+    path = tmp_path / "nested" / "file.tsv"
+    replace_file(path, "first\n")
+    replace_file(path, "second\n")
+
+    assert path.read_text() == "second\n"
+    # the temporary file was renamed over the file
+    assert [p.name for p in path.parent.iterdir()] == ["file.tsv"]
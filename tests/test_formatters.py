@@ -0,0 +1,91 @@
+import csv
+import json
+from io import StringIO
+
+from src.formatters import compile_formatter
+from src.result_lines import FullResultLine, SummaryResultLine
+from src.results_compiler import ResultsCompiler
+from src.server_data import ServerData
+from tests.utils import servers
+
+
+def test_compile_formatter_is_cached():
+    first = compile_formatter(SummaryResultLine, "simple", "csv")
+    assert compile_formatter(SummaryResultLine, "simple", "csv") is first
+    assert compile_formatter(SummaryResultLine, "complete", "csv") is not first
+    assert compile_formatter(FullResultLine, "simple", "csv") is not first
+
+
+def test_summary_formatters(servers):
+    line = ResultsCompiler.summary(servers, "complete")[0]
+
+    csv_row = compile_formatter(SummaryResultLine, "complete", "csv")(line)
+    assert csv_row.endswith("\r")
+    fields = next(csv.reader(StringIO(csv_row)))
+    assert fields[:4] == [
+        "something",
+        "Healthy",
+        "5",
+        str(["192.168.1.101"] + [f"192.168.1.10{i}" for i in range(2, 6)]),
+    ]
+
+    json_row = json.loads(
+        compile_formatter(SummaryResultLine, "complete", "json")(line)
+    )
+    assert list(json_row) == line.columns
+    assert json_row["total_servers"] == "5"
+    assert json_row["cpu_p50"] == "3.0"
+
+    table_row = compile_formatter(SummaryResultLine, "complete", "table", 13)(line)
+    assert table_row.startswith("something     Healthy   5           192.168.1.101")
+    assert table_row.endswith("11%     11%    13%    14%    15%     ")
+
+
+def test_full_formatters(servers):
+    line = ResultsCompiler.full(servers, "complete")[0]
+
+    csv_row = compile_formatter(FullResultLine, "complete", "csv")(line)
+    assert csv_row == (
+        '"192.168.1.101","something","11","1","Healthy","5","192.168.1.101",'
+        '"192.168.1.105","192.168.1.101","192.168.1.105","1.0","5.0","11.0","15.0"\r'
+    )
+
+    json_row = json.loads(compile_formatter(FullResultLine, "complete", "json")(line))
+    assert json_row["ip"] == "192.168.1.101"
+    assert json_row["status"] == "Healthy"
+    assert json_row["ip_cpu_max"] == "192.168.1.105"
+
+    table_row = compile_formatter(FullResultLine, "simple", "table", 9)(line)
+    assert table_row == "192.168.1.101   something 11%    1%     "
+
+
+def test_formatters_escape_values():
+    server = ServerData("10.0.0.1", {"cpu": "1%", "memory": "2%", "service": 'a"b,é'})
+    line = ResultsCompiler.full_line(server, "simple")
+
+    csv_row = compile_formatter(FullResultLine, "simple", "csv")(line)
+    assert next(csv.reader(StringIO(csv_row)))[1] == 'a"b,é'
+    json_row = compile_formatter(FullResultLine, "simple", "json")(line)
+    assert json.loads(json_row)["service"] == 'a"b,é'
+
+
+def test_typed_json_formatter(servers):
+    line = ResultsCompiler.summary(servers, "complete")[0]
+
+    row = json.loads(
+        compile_formatter(SummaryResultLine, "complete", "json", typed=True)(line)
+    )
+    assert row == {
+        **{column: getattr(line, column) for column in line.columns},
+        "status": "Healthy",
+    }
+    assert row["total_servers"] == 5
+    assert row["ips"] == line.ips
+    assert row["cpu_p75"] == 4.5
+
+    full_line = ResultsCompiler.full(servers, "complete")[0]
+    row = json.loads(
+        compile_formatter(FullResultLine, "complete", "json", typed=True)(full_line)
+    )
+    assert row["memory"] == 11
+    assert row["cpu_max"] == 5.0
@@ -0,0 +1,176 @@
+import pytest
+
+from src.history import (
+    Sample,
+    SampleRecorder,
+    SampleStore,
+    aggregate_lines,
+    sample_lines,
+)
+from src.server_data import MISSING, ServerData
+
+
+def server(ip, cpu, memory, service="a"):
+    return ServerData.from_values(ip, cpu, memory, service)
+
+
+def test_store_keeps_samples_within_retention(tmp_path):
+    with SampleStore(tmp_path, retention=10) as store:
+        for second in range(15):
+            store.append([server("10.0.0.1", second, 50)], 1000 + second)
+
+        samples = store.samples("10.0.0.1", 0, 1014)
+        # older samples were overwritten by newer ones
+        assert [s.timestamp for s in samples] == list(range(1005, 1015))
+        assert samples[-1] == Sample(1014, 14, 50)
+        assert store.samples("10.0.0.1", 1012, 1013) == [
+            Sample(1012, 12, 50),
+            Sample(1013, 13, 50),
+        ]
+        assert store.samples("10.0.0.9", 0, 1014) == []
+
+
+def test_store_skips_missing_samples(tmp_path):
+    with SampleStore(tmp_path, retention=10) as store:
+        written = store.append(
+            [server("10.0.0.1", 1, 2), server("10.0.0.2", MISSING, MISSING)], 1000
+        )
+        assert written == 1
+        assert "10.0.0.2" not in store.rings
+
+
+def test_store_reopens_with_its_settings(tmp_path):
+    with SampleStore(tmp_path, retention=60, resolution=2) as store:
+        store.append([server("10.0.0.1", 1, 2), server("10.0.0.2", 3, 4, "b")], 1000)
+        store.append([server("10.0.0.2", 5, 6, "c")], 1002)
+
+    with SampleStore(tmp_path) as store:
+        assert (store.retention, store.resolution) == (60, 2)
+        assert store.samples("10.0.0.2", 0, 1002) == [
+            Sample(1000, 3, 4),
+            Sample(1002, 5, 6),
+        ]
+        # the latest service of a server wins
+        assert store.servers_of("c") == ["10.0.0.2"]
+
+    with pytest.raises(ValueError):
+        SampleStore(tmp_path, retention=30).open()
+
+
+def test_store_has_a_single_writer(tmp_path):
+    with SampleStore(tmp_path, retention=10):
+        with pytest.raises(ValueError, match="another process"):
+            SampleStore(tmp_path).open()
+        # readers do not take the lock
+        with SampleStore(tmp_path, reader=True) as reader:
+            assert reader.retention == 10
+    # the lock is released on close, as well as when opening fails
+    with pytest.raises(ValueError):
+        SampleStore(tmp_path, retention=30).open()
+    with SampleStore(tmp_path):
+        pass
+
+
+def test_reader_reads_the_store_as_it_is_written(tmp_path):
+    with pytest.raises(ValueError, match="no history"):
+        SampleStore(tmp_path / "none", reader=True).open()
+    assert not (tmp_path / "none").exists()
+
+    with SampleStore(tmp_path, retention=10) as writer:
+        writer.append([server("10.0.0.1", 1, 2), server("10.0.0.2", 3, 4, "b")], 1000)
+        # a line being appended by the writer
+        with open(tmp_path / "servers.tsv", "a") as index:
+            index.write("10.0.0.3\t")
+        files = sorted(path.name for path in tmp_path.iterdir())
+
+        with SampleStore(tmp_path, reader=True) as reader:
+            assert list(reader.rings) == ["10.0.0.1", "10.0.0.2"]
+            assert reader.samples("10.0.0.2", 0, 1000) == [Sample(1000, 3, 4)]
+            assert reader.servers_of("b") == ["10.0.0.2"]
+        assert sorted(path.name for path in tmp_path.iterdir()) == files
+
+    # the next writer drops the incomplete line
+    with SampleStore(tmp_path) as writer:
+        writer.append([server("10.0.0.3", 5, 6)], 1001)
+    with SampleStore(tmp_path, reader=True) as reader:
+        assert list(reader.rings) == ["10.0.0.1", "10.0.0.2", "10.0.0.3"]
+        assert reader.samples("10.0.0.3", 0, 1001) == [Sample(1001, 5, 6)]
+
+
+def test_store_grows_with_servers(tmp_path):
+    servers = [server(f"10.0.{i // 250}.{i % 250}", 1, 1) for i in range(1500)]
+    with SampleStore(tmp_path, retention=10) as store:
+        store.append(servers, 1000)
+        assert store.ring_file.capacity == 2048
+        assert [tier.ring_file.capacity for tier in store.tiers] == [16, 16]
+
+
+def test_store_grows_with_services(tmp_path):
+    servers = [server(f"10.0.0.{i}", i, i, f"service-{i}") for i in range(20)]
+    with SampleStore(tmp_path, retention=10) as store:
+        store.append(servers, 1000)
+        for tier in store.tiers:
+            assert tier.ring_file.capacity == 32
+            assert (tmp_path / f"rollup-{tier.name}.ring").stat().st_size == (
+                32 * tier.ring_file.ring_size
+            )
+
+    with SampleStore(tmp_path) as store:
+        assert [store.samples(s.ip, 0, 1000)[0].cpu for s in servers] == list(range(20))
+
+
+def test_sample_lines(tmp_path):
+    with SampleStore(tmp_path, retention=10) as store:
+        store.append([server("10.0.0.2", 1, 2), server("10.0.0.1", 3, 4)], 0)
+        store.append([server("10.0.0.1", 5, 6)], 1)
+        lines = sample_lines(store, ["10.0.0.1", "10.0.0.2"], 0, 1)
+
+    assert [(line.time, line.ip, line.cpu) for line in lines] == [
+        ("1970-01-01T00:00:00Z", "10.0.0.1", 3),
+        ("1970-01-01T00:00:00Z", "10.0.0.2", 1),
+        ("1970-01-01T00:00:01Z", "10.0.0.1", 5),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_recorder_writes_in_background(tmp_path):
+    store = SampleStore(tmp_path, retention=10)
+    store.open()
+    recorder = SampleRecorder(store, max_pending=1)
+
+    recorder.record([server("10.0.0.1", 1, 2)], 1000)
+    # the worker is still busy with the first batch
+    recorder.record([server("10.0.0.1", 3, 4)], 1001)
+    await recorder.close()
+
+    assert (recorder.recorded, recorder.dropped) == (1, 1)
+    with SampleStore(tmp_path) as store:
+        assert store.samples("10.0.0.1", 0, 1001) == [Sample(1000, 1, 2)]
+
+
+def test_service_aggregates_come_from_rollups(tmp_path):
+    with SampleStore(tmp_path, retention=10) as store:
+        for minute in range(3):
+            for second in range(0, 60, 20):
+                store.append(
+                    [server("10.0.0.1", minute, 10), server("10.0.0.2", 50, 20)],
+                    60000 + minute * 60 + second,
+                )
+
+        until = 60000 + 160
+        steps = store.service_aggregates("a", until - 180, until, 60)
+        # samples older than the raw retention are still in the 1m tier
+        assert sorted(steps) == [60000, 60060, 60120]
+        assert steps[60060].count == 6
+        assert steps[60060].stats("cpu")[0] == 1.0
+
+        # steps finer than every tier come from raw samples
+        steps = store.service_aggregates("a", until - 10, until, 5)
+        assert sum(aggregate.count for aggregate in steps.values()) == 2
+
+        steps = store.server_aggregates(["10.0.0.1"], until - 10, until, 10)
+        lines = aggregate_lines(steps, "10.0.0.1", "simple")
+    assert [(line.series, line.samples, line.cpu_max) for line in lines] == [
+        ("10.0.0.1", 1, 2.0)
+    ]
+    assert lines[0].columns[:3] == ["time", "series", "samples"]
@@ -1,9 +1,14 @@
+import json
+from curses import A_STANDOUT
+from unittest.mock import patch
+
 import pytest
 
 from src.printer import Printer
 from src.results_compiler import ResultsCompiler
+from src.screen import Screen
 from src.server_data import ServerData
-from tests.utils import captured_output, servers
+from tests.utils import FakeWindow, captured_output, servers
 
 
 def test_print_summary(servers):
@@ -115,3 +120,53 @@ def test_print_full(servers):
         assert "192.168.1.103" in output
         assert "192.168.1.104" in output
         assert "192.168.1.105" in output
+
+
+@pytest.mark.asyncio
+async def test_stream_full(servers):
+    async def lines():
+        for server in servers:
+            yield ResultsCompiler.full_line(server, "simple")
+
+    with captured_output() as (out, _):
+        await Printer.stream_full(lines(), "json")
+        output = json.loads(out.getvalue())
+        assert len(output) == len(servers)
+        assert output[0]["ip"] == "192.168.1.101"
+
+    with captured_output() as (out, _):
+        await Printer.stream_full(lines(), "csv")
+        output = out.getvalue().splitlines()
+        assert output[0] == "ip,service,memory,cpu"
+        assert len(output) == len(servers) + 1
+
+
+def test_print_table_summary_with_ages(servers):
+    results = ResultsCompiler.summary(servers, "simple")
+
+    with captured_output() as (out, _):
+        Printer.print_table_summary(
+            results, ages={"something": 3.2, "somethingElse": 12.7}
+        )
+        output = out.getvalue().splitlines()
+        assert output[0].endswith("Age")
+        assert output[2].endswith("3s")
+        assert output[3].endswith("13s")
+
+
+@patch("src.screen.doupdate")
+def test_print_table_full_on_screen(doupdate, servers):
+    results = ResultsCompiler.full(servers[:6], "complete")
+    window = FakeWindow(6, 300)
+
+    Printer.print_table_full(results, Screen(window), "status")
+    assert window.lines[0] == "status"
+    assert window.lines[1].startswith("IP")
+    assert window.lines[3].startswith("192.168.1.101")
+    assert window.lines[5] == "rows 1-2 of 6"
+    assert window.attrs[3] == 0
+
+    # servers of a service hosted on a single server are highlighted
+    results = ResultsCompiler.full(servers[4:6], "complete")
+    Printer.print_table_full(results, Screen(window), "status")
+    assert window.attrs[3:5] == [A_STANDOUT, A_STANDOUT]
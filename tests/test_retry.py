@@ -0,0 +1,42 @@
+from random import Random
+
+from src.cpx_client import (
+    CpxClientBadRequest,
+    CpxClientCannotConnect,
+    CpxClientError,
+    CpxClientServerError,
+    CpxClientTimeout,
+)
+from src.retry import DEFAULT_POLICIES, RetryBudget, RetryPolicy, policy_for
+
+
+def test_policy_for_picks_most_specific_class():
+    assert policy_for(CpxClientTimeout()) is DEFAULT_POLICIES[CpxClientTimeout]
+    assert (
+        policy_for(CpxClientCannotConnect()) is DEFAULT_POLICIES[CpxClientCannotConnect]
+    )
+    assert policy_for(CpxClientServerError()) is DEFAULT_POLICIES[CpxClientServerError]
+    assert policy_for(CpxClientBadRequest()).retries == 0
+    assert policy_for(CpxClientError()).retries == 0
+
+
+def test_policy_delay_is_jittered_and_capped():
+    policy = RetryPolicy(retries=5, base_delay=1.0, max_delay=3.0)
+    random = Random(1)
+    for attempt in range(5):
+        delays = [policy.delay(attempt, random) for _ in range(100)]
+        assert all(0 <= d <= min(3.0, 2**attempt) for d in delays)
+        assert len(set(delays)) == 100
+
+
+def test_retry_budget():
+    budget = RetryBudget(ratio=0.5, min_retries=1)
+    for _ in range(4):
+        budget.request()
+    # one retry always allowed plus half of the requests
+    assert [budget.try_spend() for _ in range(4)] == [True, True, True, False]
+    assert budget.retries == 3
+    budget.request()
+    budget.request()
+    assert budget.try_spend()
+    assert not budget.try_spend()
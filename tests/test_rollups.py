@@ -0,0 +1,63 @@
+import random
+
+import pytest
+
+from src.rollups import Aggregate, RollupTier
+from src.services_statistics import get_quantiles
+
+
+def test_aggregate_stats_match_summaries():
+    rng = random.Random(7)
+    cpus = [rng.randint(0, 100) for _ in range(37)]
+    memories = [rng.randint(0, 100) for _ in range(37)]
+    aggregate = Aggregate()
+    aggregate.add_all(cpus[:20], memories[:20])
+    for cpu, memory in zip(cpus[20:], memories[20:]):
+        aggregate.add(cpu, memory)
+
+    assert aggregate.count == 37
+    stats = aggregate.stats("cpu")
+    assert list(stats[:5]) == pytest.approx(get_quantiles(cpus))
+    assert stats[5] == pytest.approx(sum(cpus) / 37)
+    assert list(aggregate.stats("memory")[:5]) == pytest.approx(get_quantiles(memories))
+
+
+def test_aggregate_with_few_samples():
+    aggregate = Aggregate()
+    assert aggregate.stats("cpu") == (0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+    aggregate.add_all([10, 30], [0, 150])
+    assert aggregate.stats("cpu") == (10.0, 0.0, 0.0, 0.0, 30.0, 20.0)
+    # out of range values are clamped
+    assert aggregate.stats("memory")[4] == 100.0
+
+
+def test_aggregates_merge():
+    first, second = Aggregate(), Aggregate()
+    first.add_all([1, 2], [3, 4])
+    second.add_all([5], [6])
+    first.merge(second.bins)
+    assert first.count == 3
+    assert first.stats("cpu")[4] == 5.0
+
+
+def test_tier_rolls_samples_up(tmp_path):
+    tier = RollupTier(tmp_path, "1m", 60, 10)
+    tier.open(1)
+    try:
+        for second in range(0, 180, 10):
+            tier.add({0: ([second // 10], [50])}, 6000 + second)
+
+        steps = tier.aggregates(0, 6000, 6179, 60)
+        assert sorted(steps) == [6000, 6060, 6120]
+        assert [steps[start].count for start in sorted(steps)] == [6, 6, 6]
+        assert steps[6060].stats("cpu")[0] == 6.0
+
+        steps = tier.aggregates(0, 6000, 6179, 120)
+        assert sorted(steps) == [6000, 6120]
+        assert steps[6000].count == 12
+
+        # buckets older than the tier keeps are overwritten
+        tier.add({0: ([99], [99])}, 6000 + 600)
+        assert 6000 not in tier.aggregates(0, 6000, 6600, 60)
+    finally:
+        tier.close()
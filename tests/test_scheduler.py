@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+from src.scheduler import RateLimiter, Scheduler, Ticker
+
+
+@pytest.mark.asyncio
+async def test_scheduler_map_keeps_order():
+    async def double(value):
+        await asyncio.sleep(0.001 * (5 - value))
+        return value * 2
+
+    results = await Scheduler(max_inflight=2).map(double, [1, 2, 3, 4])
+    assert results == [2, 4, 6, 8]
+
+
+@pytest.mark.asyncio
+async def test_scheduler_bounds_inflight():
+    inflight = 0
+    peak = 0
+
+    async def track(value):
+        nonlocal inflight, peak
+        inflight += 1
+        peak = max(peak, inflight)
+        await asyncio.sleep(0.001)
+        inflight -= 1
+        return value
+
+    results = await Scheduler(max_inflight=3).map(track, list(range(20)))
+    assert results == list(range(20))
+    assert peak == 3
+
+
+@pytest.mark.asyncio
+async def test_scheduler_as_completed_yields_fastest_first():
+    async def wait(value):
+        await asyncio.sleep(value)
+        return value
+
+    results = [
+        r async for r in Scheduler(max_inflight=3).as_completed(wait, [0.03, 0.0, 0.01])
+    ]
+    assert results == [0.0, 0.01, 0.03]
+
+
+@pytest.mark.asyncio
+async def test_scheduler_propagates_errors():
+    async def fail(value):
+        raise ValueError(value)
+
+    with pytest.raises(ValueError):
+        await Scheduler(max_inflight=2).map(fail, [1, 2])
+
+
+@pytest.mark.asyncio
+async def test_scheduler_empty():
+    async def identity(value):
+        return value
+
+    assert await Scheduler().map(identity, []) == []
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_spaces_acquisitions():
+    loop = asyncio.get_running_loop()
+    limiter = RateLimiter(100)
+    start = loop.time()
+    for _ in range(5):
+        await limiter.acquire()
+    assert loop.time() - start >= 0.04
+
+
+@pytest.mark.asyncio
+async def test_ticker_does_not_drift():
+    loop = asyncio.get_running_loop()
+    ticker = Ticker(0.02)
+    starts = []
+
+    async def cycle(deadline):
+        starts.append(loop.time())
+        await asyncio.sleep(0.01)
+
+    await ticker.run(cycle, ticks=4)
+    assert ticker.overruns == 0
+    # ticks stay on the grid instead of accumulating the cycle duration
+    assert starts[-1] - starts[0] == pytest.approx(0.06, abs=0.015)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("policy,skipped", [("skip", 2), ("coalesce", 1)])
+async def test_ticker_overrun_policies(policy, skipped):
+    ticker = Ticker(0.02, policy)
+    durations = [0.05, 0.0]
+
+    async def cycle(deadline):
+        assert deadline is None
+        await asyncio.sleep(durations.pop(0))
+
+    await ticker.run(cycle, ticks=2)
+    assert ticker.overruns == 1
+    assert ticker.skipped == skipped
+
+
+@pytest.mark.asyncio
+async def test_ticker_partial_policy_passes_deadline():
+    loop = asyncio.get_running_loop()
+    ticker = Ticker(0.02, "partial")
+    deadlines = []
+
+    async def cycle(deadline):
+        deadlines.append(deadline - loop.time())
+
+    await ticker.run(cycle, ticks=1)
+    assert 0 < deadlines[0] <= 0.02
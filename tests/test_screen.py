@@ -0,0 +1,85 @@
+from curses import KEY_END, KEY_NPAGE, KEY_RESIZE, KEY_UP
+from unittest.mock import patch
+
+import pytest
+
+from src.screen import Screen
+from tests.utils import FakeWindow
+
+
+@pytest.fixture(autouse=True)
+def doupdate():
+    with patch("src.screen.doupdate") as doupdate:
+        yield doupdate
+
+
+def draw(screen, rows):
+    screen.draw([("status", 0), ("header", 0)], rows, lambda row: (row, 0))
+
+
+def test_screen_draws_only_changed_lines(doupdate):
+    window = FakeWindow(10, 40)
+    screen = Screen(window)
+
+    draw(screen, ["a", "b", "c"])
+    assert window.lines[:5] == ["status", "header", "a", "b", "c"]
+    assert doupdate.call_count == 1
+
+    window.drawn.clear()
+    draw(screen, ["a", "x", "c"])
+    assert window.drawn == [3]
+    assert window.lines[:5] == ["status", "header", "a", "x", "c"]
+
+    # lines no longer in the frame are cleared
+    draw(screen, ["a"])
+    assert window.lines[:5] == ["status", "header", "a", "", ""]
+
+
+def test_screen_formats_only_visible_rows():
+    window = FakeWindow(6, 40)
+    screen = Screen(window)
+    formatted = []
+
+    def format_row(row):
+        formatted.append(row)
+        return str(row), 0
+
+    screen.draw([("header", 0)], range(100), format_row)
+    assert formatted == [0, 1, 2, 3]
+    assert window.lines == ["header", "0", "1", "2", "3", "rows 1-4 of 100"]
+
+
+def test_screen_scrolls():
+    window = FakeWindow(6, 40, keys=[KEY_NPAGE])
+    screen = Screen(window)
+    rows = [str(i) for i in range(10)]
+
+    draw(screen, rows)
+    assert screen.handle_keys()
+    draw(screen, rows)
+    assert window.lines[2:] == ["3", "4", "5", "rows 4-6 of 10"]
+
+    window.keys = [KEY_END, KEY_UP]
+    assert screen.handle_keys()
+    draw(screen, rows)
+    assert window.lines[2:] == ["6", "7", "8", "rows 7-9 of 10"]
+
+    # the offset is kept within the rows when they shrink
+    draw(screen, rows[:4])
+    assert window.lines[2:] == ["1", "2", "3", "rows 2-4 of 4"]
+    assert not screen.handle_keys()
+
+
+def test_screen_clips_and_redraws_on_resize():
+    window = FakeWindow(5, 10, keys=[KEY_RESIZE])
+    screen = Screen(window)
+
+    draw(screen, ["a long line"])
+    assert window.lines[2] == "a long "
+
+    window.width = 20
+    assert screen.handle_keys()
+    window.drawn.clear()
+    draw(screen, ["a long line"])
+    assert window.drawn == [0, 1, 2]
+    assert window.lines[2] == "a long line"
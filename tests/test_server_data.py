@@ -1,6 +1,6 @@
 import pytest
 
-from src.server_data import ServerData
+from src.server_data import MISSING, ServerData
 
 
 @pytest.mark.parametrize(
@@ -25,3 +25,17 @@ def test_server_data(ip, details, memory, cpu, service):
     assert s.service == service
     assert s.ip == ip
     assert ip in str(s)
+
+
+def test_server_data_parses_once():
+    s = ServerData("127.0.0.1", {"cpu": "8%", "memory": 10, "service": "something"})
+    assert s.cpu == 8
+    assert s.memory == 10
+    assert s.service is ServerData("127.0.0.2", {"service": "something"}).service
+    assert not hasattr(s, "__dict__")
+
+
+def test_server_data_from_values():
+    s = ServerData.from_values("127.0.0.1", 8, MISSING, None)
+    assert s == ServerData("127.0.0.1", {"cpu": "8%"})
+    assert s.details == {"cpu": "8%", "memory": None, "service": "unknown"}
@@ -0,0 +1,61 @@
+from src.server_data import MISSING, ServerData
+from src.service_index import ServiceIndex
+from tests.utils import FakeClock
+
+
+def server(ip, service):
+    return ServerData.from_values(ip, 1, 2, service)
+
+
+def test_index_selects_servers_of_services():
+    index = ServiceIndex()
+    index.record(server("10.0.0.1", "a"))
+    index.record(server("10.0.0.2", "b"))
+    index.record(ServerData.from_values("10.0.0.3", MISSING, MISSING, None))
+
+    ips = ["10.0.0.3", "10.0.0.2", "10.0.0.1"]
+    # servers of unknown services are selected too
+    assert index.select(["a"], ips) == ["10.0.0.3", "10.0.0.1"]
+    assert index.select(["a", "b"], ips) == ips
+    assert (index.hits, index.misses) == (4, 2)
+
+
+def test_index_verifies_old_entries():
+    clock = FakeClock(1000.0)
+    index = ServiceIndex(ttl=60, clock=clock)
+    index.record(server("10.0.0.1", "a"))
+    index.record(server("10.0.0.2", "b"))
+
+    clock.now += 30
+    index.record(server("10.0.0.2", "b"))
+    clock.now += 31
+    assert index.select(["b"], ["10.0.0.1", "10.0.0.2"]) == ["10.0.0.1", "10.0.0.2"]
+    clock.now += 30
+    assert index.select(["a"], ["10.0.0.1", "10.0.0.2"]) == ["10.0.0.1", "10.0.0.2"]
+
+
+def test_index_forgets_departed_servers():
+    index = ServiceIndex()
+    index.record(server("10.0.0.1", "a"))
+    index.record(server("10.0.0.2", "b"))
+    index.retain(["10.0.0.2", "10.0.0.3"])
+
+    assert len(index) == 1
+    assert index.service("10.0.0.1") is None
+    assert index.service("10.0.0.2") == "b"
+
+
+def test_index_persists(tmp_path):
+    path = tmp_path / "index" / "localhost_8080.tsv"
+    index = ServiceIndex(path)
+    index.record(server("10.0.0.1", "a"))
+    index.save()
+
+    index = ServiceIndex(path)
+    index.load()
+    assert index.service("10.0.0.1") == "a"
+
+    path.write_text("garbage\n")
+    index = ServiceIndex(path)
+    index.load()
+    assert len(index) == 0
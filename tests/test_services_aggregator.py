@@ -0,0 +1,89 @@
+import random
+
+import pytest
+
+from src.server_data import ServerData
+from src.services_aggregator import ServicesAggregator, ValueDistribution
+from src.services_statistics import get_quantiles
+
+
+def server(ip, cpu, memory, service="something"):
+    return ServerData(
+        ip, {"cpu": f"{cpu}%", "memory": f"{memory}%", "service": service}
+    )
+
+
+@pytest.mark.parametrize(
+    "numbers",
+    [[], [1, 2], [1, 2, 3, 4, 5], [7, 7, 7, 7], [0, 100, 50, 50, 3, 99, 12, 12]],
+)
+def test_value_distribution_quantiles(numbers):
+    distribution = ValueDistribution()
+    for idx, number in enumerate(numbers):
+        distribution.add(number, str(idx))
+    assert distribution.quantiles() == pytest.approx(get_quantiles(numbers))
+
+
+def test_value_distribution_random_changes():
+    rng = random.Random(42)
+    distribution = ValueDistribution()
+    values = {}
+    for step in range(500):
+        ip = str(rng.randint(0, 40))
+        if ip in values:
+            distribution.remove(values.pop(ip), ip)
+        else:
+            values[ip] = rng.randint(0, 100)
+            distribution.add(values[ip], ip)
+        expected = get_quantiles(list(values.values()))
+        assert distribution.quantiles() == pytest.approx(expected)
+
+
+def test_value_distribution_argmin_argmax():
+    distribution = ValueDistribution()
+    distribution.add(10, "a")
+    distribution.add(90, "b")
+    distribution.add(10, "c")
+    assert distribution.argmin == "c"
+    assert distribution.argmax == "b"
+    distribution.remove(90, "b")
+    assert distribution.argmax == "c"
+
+
+def test_aggregator_add_update_remove():
+    aggregator = ServicesAggregator(
+        [
+            server("10.0.0.1", 1, 11),
+            server("10.0.0.2", 2, 12),
+            server("10.0.0.3", 3, 13, "other"),
+        ]
+    )
+    assert sorted(aggregator.services) == ["other", "something"]
+    assert aggregator["something"].cpu_quantiles == [1.0, 0.0, 0.0, 0.0, 2.0]
+    assert aggregator["something"].cpu.argmax == "10.0.0.2"
+
+    aggregator.clear_changed()
+    assert not aggregator.update(server("10.0.0.1", 1, 11))
+    assert aggregator.changed == set()
+
+    assert aggregator.update(server("10.0.0.1", 50, 11))
+    assert aggregator.changed == {"something"}
+    assert aggregator["something"].cpu.argmax == "10.0.0.1"
+    assert aggregator["something"].cpu_quantiles == [2.0, 0.0, 0.0, 0.0, 50.0]
+
+    aggregator.update(server("10.0.0.3", 3, 13, "something"))
+    assert aggregator.services == ["something"]
+    assert sorted(aggregator["something"].ips) == ["10.0.0.1", "10.0.0.2", "10.0.0.3"]
+
+    removed = aggregator.remove("10.0.0.2")
+    assert removed.ip == "10.0.0.2"
+    assert aggregator.remove("10.0.0.2") is None
+    assert sorted(aggregator["something"].ips) == ["10.0.0.1", "10.0.0.3"]
+
+
+def test_aggregator_unknown_metrics():
+    aggregator = ServicesAggregator([ServerData("10.0.0.1", {})])
+    assert aggregator.services == ["unknown"]
+    assert len(aggregator["unknown"].ips) == 0
+    aggregator.remove("10.0.0.1")
+    assert aggregator.services == []
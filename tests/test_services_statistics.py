@@ -81,3 +81,24 @@ def test_services_statistics():
     assert compare_dicts(dict(ss.ip_memory_max), expected_ip_memory_max)
     assert compare_dicts(dict(ss.memory_quantiles), expected_memory_quantiles)
     assert compare_dicts(dict(ss.cpu_quantiles), expected_cpu_quantiles)
+
+
+def test_services_statistics_incremental():
+    servers = [
+        ServerData("10.0.0.1", {"cpu": "1%", "memory": "11%", "service": "a"}),
+        ServerData("10.0.0.2", {"cpu": "2%", "memory": "12%", "service": "b"}),
+        ServerData("10.0.0.3", {"cpu": "3%", "memory": "13%", "service": "a"}),
+        ServerData("10.0.0.4", {"cpu": "4%", "memory": "14%", "service": "a"}),
+        ServerData("10.0.0.5", {"cpu": "5%", "memory": "15%", "service": "a"}),
+    ]
+    batch = SerivesStatistics(servers)
+    incremental = SerivesStatistics()
+    for server in servers:
+        incremental.add(server)
+    incremental.compile()
+
+    assert incremental.services == batch.services
+    assert incremental.ips == batch.ips
+    assert incremental.ip_cpu_max == batch.ip_cpu_max
+    assert incremental.cpu_quantiles == batch.cpu_quantiles
+    assert incremental.memory_quantiles == batch.memory_quantiles
@@ -0,0 +1,22 @@
+from src.server_data import ServerData
+from src.trends import Trends, sparkline
+
+
+def test_sparkline():
+    assert sparkline([]) == ""
+    assert sparkline([0, 14, 15, 50, 100]) == "▁▁▂▄█"
+    # out of range values are clamped
+    assert sparkline([-1, 120]) == "▁█"
+
+
+def test_trends_are_bounded():
+    trends = Trends(points=3)
+    for cpu in range(0, 100, 20):
+        trends.add(ServerData.from_values("10.0.0.1", cpu, 100 - cpu, "a"))
+
+    assert list(trends.buffers["10.0.0.1"][0]) == [40, 60, 80]
+    assert trends.sparklines("10.0.0.1") == ("▃▅▆", "▅▃▂")
+    assert trends.sparklines("10.0.0.2") == ("", "")
+
+    trends.remove("10.0.0.1")
+    assert len(trends) == 0
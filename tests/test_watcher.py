@@ -0,0 +1,285 @@
+import asyncio
+
+import pytest
+
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from src.cpx_client import (
+    CpxClientBadRequest,
+    CpxClientCannotConnect,
+    CpxClientCircuitOpen,
+)
+from src.fetcher import Fetcher
+from src.server_data import ServerData
+from src.service_index import ServiceIndex
+from src.watcher import Watcher
+
+
+DETAILS = {
+    "10.0.0.1": {"cpu": "10%", "memory": "20%", "service": "a"},
+    "10.0.0.2": {"cpu": "30%", "memory": "40%", "service": "a"},
+    "10.0.0.3": {"cpu": "50%", "memory": "60%", "service": "b"},
+}
+
+
+@pytest.fixture
+def cpx_client_mock():
+    cpx_client = AsyncMock()
+    cpx_client.details = {ip: dict(details) for ip, details in DETAILS.items()}
+    cpx_client.fetch_server = AsyncMock(
+        side_effect=lambda ip: ServerData(ip, cpx_client.details[ip])
+    )
+    cpx_client.get_servers = AsyncMock(return_value=list(DETAILS))
+    cpx_client.breaker = None
+    return cpx_client
+
+
+@pytest.mark.asyncio
+@patch("src.fetcher.CpxClient")
+async def test_watcher_refresh(client, cpx_client_mock):
+    client.return_value = cpx_client_mock
+    watcher = Watcher(Fetcher("10.0.0.1", 8080, 4), "simple", servers_refresh=60)
+
+    lines = await watcher.refresh()
+    assert [line.service for line in lines] == ["a", "b"]
+    assert lines[0].cpu_max == 30
+
+    cpx_client_mock.details["10.0.0.1"]["cpu"] = "90%"
+    summary_b = watcher.summaries["b"]
+    lines = await watcher.refresh()
+    assert lines[0].cpu_max == 90
+    assert lines[0].ip_cpu_max == "10.0.0.1"
+    # service b did not change, so its summary is reused as is
+    assert watcher.summaries["b"] is summary_b
+    # the list of servers is only fetched once per period
+    assert cpx_client_mock.get_servers.await_count == 1
+
+
+@pytest.mark.asyncio
+@patch("src.fetcher.CpxClient")
+async def test_watcher_forgets_departed_servers(client, cpx_client_mock):
+    client.return_value = cpx_client_mock
+    watcher = Watcher(Fetcher("10.0.0.1", 8080, 4), "simple", servers_refresh=0)
+
+    await watcher.refresh()
+    cpx_client_mock.get_servers.return_value = ["10.0.0.1", "10.0.0.2"]
+    lines = await watcher.refresh()
+
+    assert [line.service for line in lines] == ["a"]
+    assert "10.0.0.3" not in watcher.aggregator.servers
+    # the service is forgotten along with its last server
+    assert set(watcher.sampled_at) == {"a"}
+    assert cpx_client_mock.get_servers.await_count == 2
+
+
+@pytest.mark.asyncio
+@patch("src.fetcher.CpxClient")
+async def test_watcher_partial_refresh(client, cpx_client_mock):
+    client.return_value = cpx_client_mock
+    watcher = Watcher(Fetcher("10.0.0.1", 8080, 4), "simple")
+    await watcher.refresh()
+
+    async def slow_server(ip):
+        if ip == "10.0.0.3":
+            await asyncio.sleep(10)
+        return ServerData(ip, {**cpx_client_mock.details[ip], "cpu": "99%"})
+
+    cpx_client_mock.fetch_server.side_effect = slow_server
+    deadline = asyncio.get_running_loop().time() + 0.05
+    lines = await watcher.refresh(deadline)
+
+    assert not watcher.complete
+    # service a got fresh samples, b kept its previous ones
+    assert lines[0].cpu_max == 99
+    assert lines[1].cpu_max == 50
+
+
+@pytest.mark.asyncio
+@patch("src.fetcher.CpxClient")
+async def test_watcher_reports_progress(client, cpx_client_mock):
+    client.return_value = cpx_client_mock
+    watcher = Watcher(Fetcher("10.0.0.1", 8080, 4), "simple", progress_interval=0)
+    progress = []
+
+    def on_progress():
+        progress.append((watcher.refreshed, [line.service for line in watcher.lines]))
+
+    await watcher.refresh(on_progress=on_progress)
+
+    # last known values first, then every sample as it arrives
+    assert [refreshed for refreshed, _ in progress] == [0, 1, 2, 3]
+    assert progress[0][1] == []
+    assert progress[-1][1] == ["a", "b"]
+    assert set(watcher.ages()) == {"a", "b"}
+    assert all(age >= 0 for age in watcher.ages().values())
+
+
+@pytest.mark.asyncio
+@patch("src.fetcher.CpxClient")
+async def test_watcher_full_lines(client, cpx_client_mock):
+    client.return_value = cpx_client_mock
+    watcher = Watcher(Fetcher("10.0.0.1", 8080, 4), "complete", servers_refresh=60)
+
+    await watcher.refresh()
+    lines = watcher.full_lines
+    assert sorted(line.ip for line in lines) == sorted(DETAILS)
+    line = next(line for line in lines if line.ip == "10.0.0.3")
+    assert line.service_summary is watcher.summaries["b"]
+    assert line.status == "Unhealthy"
+
+    # lines are sorted by service, and kept as long as nothing changed
+    assert [line.service for line in lines] == ["a", "a", "b"]
+    assert watcher.full_lines is lines
+    cpx_client_mock.details["10.0.0.1"]["cpu"] = "90%"
+    await watcher.refresh()
+    new_lines = watcher.full_lines
+    assert new_lines is not lines
+    assert [line.cpu for line in new_lines if line.ip == "10.0.0.1"] == [90]
+    # only the lines of the service that changed were rebuilt
+    assert new_lines[2] is line
+
+
+@pytest.mark.asyncio
+@patch("src.fetcher.CpxClient")
+async def test_watcher_keeps_last_good_data(client, cpx_client_mock):
+    client.return_value = cpx_client_mock
+    watcher = Watcher(Fetcher("10.0.0.1", 8080, 4), "simple", servers_refresh=0)
+    await watcher.refresh()
+    assert not watcher.stale
+
+    cpx_client_mock.get_servers.side_effect = CpxClientCannotConnect()
+    cpx_client_mock.fetch_server.side_effect = CpxClientCircuitOpen()
+    lines = await watcher.refresh()
+
+    assert watcher.stale
+    assert watcher.server_ips == list(DETAILS)
+    assert watcher.failed == 3
+    assert [line.cpu_max for line in lines] == [30, 50]
+
+    cpx_client_mock.get_servers.side_effect = None
+    cpx_client_mock.fetch_server.side_effect = lambda ip: ServerData(
+        ip, cpx_client_mock.details[ip]
+    )
+    await watcher.refresh()
+    assert not watcher.stale
+
+
+@pytest.mark.asyncio
+@patch("src.fetcher.CpxClient")
+async def test_watcher_is_not_stale_when_a_server_fails(client, cpx_client_mock):
+    client.return_value = cpx_client_mock
+    watcher = Watcher(Fetcher("10.0.0.1", 8080, 4), "simple")
+    await watcher.refresh()
+
+    def fetch_server(ip):
+        if ip == "10.0.0.3":
+            # not retried
+            raise CpxClientBadRequest("invalid details")
+        return ServerData(ip, cpx_client_mock.details[ip])
+
+    cpx_client_mock.fetch_server.side_effect = fetch_server
+    await watcher.refresh()
+    # a single server failing is not cpx failing
+    assert not watcher.stale
+    assert watcher.failed == 1
+    assert watcher.failed_ips == {"10.0.0.3"}
+
+    cpx_client_mock.breaker = MagicMock(closed=False)
+    assert watcher.stale
+
+
+@pytest.mark.asyncio
+@patch("src.fetcher.CpxClient")
+async def test_watcher_diffs_membership(client, cpx_client_mock):
+    client.return_value = cpx_client_mock
+    watcher = Watcher(Fetcher("10.0.0.1", 8080, 4), "simple", servers_refresh=0)
+    await watcher.refresh()
+    # the initial list of servers is not a change of membership
+    assert list(watcher.events) == []
+
+    cpx_client_mock.details["10.0.0.4"] = {"cpu": "5%", "memory": "5%", "service": "b"}
+    cpx_client_mock.get_servers.return_value = ["10.0.0.2", "10.0.0.3", "10.0.0.4"]
+    polled = []
+    fetch_server = cpx_client_mock.fetch_server.side_effect
+
+    def record(ip):
+        polled.append(ip)
+        return fetch_server(ip)
+
+    cpx_client_mock.fetch_server.side_effect = record
+    lines = await watcher.refresh()
+
+    # servers that joined are polled first
+    assert polled[0] == "10.0.0.4"
+    assert "10.0.0.1" not in watcher.aggregator.servers
+    assert [line.total_servers for line in lines] == [1, 2]
+    assert [str(event) for event in watcher.events] == [
+        "-10.0.0.1 (a)",
+        "+10.0.0.4 (b)",
+    ]
+    assert watcher.recent_events(60) == list(watcher.events)
+    assert watcher.joining == set()
+
+
+@pytest.mark.asyncio
+@patch("src.fetcher.CpxClient")
+async def test_watcher_records_samples(client, cpx_client_mock):
+    client.return_value = cpx_client_mock
+    recorder = MagicMock()
+    watcher = Watcher(Fetcher("10.0.0.1", 8080, 4), "simple", recorder=recorder)
+
+    await watcher.refresh()
+    await watcher.refresh()
+
+    assert recorder.record.call_count == 2
+    servers, _ = recorder.record.call_args.args
+    assert sorted(server.ip for server in servers) == sorted(DETAILS)
+
+
+@pytest.mark.asyncio
+@patch("src.fetcher.CpxClient")
+async def test_watcher_polls_one_service(client, cpx_client_mock):
+    client.return_value = cpx_client_mock
+    watcher = Watcher(
+        Fetcher("10.0.0.1", 8080, 4), "simple", service="a", trend_points=2
+    )
+
+    await watcher.refresh()
+    # every server is polled until its service is known
+    assert cpx_client_mock.fetch_server.await_count == 3
+    assert watcher.servers_to_poll() == ["10.0.0.1", "10.0.0.2"]
+    assert list(watcher.summaries) == ["a"]
+
+    for cpu in ("50%", "100%"):
+        cpx_client_mock.details["10.0.0.1"]["cpu"] = cpu
+        await watcher.refresh()
+    assert cpx_client_mock.fetch_server.await_count == 7
+
+    lines = watcher.instance_lines
+    assert [line.ip for line in lines] == ["10.0.0.1", "10.0.0.2"]
+    assert (lines[0].cpu, lines[0].cpu_trend, lines[0].status) == (100, "▄█", "Healthy")
+    assert lines[1].memory_trend == "▃▃"
+
+    # a server moving to another service is dropped
+    cpx_client_mock.details["10.0.0.2"]["service"] = "b"
+    await watcher.refresh()
+    assert watcher.servers_to_poll() == ["10.0.0.1"]
+    assert [line.ip for line in watcher.instance_lines] == ["10.0.0.1"]
+
+
+@pytest.mark.asyncio
+@patch("src.fetcher.CpxClient")
+async def test_watcher_polls_indexed_servers(client, cpx_client_mock):
+    client.return_value = cpx_client_mock
+    index = ServiceIndex()
+    for ip, details in DETAILS.items():
+        index.record(ServerData(ip, details))
+    index.record(ServerData("10.0.0.9", {"cpu": "1%", "service": "a"}))
+    watcher = Watcher(Fetcher("10.0.0.1", 8080, 4), "simple", service="b", index=index)
+
+    await watcher.refresh()
+    # servers of other services are not polled, even on the first refresh
+    assert watcher.poll_ips == ["10.0.0.3"]
+    assert cpx_client_mock.fetch_server.await_count == 1
+    # servers no longer listed are forgotten
+    assert index.service("10.0.0.9") is None
@@ -0,0 +1,87 @@
+import csv
+import json
+from io import StringIO
+
+import pytest
+
+from src.results_compiler import ResultsCompiler
+from src.writers import RowWriter
+from tests.utils import servers
+
+
+def test_row_writer_csv(servers):
+    lines = ResultsCompiler.full(servers, "complete")
+    stream = StringIO()
+    with RowWriter("csv", stream) as writer:
+        writer.write_all(lines)
+
+    output = stream.getvalue()
+    assert output.startswith(lines[0].csv_header_line + "\n")
+    # rows are the same as the ones of csv_line
+    assert output.split("\n")[1:-1] == [line.csv_line for line in lines]
+    rows = list(csv.reader(StringIO(output)))
+    assert len(rows) == len(lines) + 1
+    assert writer.rows == len(lines)
+
+
+@pytest.mark.parametrize("format", ["json", "ndjson"])
+def test_row_writer_json(servers, format):
+    lines = ResultsCompiler.summary(servers, "complete")
+    stream = StringIO()
+    with RowWriter(format, stream) as writer:
+        writer.write_all(lines)
+
+    output = stream.getvalue()
+    if format == "json":
+        rows = json.loads(output)
+        assert output == "[" + ",".join(line.json_line for line in lines) + "]\n"
+    else:
+        rows = [json.loads(row) for row in output.splitlines()]
+    assert [row["service"] for row in rows] == [line.service for line in lines]
+
+
+def test_row_writer_empty():
+    stream = StringIO()
+    with RowWriter("json", stream):
+        pass
+    assert stream.getvalue() == "[]\n"
+
+    stream = StringIO()
+    with RowWriter("csv", stream):
+        pass
+    assert stream.getvalue() == ""
+
+
+def test_row_writer_flushes_in_chunks(servers):
+    lines = ResultsCompiler.full(servers, "simple")
+    stream = StringIO()
+    writer = RowWriter("ndjson", stream, chunk_size=100)
+
+    writer.write(lines[0])
+    assert stream.getvalue() == ""
+    writer.write(lines[1])
+    # the buffer went over the chunk size
+    assert stream.getvalue().count("\n") == 2
+    writer.write(lines[2])
+    writer.close()
+    assert stream.getvalue().count("\n") == 3
+
+
+def test_row_writer_typed(servers):
+    lines = ResultsCompiler.summary(servers, "complete")
+
+    stream = StringIO()
+    with RowWriter("csv", stream, typed=True) as writer:
+        writer.write_all(lines)
+    header, rows = stream.getvalue().split("\n", 1)
+    assert header == lines[0].csv_header_line
+    rows = list(csv.reader(StringIO(rows), quoting=csv.QUOTE_NONNUMERIC))
+    assert rows[0][:3] == ["something", "Healthy", 5.0]
+    assert rows[0][3].split(" ") == lines[0].ips
+
+    stream = StringIO()
+    with RowWriter("ndjson", stream, typed=True) as writer:
+        writer.write_all(lines)
+    row = json.loads(stream.getvalue().splitlines()[0])
+    assert row["ips"] == lines[0].ips
+    assert row["total_servers"] == 5
@@ -17,6 +17,57 @@ def captured_output():
         sys.stdout, sys.stderr = old_out, old_err
 
 
+class FakeClock:
+    def __init__(self, now: float = 0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class FakeWindow:
+    """Records what is drawn, as a curses window of the given size would show it."""
+
+    def __init__(self, height, width, keys=()):
+        self.height = height
+        self.width = width
+        self.keys = list(keys)
+        self.lines = [""] * height
+        self.attrs = [0] * height
+        self.drawn = []
+        self.cursor = 0
+
+    def nodelay(self, flag):
+        pass
+
+    def keypad(self, flag):
+        pass
+
+    def getmaxyx(self):
+        return self.height, self.width
+
+    def getch(self):
+        return self.keys.pop(0) if self.keys else -1
+
+    def clear(self):
+        self.lines = [""] * self.height
+
+    def move(self, y, x):
+        self.cursor = y
+
+    def clrtoeol(self):
+        self.lines[self.cursor] = ""
+
+    def addstr(self, y, x, text, attr=0):
+        assert x + len(text) < self.width
+        self.lines[y] = text
+        self.attrs[y] = attr
+        self.drawn.append(y)
+
+    def noutrefresh(self):
+        pass
+
+
 @pytest.fixture
 def servers():
     return [